@@ -16,6 +16,85 @@ function error_handler_creator (context, callback = undefined) {
   }
 }
 
+// Number of items requested at once from the paginated APIs.
+const PAGE_SIZE = 100
+
+/**
+ * Requests 'url' page by page. 'onPage' is called with each response
+ * in order. The request of the next page is sent after 'onPage' returns,
+ * until 'offset' reaches 'total' of the response.
+ * Each page has the 'version' of the result it is sliced from. If the result
+ * is replaced while reading, the pages are requested again from offset 0.
+ */
+function fetchPages (url, onPage, offset = 0, version = undefined) {
+  const sep = url.indexOf('?') >= 0 ? '&' : '?'
+  return axios.get(url + sep + 'offset=' + offset + '&limit=' + PAGE_SIZE).then(function (response) {
+    if (response.status === 204) return
+    if (offset > 0 && response.data.version !== version) {
+      return fetchPages(url, onPage, 0)
+    }
+    onPage(response)
+    const next = offset + PAGE_SIZE
+    if (next < response.data.total) {
+      return fetchPages(url, onPage, next, response.data.version)
+    }
+  })
+}
+
+// Results which are loaded page by page. The predictions are requested
+// when they are shown, see the action 'loadResultPage'.
+const RESULT_SOURCES = {
+  best: {
+    url: '/api/renom_img/v2/model/load/best/result/',
+    response: 'best_result',
+    attr: 'best_epoch_valid_result',
+    version: 'best_result_version',
+    reload: 'loadBestValidResult'
+  },
+  prediction: {
+    url: '/api/renom_img/v2/model/load/prediction/result/',
+    response: 'result',
+    attr: 'prediction_result',
+    version: 'prediction_result_version',
+    reload: 'loadPredictionResult'
+  }
+}
+
+// Requests of prediction pages which are waiting for the response, by url.
+const pending_pages = {}
+
+/**
+ * Returns a copy of 'result' whose 'prediction' has the ones of 'page'
+ * at 'offset'. If 'result' is null, the copy of 'page' is returned and its
+ * 'prediction' has 'total' items, which are undefined until they are loaded.
+ */
+function storePredictions (result, page, offset, total) {
+  if (!page) return page
+  const merged = Object.assign({}, result || page)
+  const list = (result && result.prediction) ? result.prediction.slice() : new Array(total)
+  const predictions = page.prediction || []
+  for (let i = 0; i < predictions.length; i++) {
+    list[offset + i] = predictions[i]
+  }
+  merged.prediction = list
+  return merged
+}
+
+/**
+ * Appends the lists of 'keys' in 'page' to the ones in 'result'.
+ */
+function concatPage (result, page, keys) {
+  if (!result) return page
+  if (!page) return result
+  const merged = Object.assign({}, result)
+  for (const k of keys) {
+    if (Array.isArray(page[k])) {
+      merged[k] = (result[k] || []).concat(page[k])
+    }
+  }
+  return merged
+}
+
 export default {
   /** ***
    *
@@ -37,34 +116,35 @@ export default {
    */
   async loadModelsOfCurrentTask (context, payload) {
     const task = context.getters.getCurrentTask
-    const url = '/api/renom_img/v2/model/load/task/' + task
+    // Only models updated after the last response are loaded.
+    const since = context.state.models_since[task]
+    let url = '/api/renom_img/v2/model/load/task/' + task
+    if (since) url += '?since=' + encodeURIComponent(since)
     return axios.get(url)
       .then(function (response) {
         if (response.status === 204) return
         const model_list = response.data.model_list
         for (const m of model_list) {
-          const algorithm_id = m.algorithm_id
-          const task_id = m.task_id
-          const state = m.state
           const id = m.id
-          const hyper_params = m.hyper_parameters
-          const dataset_id = m.dataset_id
-          const model = new Model(algorithm_id, task_id, hyper_params, dataset_id)
-
-          model.id = id
-          model.state = state
+          let model = context.getters.getModelById(id)
+          if (!model) {
+            model = new Model(m.algorithm_id, m.task_id, m.hyper_parameters, m.dataset_id)
+            model.id = id
+          }
+          model.state = m.state
           model.total_epoch = m.total_epoch
           model.nth_epoch = m.nth_epoch
           model.total_batch = m.total_batch
           model.nth_batch = m.nth_batch
           model.train_loss_list = m.train_loss_list
           model.valid_loss_list = m.valid_loss_list
-          model.best_epoch_valid_result = m.best_epoch_valid_result
           model.last_batch_loss = m.last_batch_loss
 
           context.commit('addModel', model)
           context.dispatch('loadBestValidResult', id)
         }
+        context.commit('rmModelsNotIn', { task_id: task, model_ids: response.data.model_ids })
+        context.commit('setModelsSince', { task_id: task, since: response.data.since })
       }, error_handler_creator(context))
   },
 
@@ -103,13 +183,16 @@ export default {
   async loadTestDatasetsOfCurrentTask (context) {
     const task_id = context.getters.getCurrentTask
     const url = '/api/renom_img/v2/test_dataset/load/task/' + task_id
-    return axios.get(url)
+    const offset = 0
+    return axios.get(url + '?offset=' + offset + '&limit=' + PAGE_SIZE)
       .then(function (response) {
         if (response.status === 204) return
+        const loaded = {}
+        let total = 0
         for (const ds of response.data.test_dataset_list) {
           const id = ds.id
           const class_map = ds.class_map
-          const test_data = ds.test_data
+          const test_data = ds.data
           const task = ds.task_id
           const name = ds.name
           const ratio = ds.ratio
@@ -118,9 +201,22 @@ export default {
           loaded_dataset.id = id
           loaded_dataset.class_map = class_map
           loaded_dataset.test_data = test_data
+          loaded[id] = loaded_dataset
+          total = Math.max(total, ds.total)
           context.commit('addTestDataset', loaded_dataset)
         }
-      }, error_handler_creator(context))
+        // Following pages have the same datasets with the next items of their data.
+        if (offset + PAGE_SIZE < total) {
+          return fetchPages(url, function (r) {
+            for (const ds of r.data.test_dataset_list) {
+              const dataset = loaded[ds.id]
+              if (dataset) {
+                dataset.test_data = concatPage(dataset.test_data, ds.data, ['img', 'target'])
+              }
+            }
+          }, offset + PAGE_SIZE, total)
+        }
+      }).catch(error_handler_creator(context))
   },
 
   /** ***
@@ -184,7 +280,18 @@ export default {
    */
   async pollingTrain (context, payload) {
     const model_id = payload
-    const url = '/api/renom_img/v2/polling/train/model/' + model_id
+    // Only loss values which the client does not have are requested.
+    const current_model = context.getters.getModelById(model_id)
+    let since = 0
+    if (current_model && current_model.train_loss_list && current_model.valid_loss_list) {
+      since = Math.min(current_model.train_loss_list.length, current_model.valid_loss_list.length)
+    }
+    // The server responds when the thread is updated after the version this client has seen.
+    let version = ''
+    if (current_model && current_model.train_version !== undefined) {
+      version = current_model.train_version
+    }
+    const url = '/api/renom_img/v2/polling/train/model/' + model_id + '?since=' + since + '&version=' + version
     const request_source = { 'train': model_id }
     const current_requests = context.state.polling_request_jobs.train
 
@@ -219,8 +326,12 @@ export default {
         model.total_batch = r.total_batch
         model.nth_batch = r.nth_batch
         model.last_batch_loss = r.last_batch_loss
-        model.train_loss_list = (r.train_loss_list) ? r.train_loss_list : []
-        model.valid_loss_list = (r.valid_loss_list) ? r.valid_loss_list : []
+        if (r.version !== undefined) {
+          model.train_version = r.version
+        }
+        const offset = (r.since) ? r.since : 0
+        model.train_loss_list = (model.train_loss_list || []).slice(0, offset).concat(r.train_loss_list || [])
+        model.valid_loss_list = (model.valid_loss_list || []).slice(0, offset).concat(r.valid_loss_list || [])
 
         if (state === STATE.STOPPED) {
 
@@ -240,19 +351,60 @@ export default {
    */
   async loadBestValidResult (context, payload) {
     const model_id = payload
-    const url = '/api/renom_img/v2/model/load/best/result/' + model_id
+    const source = RESULT_SOURCES.best
+    const url = source.url + model_id + '?offset=0&limit=' + PAGE_SIZE
     return axios.get(url).then(function (response) {
+      if (response.status === 204) return
       const model = context.getters.getModelById(model_id)
       if (model) {
         const r = response.data
-        const best_result = r.best_result
-        model.best_epoch_valid_result = best_result
+        // The metrics and the first page. The other pages are loaded on demand.
+        model.best_epoch_valid_result = storePredictions(null, r.best_result, 0, r.total)
+        model.best_result_version = r.version
         context.commit('forceUpdateModelList')
         context.commit('forceUpdatePredictionPage')
       }
     }, error_handler_creator(context))
   },
 
+  /** ***
+   * Loads the page of the predictions which has 'index' if it is not loaded.
+   * 'kind' is 'best' for the best validation result or 'prediction'.
+   * If the result has been replaced on the server, it is loaded again.
+   */
+  async loadResultPage (context, payload) {
+    const { model_id, kind, index } = payload
+    const source = RESULT_SOURCES[kind]
+    const model = context.getters.getModelById(model_id)
+    if (!model) return
+    const result = model[source.attr]
+    if (!result || !result.prediction) return
+    if (index < 0 || index >= result.prediction.length) return
+    if (result.prediction[index] !== undefined) return
+
+    const offset = Math.floor(index / PAGE_SIZE) * PAGE_SIZE
+    const url = source.url + model_id + '?fields=prediction&offset=' + offset + '&limit=' + PAGE_SIZE
+    if (pending_pages[url]) return pending_pages[url]
+    const version = model[source.version]
+    pending_pages[url] = axios.get(url).then(function (response) {
+      delete pending_pages[url]
+      if (response.status === 204) return
+      const model = context.getters.getModelById(model_id)
+      // The result was replaced while waiting.
+      if (!model || model[source.version] !== version) return
+      const r = response.data
+      if (r.version !== version) {
+        return context.dispatch(source.reload, model_id)
+      }
+      model[source.attr] = storePredictions(model[source.attr], r[source.response], r.offset, r.total)
+      context.commit('forceUpdatePredictionPage')
+    }, function (error) {
+      delete pending_pages[url]
+      error_handler_creator(context)(error)
+    })
+    return pending_pages[url]
+  },
+
   async runPredictionThread (context, payload) {
     const model_id = payload
     const url = '/api/renom_img/v2/model/thread/prediction/run/' + model_id
@@ -268,7 +420,12 @@ export default {
 
   async pollingPrediction (context, payload) {
     const model_id = payload
-    const url = '/api/renom_img/v2/polling/prediction/model/' + model_id
+    const current_model = context.getters.getModelById(model_id)
+    let version = ''
+    if (current_model && current_model.prediction_version !== undefined) {
+      version = current_model.prediction_version
+    }
+    const url = '/api/renom_img/v2/polling/prediction/model/' + model_id + '?version=' + version
     const request_source = { 'prediction': model_id }
     const current_requests = context.state.polling_request_jobs.prediction
 
@@ -300,6 +457,9 @@ export default {
         model.running_state = r.running_state
         model.total_prediction_batch = r.total_batch
         model.nth_prediction_batch = r.nth_batch
+        if (r.version !== undefined) {
+          model.prediction_version = r.version
+        }
 
         if (state === STATE.STOPPED) {
 
@@ -317,16 +477,23 @@ export default {
 
   async loadPredictionResult (context, payload) {
     const model_id = payload
-    const url = '/api/renom_img/v2/model/load/prediction/result/' + model_id
-    return axios.get(url).then(function (response) {
+    const source = RESULT_SOURCES.prediction
+    // The image list is loaded at once for the layout of the pages.
+    // The predictions are loaded on demand.
+    const url = source.url + model_id + '?fields=img,size'
+    let result = null
+    return fetchPages(url, function (response) {
+      const r = response.data
+      if (r.offset === 0) result = null
+      result = concatPage(result, r.result, ['img', 'size'])
+      if (r.offset + PAGE_SIZE < r.total) return
       const model = context.getters.getModelById(model_id)
       if (model) {
-        const r = response.data
-        const result = r.result
-        model.prediction_result = result
+        model.prediction_result = storePredictions(null, result, 0, r.total)
+        model.prediction_result_version = r.version
         context.commit('forceUpdatePredictionPage')
       }
-    }, error_handler_creator(context))
+    }).catch(error_handler_creator(context))
   },
 
   /** ***
@@ -467,6 +634,8 @@ export default {
     param.append('task_id', task_id)
     param.append('description', encodeURIComponent(description))
     param.append('test_dataset_id', test_dataset_id)
+    param.append('offset', 0)
+    param.append('limit', PAGE_SIZE)
 
     return axios.post(url, param).then(function (response) {
       if (response.status === 204) return
@@ -482,7 +651,15 @@ export default {
       dataset.class_info = class_info
       context.commit('setConfirmingDataset', dataset)
       context.commit('setConfirmingFlag', false)
-    }, error_handler_creator(context, () => {
+
+      // The first page is returned with the dataset. Load the rest.
+      if (PAGE_SIZE < response.data.total) {
+        const page_url = '/api/renom_img/v2/dataset/confirm/' + hash + '/valid_data'
+        return fetchPages(page_url, function (r) {
+          dataset.valid_data = concatPage(dataset.valid_data, r.data.valid_data, ['img', 'target', 'size'])
+        }, PAGE_SIZE)
+      }
+    }).catch(error_handler_creator(context, () => {
       context.commit('setConfirmingFlag', false)
     }))
   },
@@ -28,6 +28,10 @@ export default class Model {
 
     this.best_epoch_valid_result = null
     this.prediction_result = null
+    // Versions of the results on the server. Predictions are loaded page
+    // by page, and pages of another version are not mixed.
+    this.best_result_version = null
+    this.prediction_result_version = null
 
     this.model_list = []
   }
@@ -5,6 +5,8 @@ export default {
     state.datasets = []
     state.test_datasets = []
     state.models = []
+    // Models are loaded from the beginning again.
+    state.models_since = {}
   },
   showAlert (state, payload) {
     state.show_alert_modal = true
@@ -94,6 +96,13 @@ export default {
       state.models = [payload, ...state.models]
     }
   },
+  setModelsSince (state, payload) {
+    state.models_since = { ...state.models_since, [payload.task_id]: payload.since }
+  },
+  rmModelsNotIn (state, payload) {
+    // Removes models of the task which are not in payload.model_ids.
+    state.models = state.models.filter(m => m.task_id !== payload.task_id || payload.model_ids.includes(m.id))
+  },
   rmModel (state, payload) {
     if (state.models.find(n => n.id === payload.id) === undefined) {
       state.models = state.models.filter(m => m.id !== payload)
@@ -14,6 +14,7 @@ export default {
 
   // Models
   models: [],
+  models_since: {}, // Task id => "since" of the last model list response.
   selected_model: {},
   deployed_model: {},
 
@@ -29,6 +29,22 @@ export function getTagColor (n) {
 
 export function render_segmentation (item) {
   if (!item.hasOwnProperty('class')) return
+  if (item.class.hasOwnProperty('counts')) {
+    // Decode the run length encoded class map. This function runs in a worker,
+    // so it can not call other functions.
+    const rle = item.class
+    const flat = []
+    for (let k = 0; k < rle.counts.length; k++) {
+      for (let n = 0; n < rle.counts[k]; n++) {
+        flat.push(rle.values[k])
+      }
+    }
+    const map = []
+    for (let r = 0; r < rle.size[0]; r++) {
+      map.push(flat.slice(r * rle.size[1], (r + 1) * rle.size[1]))
+    }
+    item = { class: map }
+  }
   const height = item.class.length
   const width = item.class[0].length
   const d = 1 // Resample drawing pixel.
@@ -8,7 +8,10 @@ import renom as rm
 from tqdm import tqdm
 
 from renom_img.api.utility.misc.download import download
-from renom_img.api.utility.distributor.distributor import ImageDistributor
+from renom_img.api.utility.load import load_img
+from renom_img.api.utility.engine import run_stages
+from renom_img.api.utility.fusion import fuse_batch_normalize
+from renom_img.api.utility.distributor.distributor import ImageDistributor, FeatureDistributor
 
 
 def adddoc(cls):
@@ -40,6 +43,8 @@ class Base(rm.Model):
 
     SERIALIZED = ("imsize", "class_map", "num_class")
     WEIGHT_URL = None
+    # True if the model implements ``forward_frozen`` and ``forward_head``.
+    FEATURE_CACHEABLE = False
 
     def __init__(self, class_map=None, imsize=(224, 224),
                  load_pretrained_weight=False, train_whole_network=False, load_target=None):
@@ -124,7 +129,7 @@ class Base(rm.Model):
 
     def fit(self, train_img_path_list=None, train_annotation_list=None,
             valid_img_path_list=None, valid_annotation_list=None,
-            epoch=136, batch_size=64, augmentation=None, callback_end_epoch=None):
+            epoch=136, batch_size=64, augmentation=None, callback_end_epoch=None, feature_cache=False):
         """
         This function performs training with given data and hyper parameters.
 
@@ -137,6 +142,9 @@ class Base(rm.Model):
             batch_size(int): Number of batch size.
             augmentation(Augmentation): Augmentation object.
             callback_end_epoch(function): Given function will be called at the end of each epoch.
+            feature_cache(bool): If True and the frozen part of the network is not trained,
+                outputs of the frozen part are computed once and only the head is trained.
+                This is ignored when augmentation is given.
 
         Returns:
             (tuple): Training loss list and validation loss list.
@@ -168,16 +176,27 @@ class Base(rm.Model):
             train_img_path_list, train_annotation_list, augmentation=augmentation)
         valid_dist = ImageDistributor(valid_img_path_list, valid_annotation_list)
 
+        feature_dist = None
+        if feature_cache and augmentation is None and self.feature_cacheable:
+            feature_dist = FeatureDistributor(self, train_dist, self.build_data(), batch_size)
+
         batch_loop = int(np.ceil(len(train_dist) / batch_size))
         avg_train_loss_list = []
         avg_valid_loss_list = []
         for e in range(epoch):
             bar = tqdm(range(batch_loop))
             display_loss = 0
-            for i, (train_x, train_y) in enumerate(train_dist.batch(batch_size, target_builder=self.build_data())):
+            if feature_dist is None:
+                train_batch = train_dist.batch(batch_size, target_builder=self.build_data(), epoch=e)
+            else:
+                train_batch = feature_dist.batch(batch_size)
+            for i, (train_x, train_y) in enumerate(train_batch):
                 self.set_models(inference=False)
                 with self.train():
-                    loss = self.loss(self(train_x), train_y)
+                    if feature_dist is None:
+                        loss = self.loss(self(train_x), train_y)
+                    else:
+                        loss = self.loss(self.forward_head(train_x), train_y)
                     reg_loss = loss + self.regularize()
                 reg_loss.grad().update(self.get_optimizer(e, epoch, i, batch_loop, avg_valid_loss_list=avg_valid_loss_list))
                 try:
@@ -194,7 +213,7 @@ class Base(rm.Model):
                 bar.n = 0
                 bar.total = int(np.ceil(len(valid_dist) / batch_size))
                 display_loss = 0
-                for i, (valid_x, valid_y) in enumerate(valid_dist.batch(batch_size, target_builder=self.build_data())):
+                for i, (valid_x, valid_y) in enumerate(valid_dist.cached_batch(batch_size, target_builder=self.build_data())):
                     self.set_models(inference=True)
                     loss = self.loss(self(valid_x), valid_y)
                     try:
@@ -215,16 +234,132 @@ class Base(rm.Model):
                 callback_end_epoch(e, self, avg_train_loss_list, avg_valid_loss_list)
         return avg_train_loss_list, avg_valid_loss_list
 
-    def predict(self, img_list):
+    def predict(self, img_list, batch_size=1, **kwargs):
         """Perform prediction.
         Argument can be an image array, image path list or a image path.
         The form of return value depends on your task(classification, detection or segmentation).
 
         Args:
             img_list(ndarray, list, string): Image array, image path list or image path.
+            batch_size(int): Batch size used when a list of image paths is given.
 
         """
-        pass
+        self.set_models(inference=True)
+        if isinstance(img_list, str):
+            img_array = self.preprocess(load_img(img_list, self.imsize)[None])
+            return self._predict_array(img_array, **kwargs)[0]
+        elif isinstance(img_list, (list, tuple)):
+            results = []
+            bar = tqdm(total=int(np.ceil(len(img_list) / batch_size)), disable=len(img_list) <= batch_size)
+            for result in self.predict_iter(img_list, batch_size, **kwargs):
+                results.extend(result)
+                bar.update(1)
+            bar.close()
+            return results
+        return self._predict_array(img_list, **kwargs)
+
+    def predict_iter(self, img_path_list, batch_size=1, num_worker=3, return_size=False, lock=None, **kwargs):
+        """Performs prediction and yields results batch by batch.
+
+        Images are decoded, resized and preprocessed in worker threads while the
+        forward propagation of the previous batch is running. Results are yielded
+        in the order of the given list. Keyword arguments are passed to the
+        prediction of each task (ex. ``score_threshold`` for detection).
+
+        Args:
+            img_path_list(list): List of image paths.
+            batch_size(int): Batch size.
+            num_worker(int): Number of threads for decoding images.
+            return_size(bool): If True, original image sizes (width, height) of
+                the batch are yielded together with the results.
+            lock(Lock): If given, forward propagation of each batch is performed
+                holding the lock, so that the model can be shared by threads.
+
+        Yields:
+            (list): Prediction results of a batch. If return_size is True,
+            tuple of the results and the list of image sizes.
+
+        Example:
+            >>> for result in model.predict_iter(img_path_list, batch_size=64, num_worker=8):
+            ...     save(result)
+        """
+        imsize = self.imsize
+
+        def builder(img_path_list, annotation_list, **kwargs):
+            loaded = [load_img(path, imsize, return_size=True) for path in img_path_list]
+            img_array = self.preprocess(np.vstack([img[None] for img, _ in loaded]))
+            return img_array, [size for _, size in loaded]
+
+        dist = ImageDistributor(img_path_list, num_worker=num_worker)
+        for img_array, sizes in dist.batch(batch_size, target_builder=builder, shuffle=False):
+            if lock is None:
+                result = list(self._predict_array(img_array, **kwargs))
+            else:
+                with lock:
+                    result = list(self._predict_array(img_array, **kwargs))
+            if return_size:
+                yield result, sizes
+            else:
+                yield result
+
+    def _predict_array(self, img_array, **kwargs):
+        """Returns prediction results of a preprocessed image array.
+        """
+        z = self.forward_inference(img_array)
+        return self._postprocess(z, **kwargs)
+
+    def _postprocess(self, z, **kwargs):
+        """Returns prediction results from the output array of the model.
+        This is implemented by each task.
+        """
+        raise NotImplementedError
+
+    def fuse_for_inference(self):
+        """
+        Folds batch normalization layers into the preceding convolution layers.
+        Each folded batch normalization is replaced with an identity layer, so
+        the model runs faster in inference. The fused model can not be trained.
+
+        Returns:
+            (int): Number of folded layers.
+
+        Example:
+            >>> model = ${class}(class_map)
+            >>> model.load("trained.h5")
+            >>> model.fuse_for_inference()
+            >>> model.save("fused.h5")  # Deployable weight.
+            >>>
+            >>> # Fused weight is loaded into the fused model.
+            >>> deployed = ${class}(class_map)
+            >>> deployed.fuse_for_inference()
+            >>> deployed.load("fused.h5")
+        """
+        self.set_models(inference=True)
+        # Parameters are initialized at the first forward propagation.
+        self(np.zeros((1, 3, self.imsize[1], self.imsize[0]), dtype=np.float32))
+        return fuse_batch_normalize(self)
+
+    def inference_stages(self):
+        """Returns the list of functions which performs forward propagation in order.
+        That is, applying the functions to the input one by one corresponds to ``forward``.
+        The output of each stage except the last one must be a single array.
+        """
+        if self.FEATURE_CACHEABLE:
+            return [self.forward_frozen, self.forward_head]
+        return [self.forward]
+
+    def forward_inference(self, x):
+        """Performs forward propagation in inference mode stage by stage.
+        The stages are given by ``inference_stages``.
+
+        Args:
+            x (ndarray): Preprocessed image array.
+
+        Returns:
+            (ndarray, tuple): Output of the model.
+        """
+        self.set_models(inference=True)
+        return run_stages(self.inference_stages(), x)
 
     def loss(self, x, y):
         """
@@ -243,6 +378,34 @@ class Base(rm.Model):
     def _freeze(self):
         pass
 
+    @property
+    def feature_cacheable(self):
+        """True if outputs of the frozen part can be cached. That is, the model
+        implements ``forward_frozen`` and ``train_whole_network`` is False.
+        """
+        return self.FEATURE_CACHEABLE and not self.train_whole_network
+
+    def forward_frozen(self, x):
+        """
+        Performs forward propagation of the part which is not trained when
+        ``train_whole_network`` is False. The part runs in inference mode, so its
+        output depends only on the input and can be cached.
+
+        Args:
+            x(ndarray, Node): Input to ${class}.
+        """
+        raise NotImplementedError
+
+    def forward_head(self, z):
+        """
+        Performs forward propagation of the trainable part.
+        ``forward_head(forward_frozen(x))`` corresponds to ``forward(x)``.
+
+        Args:
+            z(ndarray, Node): Output of ``forward_frozen``.
+        """
+        raise NotImplementedError
+
     def forward(self, x):
         """
         Performs forward propagation.
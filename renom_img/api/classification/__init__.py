@@ -21,34 +21,17 @@ class Classification(Base):
 
         Args:
             img_list(ndarray, list, string): Image array, image path list or image path.
+            batch_size(int): Batch size used when a list of image paths is given.
 
         Return:
             (list): List of class of each image.
 
         """
-        self.set_models(inference=True)
-        if isinstance(img_list, (list, str)):
-            if isinstance(img_list, (tuple, list)):
-                if len(img_list) > batch_size:
-                    test_dist = ImageDistributor(img_list)
-                    results = []
-                    bar = tqdm(range(int(np.ceil(len(test_dist) / batch_size))))
-                    for i, (x_img_list, _) in enumerate(test_dist.batch(batch_size, shuffle=False)):
-                        img_array = np.vstack([load_img(path, self.imsize)[None]
-                                               for path in x_img_list])
-                        img_array = self.preprocess(img_array)
-                        results.extend(np.argmax(rm.softmax(self(img_array)).as_ndarray(), axis=1))
-                        bar.update(1)
-                    return results
-                img_array = np.vstack([load_img(path, self.imsize)[None] for path in img_list])
-                img_array = self.preprocess(img_array)
-            else:
-                img_array = load_img(img_list, self.imsize)[None]
-                img_array = self.preprocess(img_array)
-                return np.argmax(rm.softmax(self(img_array)).as_ndarray(), axis=1)[0]
-        else:
-            img_array = img_list
-        return np.argmax(rm.softmax(self(img_array)).as_ndarray(), axis=1)
+        return super(Classification, self).predict(img_list, batch_size)
+
+    def _postprocess(self, z):
+        # Softmax does not change the order of scores.
+        return np.argmax(z, axis=1)
 
     def loss(self, x, y):
         """
@@ -38,6 +38,9 @@ def transition_layer(growth_rate):
 
 
 class DenseNetBase(Classification):
+
+    FEATURE_CACHEABLE = True
+
     def __init__(self, class_map):
         super(DenseNetBase, self).__init__(class_map)
         self._opt = rm.Sgd(0.1, 0.9)
@@ -63,6 +66,18 @@ class DenseNetBase(Classification):
     def _freeze(self):
         self._model.base.set_auto_update(self._train_whole_network)
 
+    @property
+    def train_whole_network(self):
+        # Base.__init__ is not called, which sets this.
+        return self._train_whole_network
+
+    def forward_frozen(self, x):
+        self._freeze()
+        return self._model.forward_features(x)
+
+    def forward_head(self, z):
+        return self._model.forward_classifier(z)
+
 
 class CNN_DenseNet(rm.Model):
     """
@@ -94,6 +109,9 @@ class CNN_DenseNet(rm.Model):
         self.fc = rm.Dense(num_class)
 
     def forward(self, x):
+        return self.forward_classifier(self.forward_features(x))
+
+    def forward_features(self, x):
         i = 0
         t = self.base[i](x)
         i += 1
@@ -113,6 +131,9 @@ class CNN_DenseNet(rm.Model):
             t = self.base[i](t)
             i += 1
             t = rm.concat(tmp, t)
+        return t
+
+    def forward_classifier(self, t):
         t = rm.average_pool2d(t, filter=7, stride=1)
         t = rm.flatten(t)
         t = self.fc(t)
@@ -145,19 +145,8 @@ class InceptionV1(Classification):
     def loss(self, x, y):
         return 0.3 * rm.softmax_cross_entropy(x[0], y) + 0.3 * rm.softmax_cross_entropy(x[1], y) + rm.softmax_cross_entropy(x[2], y)
 
-    def predict(self, img_list):
-        self.set_models(inference=True)
-        if isinstance(img_list, (list, str)):
-            if isinstance(img_list, (tuple, list)):
-                img_array = np.vstack([load_img(path, self.imsize)[None] for path in img_list])
-                img_array = self.preprocess(img_array)
-            else:
-                img_array = load_img(img_list, self.imsize)[None]
-                img_array = self.preprocess(img_array)
-                return np.argmax(rm.softmax(self(img_array)[2]).as_ndarray(), axis=1)[0]
-        else:
-            img_array = img_list
-        return np.argmax(rm.softmax(self(img_array)[2]).as_ndarray(), axis=1)
+    def _postprocess(self, z):
+        return np.argmax(z[2], axis=1)
 
     def get_optimizer(self, current_epoch=None, total_epoch=None, current_batch=None, total_batch=None, **kwargs):
         """Returns an instance of Optimiser for training Yolov1 algorithm.
@@ -486,19 +475,8 @@ class InceptionV3(Classification):
     def loss(self, x, y):
         return rm.softmax_cross_entropy(x[0], y) + rm.softmax_cross_entropy(x[1], y)
 
-    def predict(self, img_list):
-        self.set_models(inference=True)
-        if isinstance(img_list, (list, str)):
-            if isinstance(img_list, (tuple, list)):
-                img_array = np.vstack([load_img(path, self.imsize)[None] for path in img_list])
-                img_array = self.preprocess(img_array)
-            else:
-                img_array = load_img(img_list, self.imsize)[None]
-                img_array = self.preprocess(img_array)
-                return np.argmax(rm.softmax(self(img_array)[1]).as_ndarray(), axis=1)[0]
-        else:
-            img_array = img_list
-        return np.argmax(rm.softmax(self(img_array)[1]).as_ndarray(), axis=1)
+    def _postprocess(self, z):
+        return np.argmax(z[1], axis=1)
 
 
 class CNN_InceptionV2(rm.Model):
@@ -613,19 +591,8 @@ class InceptionV2(Classification):
                 self._opt._lr = lr
             return self._opt
 
-    def predict(self, img_list):
-        self.set_models(inference=True)
-        if isinstance(img_list, (list, str)):
-            if isinstance(img_list, (tuple, list)):
-                img_array = np.vstack([load_img(path, self.imsize)[None] for path in img_list])
-                img_array = self.preprocess(img_array)
-            else:
-                img_array = load_img(img_list, self.imsize)[None]
-                img_array = self.preprocess(img_array)
-                return np.argmax(rm.softmax(self(img_array)[1]).as_ndarray(), axis=1)[0]
-        else:
-            img_array = img_list
-        return np.argmax(rm.softmax(self(img_array)[1]).as_ndarray(), axis=1)
+    def _postprocess(self, z):
+        return np.argmax(z[1], axis=1)
 
 
 class InceptionV4Stem(rm.Model):
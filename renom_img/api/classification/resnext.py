@@ -55,6 +55,13 @@ class Bottleneck(rm.Model):
 
 class ResNeXtBase(Classification):
 
+    FEATURE_CACHEABLE = True
+
+    @property
+    def train_whole_network(self):
+        # Base.__init__ is not called, which sets this.
+        return self._train_whole_network
+
     def get_optimizer(self, current_epoch=None, total_epoch=None, current_batch=None, total_batch=None, **kwargs):
         """Returns an instance of Optimiser for training Yolov1 algorithm.
 
@@ -106,6 +113,16 @@ class ResNeXtBase(Classification):
         self._model.layer3.set_auto_update(self._train_whole_network)
         self._model.layer4.set_auto_update(self._train_whole_network)
 
+    def inference_stages(self):
+        return self._model.stages()
+
+    def forward_frozen(self, x):
+        self._freeze()
+        return self._model.forward_features(x)
+
+    def forward_head(self, z):
+        return self._model.head(z)
+
 
 class ResNeXt(rm.Model):
 
@@ -148,22 +165,33 @@ class ResNeXt(rm.Model):
         return rm.Sequential(layers)
 
     def forward(self, x):
-        x = self.conv1(x)
-        x = self.bn1(x)
-        x = self.relu(x)
-        x = self.maxpool(x)
+        return self.head(self.forward_features(x))
+
+    def forward_features(self, x):
+        x = self.stem(x)
 
         x = self.layer1(x)
         x = self.layer2(x)
         x = self.layer3(x)
         x = self.layer4(x)
+        return x
 
+    def stem(self, x):
+        x = self.conv1(x)
+        x = self.bn1(x)
+        x = self.relu(x)
+        x = self.maxpool(x)
+        return x
+
+    def head(self, x):
         x = rm.average_pool2d(x, filter=(x.shape[2], x.shape[3]))
         x = self.flat(x)
         x = self.fc(x)
-
         return x
 
+    def stages(self):
+        return [self.stem, self.layer1, self.layer2, self.layer3, self.layer4, self.head]
+
 
 class ResNeXt50(ResNeXtBase):
     """ResNeXt50 model.
@@ -27,6 +27,7 @@ def layer_factory(channel=32, conv_layer_num=2):
 class VGGBase(Classification):
 
     SERIALIZED = Base.SERIALIZED
+    FEATURE_CACHEABLE = True
 
     def set_last_layer_unit(self, unit_size):
         self._model.fc3._output_size = unit_size
@@ -84,6 +85,13 @@ class VGGBase(Classification):
         self._freeze()
         return self._model(x)
 
+    def forward_frozen(self, x):
+        self._freeze()
+        return self._model.forward_features(x)
+
+    def forward_head(self, z):
+        return self._model.forward_classifier(z)
+
 
 @adddoc
 class VGG11(VGGBase):
@@ -173,6 +181,8 @@ class VGG16(VGGBase):
 
 class VGG16_NODENSE(VGGBase):
 
+    FEATURE_CACHEABLE = False
+
     def __init__(self, class_map=None, imsize=(224, 224),
                  load_pretrained_weight=False, train_whole_network=False):
 
@@ -249,11 +259,17 @@ class CNN_VGG19(rm.Model):
         self.fc3 = rm.Dense(num_class)
 
     def forward(self, x):
+        return self.forward_classifier(self.forward_features(x))
+
+    def forward_features(self, x):
         t = self.block1(x)
         t = self.block2(t)
         t = self.block3(t)
         t = self.block4(t)
         t = self.block5(t)
+        return t
+
+    def forward_classifier(self, t):
         t = rm.flatten(t)
         t = rm.relu(self.fc1(t))
         t = self.dropout1(t)
@@ -278,11 +294,17 @@ class CNN_VGG16(rm.Model):
         self.fc3 = rm.Dense(num_class)
 
     def forward(self, x):
+        return self.forward_classifier(self.forward_features(x))
+
+    def forward_features(self, x):
         t = self.block1(x)
         t = self.block2(t)
         t = self.block3(t)
         t = self.block4(t)
         t = self.block5(t)
+        return t
+
+    def forward_classifier(self, t):
         t = rm.flatten(t)
         t = rm.relu(self.fc1(t))
         t = self.dropout1(t)
@@ -351,11 +373,17 @@ class CNN_VGG11(rm.Model):
         self.fc3 = rm.Dense(num_class)
 
     def forward(self, x):
+        return self.forward_classifier(self.forward_features(x))
+
+    def forward_features(self, x):
         t = self.block1(x)
         t = self.block2(t)
         t = self.block3(t)
         t = self.block4(t)
         t = self.block5(t)
+        return t
+
+    def forward_classifier(self, t):
         t = rm.flatten(t)
         t = rm.relu(self.fc1(t))
         t = self.dropout1(t)
@@ -7,11 +7,15 @@ from renom_img.api.utility.load import load_img
 
 from renom_img.api import Base
 from renom_img.api.utility.target import DataBuilderClassification
-from renom_img.api.utility.distributor.distributor import ImageDistributor
+from renom_img.api.utility.distributor.distributor import ImageDistributor, FeatureDistributor
+from renom_img.api.utility.tile import TileLoader, nms_xyxy
 
 
 class Detection(Base):
 
+    # Format of boxes returned by ``get_bbox``. "xywh" or "xyxy".
+    BOX_FORMAT = "xywh"
+
     def preprocess(self, x):
         return x / 255.
 
@@ -59,36 +63,89 @@ class Detection(Base):
             Therefore the range of 'box' is [0 ~ 1].
 
         """
+        return super(Detection, self).predict(img_list, batch_size,
+                                              score_threshold=score_threshold,
+                                              nms_threshold=nms_threshold)
+
+    def _postprocess(self, z, score_threshold=0.3, nms_threshold=0.4):
+        return self.get_bbox(z, score_threshold, nms_threshold)
+
+    def predict_tiled(self, img_path, tile_size=None, overlap=64, batch_size=8, num_worker=4,
+                      score_threshold=0.3, nms_threshold=0.4):
+        """
+        Performs prediction of a large image without shrinking it.
+        The image is split into overlapping tiles and each tile is predicted
+        in its original resolution. Boxes found in several tiles are merged by
+        non maximum suppression.
+
+        Args:
+            img_path (string): Path to the image.
+            tile_size (tuple): Tile size (width, height). Defaults to ``imsize``.
+            overlap (int): Overlapping pixels between adjacent tiles. This should be
+                larger than the objects to detect.
+            batch_size (int): Number of tiles predicted at once.
+            num_worker (int): Number of threads for cropping tiles.
+            score_threshold (float): The threshold for confidence score.
+            nms_threshold (float): The threshold for non maximum supression.
+
+        Returns:
+            (list): List of predicted bbox, score and class of the image.
+            The format is the same as ``predict``. Box coordinates are ratio
+            to the whole image size.
+
+        Example:
+            >>> model.predict_tiled('large.jpg', tile_size=(512, 512), overlap=128)
+            [{'box': [0.21, 0.44, 0.01, 0.02], 'score':0.823, 'class':1, 'name':'defect'}]
+        """
+        if tile_size is None:
+            tile_size = self.imsize
         self.set_models(inference=True)
-        if isinstance(img_list, (list, str)):
-            if isinstance(img_list, (tuple, list)):
-                if len(img_list) > batch_size:
-                    test_dist = ImageDistributor(img_list)
-                    results = []
-                    bar = tqdm()
-                    bar.total = int(np.ceil(len(test_dist) / batch_size))
-                    for i, (x_img_list, _) in enumerate(test_dist.batch(batch_size, shuffle=False)):
-                        img_array = np.vstack([load_img(path, self.imsize)[None]
-                                               for path in x_img_list])
-                        img_array = self.preprocess(img_array)
-                        results.extend(self.get_bbox(self(img_array).as_ndarray(),
-                                                     score_threshold,
-                                                     nms_threshold))
-                        bar.update(1)
-                    return results
-                img_array = np.vstack([load_img(path, self.imsize)[None] for path in img_list])
-                img_array = self.preprocess(img_array)
+        loader = TileLoader(img_path, tile_size, overlap, self.imsize, batch_size, num_worker)
+        width, height = loader.size
+        tw, th = loader.tile_size
+
+        boxes, scores, classes, names = [], [], [], []
+        for tiles, img_array in loader:
+            preds = self._predict_array(self.preprocess(img_array), score_threshold=score_threshold,
+                                        nms_threshold=nms_threshold)
+            for (left, top, _, _), pred in zip(tiles, preds):
+                for obj in pred:
+                    if self.BOX_FORMAT == "xyxy":
+                        x1, y1, x2, y2 = obj["box"]
+                    else:
+                        x, y, w, h = obj["box"]
+                        x1, y1, x2, y2 = x - w / 2., y - h / 2., x + w / 2., y + h / 2.
+                    x1, x2 = left + x1 * tw, left + x2 * tw
+                    y1, y2 = top + y1 * th, top + y2 * th
+                    # Boxes in the zero padded area are ignored.
+                    if (x1 + x2) / 2. >= width or (y1 + y2) / 2. >= height:
+                        continue
+                    boxes.append([x1, y1, x2, y2])
+                    scores.append(obj["score"])
+                    classes.append(obj["class"])
+                    names.append(obj.get("name"))
+        if not boxes:
+            return []
+
+        boxes = np.array(boxes, dtype=np.float32)
+        boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, width)
+        boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, height)
+        keep = nms_xyxy(boxes, np.array(scores), np.array(classes), nms_threshold)
+        result = []
+        boxes /= np.array([width, height, width, height], dtype=np.float32)
+        for i in keep:
+            x1, y1, x2, y2 = boxes[i].tolist()
+            if self.BOX_FORMAT == "xyxy":
+                box = [x1, y1, x2, y2]
             else:
-                img_array = load_img(img_list, self.imsize)[None]
-                img_array = self.preprocess(img_array)
-                return self.get_bbox(self(img_array).as_ndarray(),
-                                     score_threshold,
-                                     nms_threshold)[0]
-        else:
-            img_array = img_list
-        return self.get_bbox(self(img_array).as_ndarray(),
-                             score_threshold,
-                             nms_threshold)
+                box = [(x1 + x2) / 2., (y1 + y2) / 2., x2 - x1, y2 - y1]
+            result.append({
+                "box": box,
+                "score": scores[i],
+                "class": classes[i],
+                "name": names[i],
+            })
+        return result
 
     def loss(self, x, y):
         """
@@ -126,7 +183,7 @@ class Detection(Base):
 
     def fit(self, train_img_path_list, train_annotation_list,
             valid_img_path_list=None, valid_annotation_list=None,
-            epoch=136, batch_size=64, augmentation=None, callback_end_epoch=None):
+            epoch=136, batch_size=64, augmentation=None, callback_end_epoch=None, feature_cache=False):
         """
         This function performs training with given data and hyper parameters.
 
@@ -139,6 +196,9 @@ class Detection(Base):
             batch_size(int): Number of batch size.
             augmentation(Augmentation): Augmentation object.
             callback_end_epoch(function): Given function will be called at the end of each epoch.
+            feature_cache(bool): If True and the frozen part of the network is not trained,
+                outputs of the frozen part are computed once and only the head is trained.
+                This is ignored when augmentation is given.
 
         Returns:
             (tuple): Training loss list and validation loss list.
@@ -174,16 +234,27 @@ class Detection(Base):
         else:
             valid_dist = None
 
+        feature_dist = None
+        if feature_cache and augmentation is None and self.feature_cacheable:
+            feature_dist = FeatureDistributor(self, train_dist, self.build_data(), batch_size)
+
         batch_loop = int(np.ceil(len(train_dist) / batch_size))
         avg_train_loss_list = []
         avg_valid_loss_list = []
         for e in range(epoch):
             bar = tqdm(range(batch_loop))
             display_loss = 0
-            for i, (train_x, train_y) in enumerate(train_dist.batch(batch_size, target_builder=self.build_data())):
+            if feature_dist is None:
+                train_batch = train_dist.batch(batch_size, target_builder=self.build_data(), epoch=e)
+            else:
+                train_batch = feature_dist.batch(batch_size)
+            for i, (train_x, train_y) in enumerate(train_batch):
                 self.set_models(inference=False)
                 with self.train():
-                    loss = self.loss(self(train_x), train_y)
+                    if feature_dist is None:
+                        loss = self.loss(self(train_x), train_y)
+                    else:
+                        loss = self.loss(self.forward_head(train_x), train_y)
                     reg_loss = loss + self.regularize()
                 reg_loss.grad().update(self.get_optimizer(loss.as_ndarray(), e, epoch, i, batch_loop))
                 try:
@@ -201,7 +272,7 @@ class Detection(Base):
                 bar.n = 0
                 bar.total = int(np.ceil(len(valid_dist) / batch_size))
                 display_loss = 0
-                for i, (valid_x, valid_y) in enumerate(valid_dist.batch(batch_size, target_builder=self.build_data())):
+                for i, (valid_x, valid_y) in enumerate(valid_dist.cached_batch(batch_size, target_builder=self.build_data())):
                     self.set_models(inference=True)
                     loss = self.loss(self(valid_x), valid_y)
                     try:
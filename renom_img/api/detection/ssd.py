@@ -14,6 +14,7 @@ from renom_img.api.classification.vgg import VGG16
 from renom_img.api.utility.load import prepare_detection_data, resize_detection_data
 from renom_img.api.utility.box import transform2xy12, calc_iou_xywh
 from renom_img.api.utility.load import parse_xml_detection, load_img
+from renom_img.api.utility.annotation import box_array, class_array
 from renom_img.api.utility.nms import nms
 from renom_img.api.utility.distributor.distributor import ImageDistributor
 
@@ -263,6 +264,9 @@ class SSD(Detection):
     WEIGHT_URL = "http://renom.jp/docs/downloads/weights/{}/detection/SSD.h5".format(__version__)
     # WEIGHT_URL = "http://renom.jp/docs/downloads/weights/{}/detection/SSD.h5".format(__version__)
     SERIALIZED = ("overlap_threshold", *Base.SERIALIZED)
+    FEATURE_CACHEABLE = True
+    # Decoded boxes are (x1, y1, x2, y2).
+    BOX_FORMAT = "xyxy"
 
     def __init__(self, class_map=None, imsize=(300, 300),
                  overlap_threshold=0.5, load_pretrained_weight=False, train_whole_network=False):
@@ -346,25 +350,14 @@ class SSD(Detection):
                 img_data, label_data = augmentation(img_data, label_data, mode="detection")
             img_data, label_data = resize_detection_data(img_data, label_data, self.imsize)
             targets = []
+            img_w, img_h = self.imsize
             for n in range(N):
-                bounding_boxes = []
-                one_hot_classes = []
-                for obj in label_data[n]:
-                    one_hot = np.zeros(len(self.class_map))
-                    xmin, ymin, xmax, ymax = transform2xy12(obj['box'])
-
-                    # Divide by image size
-                    xmin /= self.imsize[0]
-                    xmax /= self.imsize[0]
-                    ymin /= self.imsize[1]
-                    ymax /= self.imsize[1]
-
-                    bounding_box = [xmin, ymin, xmax, ymax]
-                    bounding_boxes.append(bounding_box)
-                    one_hot[obj['class']] = 1
-                    one_hot_classes.append(one_hot)
-                bounding_boxes = np.asarray(bounding_boxes)
-                one_hot_classes = np.asarray(one_hot_classes)
+                xywh = box_array(label_data[n]).astype(np.float64)
+                # Transform to (x1, y1, x2, y2) and divide by image size.
+                bounding_boxes = np.concatenate((xywh[:, :2] - xywh[:, 2:] / 2.,
+                                                 xywh[:, :2] + xywh[:, 2:] / 2.), axis=1)
+                bounding_boxes /= np.array([img_w, img_h, img_w, img_h])
+                one_hot_classes = np.eye(len(self.class_map))[class_array(label_data[n])]
                 boxes = np.hstack((bounding_boxes, one_hot_classes))
                 target = self.assign_boxes(boxes)
                 targets.append(target)
@@ -443,6 +436,13 @@ class SSD(Detection):
         self._freezed_network.set_auto_update(self.train_whole_network)
         return self._network(self._freezed_network(x))
 
+    def forward_frozen(self, x):
+        self._freezed_network.set_auto_update(False)
+        return self._freezed_network(x)
+
+    def forward_head(self, z):
+        return self._network(z)
+
     def loss(self, x, y, neg_pos_ratio=3.0):
         pos_samples = (y[:, :, 5] == 0)[..., None]
         N = np.sum(pos_samples)
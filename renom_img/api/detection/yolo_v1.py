@@ -12,6 +12,7 @@ from renom_img.api.utility.distributor.distributor import ImageDistributor
 from renom_img.api.utility.misc.download import download
 from renom_img.api.utility.box import transform2xy12
 from renom_img.api.utility.load import prepare_detection_data, load_img, resize_detection_data
+from renom_img.api.utility.annotation import box_array, class_array
 
 
 def make_box(box):
@@ -85,6 +86,7 @@ class Yolov1(Detection):
 
     SERIALIZED = ("_cells", "_bbox", *Base.SERIALIZED)
     WEIGHT_URL = Darknet.WEIGHT_URL
+    FEATURE_CACHEABLE = True
 
     def __init__(self, class_map=None, cells=7, bbox=2, imsize=(224, 224), load_pretrained_weight=False, train_whole_network=False):
 
@@ -207,6 +209,14 @@ class Yolov1(Detection):
         out = self._network(out)
         return out
 
+    def forward_frozen(self, x):
+        self._freezed_network.set_auto_update(False)
+        self._freezed_network.set_models(inference=True)
+        return self._freezed_network(x)
+
+    def forward_head(self, z):
+        return self._network(z)
+
     def regularize(self):
         """Regularize term. You can use this function to add regularize term to
         loss function.
@@ -377,14 +387,17 @@ class Yolov1(Detection):
             cell_w, cell_h = self._cells
             img_w, img_h = self.imsize
             for n in range(N):
-                for obj in label_data[n]:
-                    tx = np.clip(obj["box"][0], 0, img_w) * .99 * cell_w / img_w
-                    ty = np.clip(obj["box"][1], 0, img_h) * .99 * cell_h / img_h
-                    tw = np.sqrt(np.clip(obj["box"][2], 0, img_w) / img_w)
-                    th = np.sqrt(np.clip(obj["box"][3], 0, img_h) / img_h)
-                    one_hot = [0] * obj["class"] + [1] + [0] * (self.num_class - obj["class"] - 1)
-                    target[n, int(ty), int(tx)] = \
-                        np.concatenate(([1, tx % 1, ty % 1, tw, th] * num_bbox, one_hot))
+                boxes = box_array(label_data[n])
+                if len(boxes) == 0:
+                    continue
+                tx = np.clip(boxes[:, 0], 0, img_w) * .99 * cell_w / img_w
+                ty = np.clip(boxes[:, 1], 0, img_h) * .99 * cell_h / img_h
+                tw = np.sqrt(np.clip(boxes[:, 2], 0, img_w) / img_w)
+                th = np.sqrt(np.clip(boxes[:, 3], 0, img_h) / img_h)
+                one_hot = np.eye(self.num_class)[class_array(label_data[n])]
+                box_target = np.stack([np.ones_like(tx), tx % 1, ty % 1, tw, th], axis=1)
+                target[n, ty.astype(int), tx.astype(int)] = \
+                    np.concatenate((np.tile(box_target, (1, num_bbox)), one_hot), axis=1)
 
             return self.preprocess(img_data), target.reshape(N, -1)
         return builder
@@ -13,6 +13,7 @@ from renom_img.api import Base, adddoc
 from renom_img.api.detection import Detection
 from renom_img.api.classification.darknet import Darknet19, DarknetConv2dBN
 from renom_img.api.utility.load import prepare_detection_data, load_img, resize_detection_data
+from renom_img.api.utility.annotation import AnnotationList, box_array, class_array
 from renom_img.api.utility.box import calc_iou_xywh, transform2xy12
 from renom_img.api.utility.distributor.distributor import ImageDistributor
 from renom_img.api.utility.misc.download import download
@@ -55,9 +56,14 @@ def create_anchor(annotation_list, n_anchor=5, base_size=(416, 416)):
         (AnchorYolov2): Anchor list.
     """
     convergence = 0.005
-    box_list = [(0, 0, an['box'][2] * base_size[0] / an['size'][0],
-                 an['box'][3] * base_size[1] / an['size'][1])
-                for an in chain.from_iterable(annotation_list)]
+    if isinstance(annotation_list, AnnotationList) and annotation_list.sizes is not None:
+        sizes = np.repeat(annotation_list.sizes, np.diff(annotation_list.offsets), axis=0)
+        wh = annotation_list.boxes[:, 2:] * np.array(base_size) / sizes
+        box_list = [(0, 0, w, h) for w, h in wh.tolist()]
+    else:
+        box_list = [(0, 0, an['box'][2] * base_size[0] / an['size'][0],
+                     an['box'][3] * base_size[1] / an['size'][1])
+                    for an in chain.from_iterable(annotation_list)]
 
     centroid_index = np.random.permutation(len(box_list))[:n_anchor]
     centroid = [box_list[i] for i in centroid_index]
@@ -454,9 +460,8 @@ class Yolov2(Detection):
             for n, annotation in enumerate(label_list):
                 # This returns resized image.
                 # Target processing
-                boxces = np.array([a['box'] for a in annotation])
-                classes = np.array([[0] * a["class"] + [1] + [0] * (num_class - a["class"] - 1)
-                                    for a in annotation])
+                boxces = box_array(annotation)
+                classes = np.eye(num_class)[class_array(annotation)]
                 # x, y
                 cell_x = (boxces[:, 0] // ratio_w).astype(np.int)
                 cell_y = (boxces[:, 1] // ratio_h).astype(np.int)
@@ -704,7 +709,7 @@ class Yolov2(Detection):
                 bar.n = 0
                 bar.total = int(np.ceil(len(valid_dist) / batch_size))
                 display_loss = 0
-                for i, (valid_x, valid_y) in enumerate(valid_dist.batch(batch_size, shuffle=False, target_builder=self.build_data())):
+                for i, (valid_x, valid_y) in enumerate(valid_dist.cached_batch(batch_size, target_builder=self.build_data())):
                     self.set_models(inference=True)
                     loss = self.loss(self(valid_x), valid_y)
 
@@ -111,6 +111,34 @@ class Detector(object):
         assert self._model
         return self._model.predict(img_list)
 
+    def predict_on_server(self, img_path):
+        """
+        Perform prediction of an image on ReNomIMG server with the deployed model.
+        Pulling the trained weight is not required.
+
+        Args:
+            img_path (string): Path to the image.
+
+        Returns:
+            (dict): Original image size and predicted boxes.
+
+        Example:
+            >>> from renom_img.api.inference.detector import Detector
+            >>> detector = Detector()
+            >>> detector.predict_on_server(path_to_image)
+            {
+              'size': [500, 375],
+              'prediction': [{'box':[0.2, 0.1, 0.5, 0.3], 'class':0, 'name': 'dog', 'score':0.5}]
+            }
+        """
+        url = self._url + ':' + self._port
+        predict_api = url + "/api/renom_img/v2/deployed_model/task/1/predict"
+        with open(img_path, "rb") as reader:
+            ret = self.error_handler(lambda: requests.post(predict_api, data=reader.read()).json())
+        if ret.get('error_msg', False):
+            raise Exception(ret.get('error_msg'))
+        return ret
+
     @property
     def model_info(self):
         """This function returns information of pulled model.
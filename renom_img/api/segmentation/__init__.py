@@ -11,6 +11,7 @@ from renom_img.api.utility.load import load_img
 from renom_img.api import Base
 from renom_img.api.utility.target import DataBuilderSegmentation
 from renom_img.api.utility.distributor.distributor import ImageDistributor
+from renom_img.api.utility.tile import TileLoader, tile_weight
 
 # LSVRC2012 used by VGG16
 MEAN_BGR = np.array([104.00698793, 116.66876762, 122.67891434])
@@ -51,30 +52,78 @@ class SemanticSegmentation(Base):
             If multiple images or paths are given, then a list in which there are arrays whose shape is **(width, height)** is returned.
         """
 
+        return super(SemanticSegmentation, self).predict(img_list, batch_size)
+
+    def _postprocess(self, z):
+        # Softmax does not change the order of scores.
+        return np.argmax(z, axis=1)
+
+    def predict_tiled(self, img_path, tile_size=None, overlap=64, batch_size=8, num_worker=4):
+        """
+        Performs prediction of a large image without shrinking it.
+        The image is split into overlapping tiles. Outputs of the tiles are
+        blended with weights which decrease toward the tile border, so the result
+        has no seams. Tiles are processed row by row and only the rows which
+        can still be overlapped are kept, so the memory usage is proportional to
+        the image width, not to the image area.
+
+        Args:
+            img_path (string): Path to the image.
+            tile_size (tuple): Tile size (width, height). Defaults to ``imsize``.
+            overlap (int): Overlapping pixels between adjacent tiles.
+            batch_size (int): Number of tiles predicted at once.
+            num_worker (int): Number of threads for cropping tiles.
+
+        Returns:
+            (ndarray): Class map whose shape is **(height, width)** of the original image.
+
+        Example:
+            >>> class_map = model.predict_tiled('large.jpg', tile_size=(512, 512), overlap=64)
+        """
+        if tile_size is None:
+            tile_size = self.imsize
         self.set_models(inference=True)
-        if isinstance(img_list, (list, str)):
-            if isinstance(img_list, (tuple, list)):
-                if len(img_list) > batch_size:
-                    test_dist = ImageDistributor(img_list)
-                    results = []
-                    bar = tqdm()
-                    bar.total = int(np.ceil(len(test_dist) / batch_size))
-                    for i, (x_img_list, _) in enumerate(test_dist.batch(batch_size, shuffle=False)):
-                        img_array = np.vstack([load_img(path, self.imsize)[None]
-                                               for path in x_img_list])
-                        img_array = self.preprocess(img_array)
-                        results.extend(np.argmax(rm.softmax(self(img_array)).as_ndarray(), axis=1))
-                        bar.update(1)
-                    return results
-                img_array = np.vstack([load_img(path, self.imsize)[None] for path in img_list])
-                img_array = self.preprocess(img_array)
-            else:
-                img_array = load_img(img_list, self.imsize)[None]
-                img_array = self.preprocess(img_array)
-                return np.argmax(rm.softmax(self(img_array)).as_ndarray(), axis=1)[0]
-        else:
-            img_array = img_list
-        return np.argmax(rm.softmax(self(img_array)).as_ndarray(), axis=1)
+        loader = TileLoader(img_path, tile_size, overlap, self.imsize, batch_size, num_worker)
+        width, height = loader.size
+        tw, th = loader.tile_size
+        weight = tile_weight(loader.tile_size, overlap)
+        dtype = np.uint8 if self.num_class <= 256 else np.int32
+        result = np.empty((height, width), dtype=dtype)
+
+        # Accumulators of the rows [band_top, band_top + th).
+        band_top = 0
+        acc = None
+        acc_weight = np.zeros((th, width), dtype=np.float32)
+
+        def flush(end):
+            # Rows above 'end' are not overlapped by remaining tiles.
+            n = min(end, height) - band_top
+            result[band_top:band_top + n] = np.argmax(
+                acc[:, :n] / acc_weight[None, :n], axis=0)
+
+        for tiles, img_array in loader:
+            z = self.forward_inference(self.preprocess(img_array))
+            for (left, top, _, _), logit in zip(tiles, z):
+                if top != band_top:
+                    # Finalize rows of the previous band and shift the rest.
+                    flush(top)
+                    shift = top - band_top
+                    acc[:, :th - shift] = acc[:, shift:]
+                    acc[:, th - shift:] = 0
+                    acc_weight[:th - shift] = acc_weight[shift:]
+                    acc_weight[th - shift:] = 0
+                    band_top = top
+                if logit.shape[1:] != (th, tw):
+                    logit = np.stack([np.asarray(Image.fromarray(c.astype(np.float32), mode='F')
+                                                 .resize((tw, th), Image.BILINEAR)) for c in logit])
+                if acc is None:
+                    acc = np.zeros((len(logit), th, width), dtype=np.float32)
+                h = min(th, height - top)
+                w = min(tw, width - left)
+                acc[:, :h, left:left + w] += logit[:, :h, :w] * weight[None, :h, :w]
+                acc_weight[:h, left:left + w] += weight[:h, :w]
+        flush(height)
+        return result
 
     def fit(self, train_img_path_list=None, train_annotation_list=None,
             valid_img_path_list=None, valid_annotation_list=None,
@@ -90,7 +139,7 @@ class SemanticSegmentation(Base):
         for e in range(epoch):
             bar = tqdm(range(batch_loop))
             display_loss = 0
-            for i, (train_x, train_y) in enumerate(train_dist.batch(batch_size, target_builder=self.build_data())):
+            for i, (train_x, train_y) in enumerate(train_dist.batch(batch_size, target_builder=self.build_data(), epoch=e)):
                 self.set_models(inference=False)
                 with self.train():
                     loss = self.loss(self(train_x), train_y, class_weight=class_weight)
@@ -110,7 +159,7 @@ class SemanticSegmentation(Base):
                 bar.n = 0
                 bar.total = int(np.ceil(len(valid_dist) / batch_size))
                 display_loss = 0
-                for i, (valid_x, valid_y) in enumerate(valid_dist.batch(batch_size, target_builder=self.build_data())):
+                for i, (valid_x, valid_y) in enumerate(valid_dist.cached_batch(batch_size, target_builder=self.build_data())):
                     self.set_models(inference=True)
                     loss = self.loss(self(valid_x), valid_y, class_weight=class_weight)
                     try:
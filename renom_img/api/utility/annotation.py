@@ -0,0 +1,347 @@
+"""Columnar representation of detection annotations.
+
+The default annotation format of ReNomIMG is a list of per-image lists of
+per-object dictionaries (see ``parse_xml_detection``). For large datasets those
+small dictionaries dominate both memory and the time spent in resize, flip and
+crop steps. ``AnnotationList`` keeps all objects of all images in a few flat
+arrays instead, and indexing it returns views which behave like the original
+lists of dictionaries.
+
+The helper functions defined below (``box_array``, ``replace_boxes``, ...)
+accept both representations, so that augmentation processes, data builders
+and evaluators can be written once.
+"""
+import numpy as np
+from itertools import chain
+
+
+class AnnotationObject(object):
+    """Dictionary compatible view of one object in an ``ImageAnnotation``.
+
+    Supported keys are 'box', 'class', 'name', 'size' and 'score'(only if
+    the parent has scores). Assigning 'box' or 'class' writes through to the
+    underlying arrays.
+    """
+
+    __slots__ = ("_parent", "_index")
+
+    def __init__(self, parent, index):
+        self._parent = parent
+        self._index = index
+
+    def keys(self):
+        keys = ["box", "name", "class", "size"]
+        if self._parent.scores is not None:
+            keys.append("score")
+        return keys
+
+    def values(self):
+        return [self[k] for k in self.keys()]
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __getitem__(self, key):
+        parent = self._parent
+        if key == "box":
+            return parent.boxes[self._index].tolist()
+        elif key == "class":
+            return int(parent.classes[self._index])
+        elif key == "name":
+            return parent.class_map[int(parent.classes[self._index])]
+        elif key == "size":
+            return parent.size
+        elif key == "score" and parent.scores is not None:
+            return float(parent.scores[self._index])
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key == "box":
+            self._parent.boxes[self._index] = value
+        elif key == "class":
+            self._parent.classes[self._index] = value
+        else:
+            raise KeyError("The key '{}' is not writable.".format(key))
+
+    def __eq__(self, other):
+        try:
+            return dict(self.items()) == dict(other.items())
+        except AttributeError:
+            return False
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class ImageAnnotation(object):
+    """Annotation of one image. This behaves like a list of ``AnnotationObject``.
+
+    Args:
+        boxes(ndarray): Array of boxes whose shape is (#objects, 4). The format of each box is [x, y, w, h].
+        classes(ndarray): Array of class ids whose shape is (#objects, ).
+        class_map(list): List of class names. Names are looked up using class ids.
+        size(tuple): Original image size (width, height).
+        scores(ndarray): Array of confidence scores. Only used for predicted boxes.
+    """
+
+    __slots__ = ("boxes", "classes", "class_map", "size", "scores")
+
+    def __init__(self, boxes, classes, class_map, size=None, scores=None):
+        self.boxes = boxes
+        self.classes = classes
+        self.class_map = class_map
+        self.size = size
+        self.scores = scores
+
+    @classmethod
+    def from_objects(cls, objects, class_map=None):
+        """Creates an ImageAnnotation from a list of annotation dictionaries.
+
+        Args:
+            objects(list): List of dictionaries which includes keys 'box' and 'class'.
+            class_map(list): List of class names. If None is given, it will be created from 'name' of each object.
+
+        Returns:
+            (ImageAnnotation): Columnar annotation.
+        """
+        if isinstance(objects, ImageAnnotation):
+            return objects
+        if class_map is None:
+            class_map = sorted(set(obj["name"] for obj in objects))
+        boxes = np.array([obj["box"] for obj in objects], dtype=np.float32).reshape(-1, 4)
+        classes = np.array([obj["class"] if "class" in obj else class_map.index(obj["name"])
+                            for obj in objects], dtype=np.int32)
+        size = objects[0].get("size", None) if len(objects) > 0 else None
+        if len(objects) > 0 and all("score" in obj for obj in objects):
+            scores = np.array([obj["score"] for obj in objects], dtype=np.float32)
+        else:
+            scores = None
+        return cls(boxes, classes, class_map, size, scores)
+
+    @property
+    def names(self):
+        return [self.class_map[int(c)] for c in self.classes]
+
+    def with_boxes(self, boxes, index=None):
+        """Returns new ImageAnnotation which has given boxes.
+
+        Args:
+            boxes(ndarray): New boxes. The shape is (#selected objects, 4).
+            index(ndarray): Indices or boolean mask of objects which the new boxes belong to.
+                If None is given, all objects are kept.
+        """
+        classes = self.classes
+        scores = self.scores
+        if index is not None:
+            classes = classes[index]
+            scores = scores[index] if scores is not None else None
+        return ImageAnnotation(np.asarray(boxes, dtype=np.float32).reshape(-1, 4),
+                               np.array(classes), self.class_map, self.size,
+                               None if scores is None else np.array(scores))
+
+    def to_list(self):
+        """Converts to the list of dictionaries."""
+        return [dict(obj.items()) for obj in self]
+
+    def __len__(self):
+        return len(self.classes)
+
+    def __iter__(self):
+        return (AnnotationObject(self, j) for j in range(len(self)))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [AnnotationObject(self, j) for j in range(len(self))[index]]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("Object index out of range.")
+        return AnnotationObject(self, index)
+
+    def __getstate__(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def __setstate__(self, state):
+        for k, v in state.items():
+            setattr(self, k, v)
+
+    def __repr__(self):
+        return repr(self.to_list())
+
+
+class AnnotationList(object):
+    """Columnar container of detection annotations for many images.
+
+    All boxes are stored in one float32 array whose shape is (G, 4) and all
+    class ids in one int32 array. Objects of the n-th image are placed at
+    ``offsets[n]:offsets[n + 1]``. Indexing returns an ``ImageAnnotation``
+    which can be used as the list of dictionaries.
+
+    Args:
+        boxes(ndarray): Boxes of all objects. (G, 4)
+        classes(ndarray): Class ids of all objects. (G, )
+        offsets(ndarray): Object offset of each image. (N + 1, )
+        class_map(list): List of class names.
+        sizes(ndarray): Original image size of each image. (N, 2)
+
+    Example:
+        >>> from renom_img.api.utility.load import parse_xml_detection
+        >>> annotation_list, class_map = parse_xml_detection(xml_path_list, columnar=True)
+        >>> annotation_list[0][0]['box']
+        [250.5, 276.0, 137.0, 202.0]
+        >>> annotation_list[0].boxes.shape
+        (2, 4)
+    """
+
+    def __init__(self, boxes, classes, offsets, class_map, sizes=None):
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.classes = np.asarray(classes, dtype=np.int32)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.class_map = list(class_map)
+        self.sizes = None if sizes is None else np.asarray(sizes, dtype=np.float32)
+        assert len(self.boxes) == len(self.classes) == self.offsets[-1]
+
+    @classmethod
+    def from_list(cls, annotation_list, class_map=None):
+        """Creates an AnnotationList from the list of annotation dictionaries.
+
+        Args:
+            annotation_list(list): Annotation list returned by ``parse_xml_detection``.
+            class_map(list): List of class names. If None is given, it will be created from 'name' of each object.
+
+        Returns:
+            (AnnotationList): Columnar annotation list.
+        """
+        if isinstance(annotation_list, AnnotationList):
+            return annotation_list
+        if class_map is None:
+            class_map = sorted(set(obj["name"] for obj in chain.from_iterable(annotation_list)))
+        annotation_list = [ImageAnnotation.from_objects(an, class_map) for an in annotation_list]
+        offsets = np.zeros(len(annotation_list) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(an) for an in annotation_list])
+        boxes = np.concatenate([an.boxes for an in annotation_list] + [np.zeros((0, 4))])
+        classes = np.concatenate([an.classes for an in annotation_list] + [np.zeros((0, ))])
+        if all(an.size is not None for an in annotation_list):
+            sizes = np.array([an.size for an in annotation_list], dtype=np.float32).reshape(-1, 2)
+        else:
+            sizes = None
+        return cls(boxes, classes, offsets, class_map, sizes)
+
+    def to_list(self):
+        """Converts to the list of lists of dictionaries."""
+        return [an.to_list() for an in self]
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        return (self[n] for n in range(len(self)))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[n] for n in range(len(self))[index]]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("Image index out of range.")
+        start, end = self.offsets[index], self.offsets[index + 1]
+        size = None if self.sizes is None else tuple(float(s) for s in self.sizes[index])
+        return ImageAnnotation(self.boxes[start:end], self.classes[start:end],
+                               self.class_map, size)
+
+    def __repr__(self):
+        return "<AnnotationList(images={}, objects={}, classes={})>".format(
+            len(self), len(self.classes), len(self.class_map))
+
+
+def box_array(objects):
+    """Returns a copy of boxes as an ndarray whose shape is (#objects, 4).
+    The dtype is float32 for ImageAnnotation and float64 for the list of dictionaries.
+
+    Args:
+        objects(list, ImageAnnotation): Annotation of one image.
+    """
+    if isinstance(objects, ImageAnnotation):
+        return np.array(objects.boxes, dtype=np.float32)
+    return np.array([obj["box"] for obj in objects], dtype=np.float64).reshape(-1, 4)
+
+
+def class_array(objects):
+    """Returns class ids as an ndarray whose shape is (#objects, ).
+
+    Args:
+        objects(list, ImageAnnotation): Annotation of one image.
+    """
+    if isinstance(objects, ImageAnnotation):
+        return np.array(objects.classes, dtype=np.int32)
+    return np.array([obj["class"] for obj in objects], dtype=np.int32)
+
+
+def name_list(objects):
+    """Returns class names of objects.
+
+    Args:
+        objects(list, ImageAnnotation): Annotation of one image.
+    """
+    if isinstance(objects, ImageAnnotation):
+        return objects.names
+    return [obj["name"] for obj in objects]
+
+
+def score_array(objects):
+    """Returns confidence scores as an ndarray whose shape is (#objects, ).
+
+    Args:
+        objects(list, ImageAnnotation): Prediction of one image.
+    """
+    if isinstance(objects, ImageAnnotation):
+        return np.array(objects.scores, dtype=np.float32)
+    return np.array([float(obj["score"]) for obj in objects], dtype=np.float32)
+
+
+def replace_boxes(objects, boxes, index=None):
+    """Returns a new annotation which has given boxes. The type of the
+    returned value is same as the argument ``objects``.
+
+    Args:
+        objects(list, ImageAnnotation): Annotation of one image.
+        boxes(ndarray): New boxes.
+        index(ndarray): Indices or boolean mask of kept objects. If None is given, all objects are kept.
+    """
+    if isinstance(objects, ImageAnnotation):
+        return objects.with_boxes(boxes, index)
+    if index is not None:
+        index = np.arange(len(objects))[index]
+        objects = [objects[int(i)] for i in index]
+    return [{
+        "box": list(box),
+        **{k: v for k, v in obj.items() if k != "box"}
+    } for obj, box in zip(objects, np.asarray(boxes).reshape(-1, 4).tolist())]
+
+
+def scale_boxes(objects, sw, sh):
+    """Returns a new annotation whose boxes are scaled by (sw, sh).
+
+    Args:
+        objects(list, ImageAnnotation): Annotation of one image.
+        sw(float): Scale of horizontal axis.
+        sh(float): Scale of vertical axis.
+    """
+    boxes = box_array(objects)
+    boxes *= np.array([sw, sh, sw, sh], dtype=boxes.dtype)
+    return replace_boxes(objects, boxes)
@@ -9,8 +9,16 @@ class Augmentation(object):
     | and is called only when training process is runnning.
     | You could choose augmentation methods from Process module.
 
+    | Each process is applied with its own probability. Random parameters are
+    | drawn from ``numpy.random.Generator`` streams seeded by
+    | ``(seed, epoch, batch index)``, so an augmented batch can be replayed exactly
+    | and distributor workers do not share a random state.
+
     Args:
         process_list (list of Process modules): list of Process modules. You could choose from Flip, Shift, Rotate and WhiteNoise
+            An item can also be a tuple of (process, probability).
+        probability (float): Probability of applying a process whose probability is not given.
+        seed (int): Base seed of the random streams. If None is given, it is drawn from the global numpy random state.
 
     Example:
         >>> from renom_img.api.utility.augmentation import Augmentation
@@ -29,33 +37,111 @@ class Augmentation(object):
         ...     aug,
         ...     num_worker
         ... )
+        >>>
+        >>> # Flip is applied to half of batches, the others to 90% of batches.
+        >>> aug = Augmentation([(Flip(), 0.5), Shift(40, 40)], seed=0)
+        >>> x1, y1 = aug.for_batch(epoch=1, batch=3)(x, y)
+        >>> x2, y2 = aug.for_batch(epoch=1, batch=3)(x, y) # Same result as x1, y1.
 
     """
 
-    def __init__(self, process_list):
-        self._process_list = process_list
-
-    def __call__(self, x, y=None, mode="classification"):
+    def __init__(self, process_list, probability=0.9, seed=None):
+        self._process_list = []
+        self._probability_list = []
+        for process in process_list:
+            if isinstance(process, (tuple, list)):
+                process, prob = process
+            else:
+                prob = probability
+            assert 0 <= prob <= 1, "Probability must be in the range [0, 1]. Actual is {}".format(prob)
+            self._process_list.append(process)
+            self._probability_list.append(prob)
+        if seed is None:
+            seed = int(np.random.randint(2 ** 31 - 1))
+        self.seed = seed
+
+    def __call__(self, x, y=None, mode="classification", epoch=None, batch=None):
         """This function is for applying augmentation to images.
 
         Args:
             x (list of str): List of path of images.
             y (list of annotation): List of annotation results.
+            epoch (int): Epoch index used for seeding.
+            batch (int): Batch index used for seeding.
 
         Returns:
             x (list of numpy.ndarray): List of transformed images.
             y (list of annotation): List of annotation results.
 
         """
-        return self.transform(x, y, mode)
+        return self.transform(x, y, mode, epoch, batch)
+
+    def sample(self, epoch=None, batch=None):
+        """Samples which processes are applied to the batch.
+
+        The returned record can be stored and passed to ``replay`` later to
+        obtain exactly the same augmented batch.
+
+        Args:
+            epoch (int): Epoch index. If both epoch and batch are None, fresh entropy is used.
+            batch (int): Batch index.
+
+        Returns:
+            (dict): Record of the sampled parameters.
+
+            .. code-block :: python
+
+                {
+                    'entropy': (seed, epoch, batch), # Entropy of the random streams.
+                    'applied': [True, False, ...] # Applied flag of each process.
+                }
+
+        """
+        if epoch is None and batch is None:
+            entropy = (self.seed, int(np.random.randint(2 ** 31 - 1)))
+        else:
+            entropy = (self.seed, int(epoch or 0), int(batch or 0))
+        streams = np.random.SeedSequence(entropy).spawn(len(self._process_list) + 1)
+        draw = np.random.default_rng(streams[0]).random(len(self._process_list))
+        return {
+            "entropy": entropy,
+            "applied": [bool(d < p) for d, p in zip(draw, self._probability_list)]
+        }
+
+    def replay(self, x, y=None, record=None, mode="classification"):
+        """Applies augmentation using a record returned by ``sample``.
+
+        Args:
+            x (list of numpy.ndarray): List of images.
+            y (list of annotation): List of annotation for x.
+            record (dict): Record returned by ``sample``.
+            mode (str): Type of task.
+
+        Returns:
+            tupple: list of transformed images and list of annotation for x.
+        """
+        assert_msg = "{} is not supported transformation mode. {} are available."
+        assert mode in MODE, assert_msg.format(mode, MODE)
+        assert len(record["applied"]) == len(self._process_list), \
+            "The record does not match to the process list."
+        # Each process has its own stream. Skipping a process does not change
+        # parameters of the others.
+        streams = np.random.SeedSequence(record["entropy"]).spawn(len(self._process_list) + 1)
+        for process, applied, stream in zip(self._process_list, record["applied"], streams[1:]):
+            if not applied:
+                continue
+            x, y = process(x, y, mode, rng=np.random.default_rng(stream))
+        return x, y
 
-    def transform(self, x, y=None, mode="classification"):
+    def transform(self, x, y=None, mode="classification", epoch=None, batch=None):
         """
         This function is for applying augmentation to ImageDistributor
 
         Args:
             x (list of str): List of path of images.
             y (list of annotation): list of annotation for x. It is only used when prediction.
+            epoch (int): Epoch index used for seeding.
+            batch (int): Batch index used for seeding.
 
         Returns:
             tupple: list of transformed images and list of annotation for x.
@@ -68,10 +154,27 @@ class Augmentation(object):
                 ]
 
         """
-        assert_msg = "{} is not supported transformation mode. {} are available."
-        assert mode in MODE, assert_msg.format(mode, MODE)
-        for process in self._process_list:
-            if np.random.rand() >= 0.9:
-                continue
-            x, y = process(x, y, mode)
-        return x, y
+        return self.replay(x, y, self.sample(epoch, batch), mode)
+
+    def for_batch(self, epoch, batch):
+        """Returns a callable which applies augmentation seeded by (epoch, batch).
+        ImageDistributor passes it to target builders.
+
+        Args:
+            epoch (int): Epoch index.
+            batch (int): Batch index.
+        """
+        return BatchAugmentation(self, epoch, batch)
+
+
+class BatchAugmentation(object):
+    """Augmentation bound to a batch. The sampled parameters are kept as ``record``,
+    therefore the batch can be replayed with ``Augmentation.replay``.
+    """
+
+    def __init__(self, augmentation, epoch, batch):
+        self.augmentation = augmentation
+        self.record = augmentation.sample(epoch, batch)
+
+    def __call__(self, x, y=None, mode="classification"):
+        return self.augmentation.replay(x, y, self.record, mode)
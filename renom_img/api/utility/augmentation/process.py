@@ -1,7 +1,9 @@
+import threading
 import numpy as np
 from PIL import Image
 from scipy.ndimage.interpolation import map_coordinates
 from scipy.ndimage.filters import gaussian_filter
+from renom_img.api.utility.annotation import box_array, replace_boxes
 
 MODE = [
     "classification",
@@ -13,6 +15,10 @@ MODE = [
 class ProcessBase(object):
     """Base class for applying augmentation to images.
 
+    Random parameters of a process are drawn from ``numpy.random.Generator``
+    given to ``transform``. The generator is kept per thread, therefore one
+    process instance can be shared by distributor workers.
+
     Note:
         X and Y must be resized as specified img size.
     """
@@ -20,20 +26,54 @@ class ProcessBase(object):
     def __init__(self):
         pass
 
-    def __call__(self, x, y=None, mode="classification"):
-        return self.transform(x, y, mode)
+    def __call__(self, x, y=None, mode="classification", rng=None):
+        return self.transform(x, y, mode, rng)
 
-    def transform(self, x, y=None, mode="classification"):
+    def transform(self, x, y=None, mode="classification", rng=None):
+        """
+        Args:
+            x (list of numpy.ndarray): List of images.
+            y (list): List of labels.
+            mode (str): One of 'classification', 'detection' and 'segmentation'.
+            rng (numpy.random.Generator): Generator used for sampling parameters.
+                If None is given, a generator seeded from the global numpy random state is used.
+        """
         assert_msg = "{} is not supported transformation mode. {} are available."
         assert mode in MODE, assert_msg.format(mode, MODE)
 
-        if mode == MODE[0]:
-            # Returns only x.
-            return self._transform_classification(x, y)
-        elif mode == MODE[1]:
-            return self._transform_detection(x, y)
-        elif mode == MODE[2]:
-            return self._transform_segmentation(x, y)
+        if rng is None:
+            rng = np.random.default_rng(np.random.randint(2 ** 31 - 1))
+        local = self._local_state()
+        prev_rng = getattr(local, "rng", None)
+        local.rng = rng
+        try:
+            if mode == MODE[0]:
+                # Returns only x.
+                return self._transform_classification(x, y)
+            elif mode == MODE[1]:
+                return self._transform_detection(x, y)
+            elif mode == MODE[2]:
+                return self._transform_segmentation(x, y)
+        finally:
+            local.rng = prev_rng
+
+    def _local_state(self):
+        # Created lazily because some subclasses do not call ProcessBase.__init__.
+        local = self.__dict__.get("_local", None)
+        if local is None:
+            local = self.__dict__.setdefault("_local", threading.local())
+        return local
+
+    @property
+    def _rng(self):
+        rng = getattr(self._local_state(), "rng", None)
+        if rng is None:
+            rng = np.random.default_rng(np.random.randint(2 ** 31 - 1))
+        return rng
+
+    def _choice(self, options):
+        """Returns an element of options. Unlike ``Generator.choice``, options can contain tuples and None."""
+        return options[int(self._rng.integers(len(options)))]
 
     def _transform_classification(self, x, y):
         """Format must be 1d array or list of integer."""
@@ -57,7 +97,7 @@ class Flip(ProcessBase):
         n = len(x)
         img_list = []
         for i in range(n):
-            f = np.random.randint(3)
+            f = self._rng.integers(3)
             if f == 0:
                 img_list.append(x[i][:, :, :])
             elif f == 1:
@@ -73,7 +113,7 @@ class Flip(ProcessBase):
         new_y = []
 
         for i in range(n):
-            f = np.random.randint(3)
+            f = self._rng.integers(3)
             if f == 0:
                 img_list.append(x[i])
                 new_y.append(y[i])
@@ -81,32 +121,16 @@ class Flip(ProcessBase):
                 # Horizontal flip.
                 c_x = x[i].shape[2] // 2
                 img_list.append(x[i][:, :, ::-1])
-                new_y.append([
-                    {
-                        "box": [
-                            (2 * c_x - obj["box"][0]),
-                            obj["box"][1],
-                            obj["box"][2],
-                            obj["box"][3],
-                        ],
-                        **{k: v for k, v in obj.items() if k != 'box'}
-                    }
-                    for j, obj in enumerate(y[i])])
+                boxes = box_array(y[i])
+                boxes[:, 0] = 2 * c_x - boxes[:, 0]
+                new_y.append(replace_boxes(y[i], boxes))
 
             elif f == 2:
                 c_y = x[i].shape[1] // 2
                 img_list.append(x[i][:, ::-1, :])
-                new_y.append([
-                    {
-                        "box": [
-                            obj["box"][0],
-                            (2 * c_y - obj["box"][1]),
-                            obj["box"][2],
-                            obj["box"][3],
-                        ],
-                        **{k: v for k, v in obj.items() if k != 'box'}
-                    }
-                    for j, obj in enumerate(y[i])])
+                boxes = box_array(y[i])
+                boxes[:, 1] = 2 * c_y - boxes[:, 1]
+                new_y.append(replace_boxes(y[i], boxes))
         return img_list, new_y
 
     def _transform_segmentation(self, x, y):
@@ -115,7 +139,7 @@ class Flip(ProcessBase):
         img_list = []
         new_y = []
         for i in range(n):
-            f = np.random.randint(3)
+            f = self._rng.integers(3)
             if f == 0:
                 img_list.append(x[i][:, :, :])
                 new_y.append(y[i][:, :, :])
@@ -168,7 +192,7 @@ class HorizontalFlip(ProcessBase):
         n = len(x)
         img_list = []
         for i in range(n):
-            f = np.random.randint(2) if self.prob else 1
+            f = self._rng.integers(2) if self.prob else 1
             if f == 0:
                 img_list.append(x[i][:, :, :])
             elif f == 1:
@@ -180,32 +204,24 @@ class HorizontalFlip(ProcessBase):
         new_x = []
         new_y = []
         for i in range(n):
-            f = np.random.randint(2) if self.prob else 1
+            f = self._rng.integers(2) if self.prob else 1
             if f == 0:
                 new_x.append(x[i])
                 new_y.append(y[i])
             else:
                 new_x.append(x[i][:, :, ::-1])
                 c_x = x[i].shape[2] // 2
-                new_y.append([
-                    {
-                        "box": [
-                            (2 * c_x - obj["box"][0]),
-                            obj["box"][1],
-                            obj["box"][2],
-                            obj["box"][3],
-                        ],
-                        **{k: v for k, v in obj.items() if k != 'box'}
-                    }
-                    for j, obj in enumerate(y[i])])
-            return new_x, new_y
+                boxes = box_array(y[i])
+                boxes[:, 0] = 2 * c_x - boxes[:, 0]
+                new_y.append(replace_boxes(y[i], boxes))
+        return new_x, new_y
 
     def _transform_segmentation(self, x, y):
         n = len(x)
         img_list = []
         new_y = []
         for i in range(n):
-            f = np.random.randint(2) if self.prob else 1
+            f = self._rng.integers(2) if self.prob else 1
             if f == 0:
                 img_list.append(x[i][:, :, :])
                 new_y.append(y[i][:, :, :])
@@ -255,7 +271,7 @@ class VerticalFlip(ProcessBase):
         n = len(x)
         img_list = []
         for i in range(n):
-            f = np.random.randint(2) if self.prob else 1
+            f = self._rng.integers(2) if self.prob else 1
             if f == 0:
                 img_list.append(x[i][:, :, :])
             elif f == 1:
@@ -267,32 +283,24 @@ class VerticalFlip(ProcessBase):
         new_x = []
         new_y = []
         for i in range(n):
-            f = np.random.randint(2) if self.prob else 1
+            f = self._rng.integers(2) if self.prob else 1
             if f == 0:
                 new_x.append(x[i])
                 new_y.append(y[i])
             else:
                 c_y = x[i].shape[1] // 2
                 new_x.append(x[i][:, ::-1, :])
-                new_y.append([
-                    {
-                        "box": [
-                            obj["box"][0],
-                            (2 * c_y - obj["box"][1]),
-                            obj["box"][2],
-                            obj["box"][3],
-                        ],
-                        **{k: v for k, v in obj.items() if k != 'box'}
-                    }
-                    for j, obj in enumerate(y[i])])
-            return new_x, new_y
+                boxes = box_array(y[i])
+                boxes[:, 1] = 2 * c_y - boxes[:, 1]
+                new_y.append(replace_boxes(y[i], boxes))
+        return new_x, new_y
 
     def _transform_segmentation(self, x, y):
         n = len(x)
         img_list = []
         new_y = []
         for i in range(n):
-            f = np.random.randint(2) if self.prob else 1
+            f = self._rng.integers(2) if self.prob else 1
             if f == 0:
                 img_list.append(x[i][:, :, :])
                 new_y.append(y[i][:, :, :])
@@ -358,8 +366,8 @@ class RandomCrop(ProcessBase):
                         mode='constant', constant_values=0)
             _h = _x.shape[1]  # changed height
             _w = _x.shape[2]  # changed width
-            top = np.random.randint(0, _h - h)
-            left = np.random.randint(0, _w - w)
+            top = self._rng.integers(0, _h - h)
+            left = self._rng.integers(0, _w - w)
 
             img_list.append(_x[:, top:top + h, left:left + w])
 
@@ -385,6 +393,22 @@ class RandomCrop(ProcessBase):
         else:
             return False
 
+    def _crop_boxes(self, objects, left, top, sw, sh, min_overlap=None):
+        """Returns objects whose centers are in the cropped region. Boxes are
+        clipped to the region and moved to its coordinate.
+        """
+        boxes = box_array(objects)
+        ox, oy, ow, oh = boxes.T
+        inside = (ox > left) & (ox < left + sw) & (oy > top) & (oy < top + sh)
+        overlap, px, py, pw, ph = self.jaccard_overlap(left, top, left + sw, top + sh,
+                                                       ox - (ow / 2), oy - (oh / 2), ox + (ow / 2), oy + (oh / 2))
+        if min_overlap is not None:
+            inside &= overlap >= min_overlap
+        pw = np.clip(pw, 0, left + sw)
+        ph = np.clip(ph, 0, top + sh)
+        cropped = np.stack([px, py, pw, ph], axis=1)[inside]
+        return replace_boxes(objects, cropped, inside)
+
     def _transform_detection(self, x, y):  # according to ssd paper
         # assert len(x.shape) == 4
         n = len(x)
@@ -392,7 +416,7 @@ class RandomCrop(ProcessBase):
         new_y = []
         for i in range(n):
             # considering the following choice for whole batch can speed the calculation
-            choice = np.random.choice(self.sample_options)
+            choice = self._choice(self.sample_options)
             c, h, w = x[i].shape
             if choice == None:
                 # print('original image')
@@ -400,14 +424,13 @@ class RandomCrop(ProcessBase):
                 new_y.append(y[i])
             elif choice[0] is not None:
                 # print('iou case')
-                temp_y = []
                 min = choice[0]
                 success = False
                 counter = 0
                 iou_counter = 0
                 while (not success):
-                    sw = int(np.random.uniform(0.3 * w, w))
-                    sh = int(np.random.uniform(0.3 * h, h))
+                    sw = int(self._rng.uniform(0.3 * w, w))
+                    sh = int(self._rng.uniform(0.3 * h, h))
                     if sw / sh < 0.5 or sw / sh > 2:
                         iou_counter += 1
                         if iou_counter > 20:
@@ -415,40 +438,28 @@ class RandomCrop(ProcessBase):
                             new_y.append(y[i])
                             success = True
                         continue
-                    left = int(np.random.uniform(w - sw))
-                    top = int(np.random.uniform(h - sh))
-                    for j, obj in enumerate(y[i]):
-                        ox, oy, ow, oh = obj["box"]
-                        if self.check_point(left, top, left + sw, top + sh, ox, oy):
-                            overlap, px, py, pw, ph = self.jaccard_overlap(left, top, left + sw, top + sh,
-                                                                           ox - (ow / 2), oy - (oh / 2), ox + (ow / 2), oy + (oh / 2))
-                            if overlap >= min:
-                                pw = np.clip(pw, 0, left + sw)
-                                ph = np.clip(ph, 0, top + sh)
-                                temp_y.append({
-                                    "box": [px, py, pw, ph],
-                                    **{k: v for k, v in obj.items() if k != 'box'}
-                                })
+                    left = int(self._rng.uniform(w - sw))
+                    top = int(self._rng.uniform(h - sh))
+                    temp_y = self._crop_boxes(y[i], left, top, sw, sh, min)
                     if len(temp_y) > 0:
                         success = True
                         img_list.append(x[i][:, top:top + sh, left:left + sw])
                         new_y.append(temp_y)
                     else:
                         counter += 1
-                        if counter > 50 or np.random.rand() >= 0.85:
+                        if counter > 50 or self._rng.random() >= 0.85:
                             success = True
                             img_list.append(x[i])
                             new_y.append(y[i])
 
             else:
                 # print('random case')
-                temp_y = []
                 success = False
                 counter = 0
                 random_counter = 0
                 while (not success):
-                    sw = int(np.random.uniform(0.3 * w, w))
-                    sh = int(np.random.uniform(0.3 * h, h))
+                    sw = int(self._rng.uniform(0.3 * w, w))
+                    sh = int(self._rng.uniform(0.3 * h, h))
 
                     if sw / sh < 0.5 or sw / sh > 2:
                         random_counter += 1
@@ -457,20 +468,10 @@ class RandomCrop(ProcessBase):
                             new_y.append(y[i])
                             success = True
                         continue
-                    left = int(np.random.uniform(w - sw))
-                    top = int(np.random.uniform(h - sh))
-
-                    for j, obj in enumerate(y[i]):
-                        ox, oy, ow, oh = obj["box"]
-                        if self.check_point(left, top, left + sw, top + sh, ox, oy):
-                            overlap, px, py, pw, ph = self.jaccard_overlap(left, top, left + sw, top + sh,
-                                                                           ox - (ow / 2), oy - (oh / 2), ox + (ow / 2), oy + (oh / 2))
-                            pw = np.clip(pw, 0, left + sw)
-                            ph = np.clip(ph, 0, top + sh)
-                            temp_y.append({
-                                "box": [px, py, pw, ph],
-                                **{k: v for k, v in obj.items() if k != 'box'}
-                            })
+                    left = int(self._rng.uniform(w - sw))
+                    top = int(self._rng.uniform(h - sh))
+
+                    temp_y = self._crop_boxes(y[i], left, top, sw, sh)
                     if len(temp_y) > 0:
                         success = True
                         img_list.append(x[i][:, top:top + sh, left:left + sw])
@@ -500,8 +501,8 @@ class RandomCrop(ProcessBase):
             _h = _x.shape[1]  # changed height
             _w = _x.shape[2]  # changed width
 
-            top = np.random.randint(0, _h - h)
-            left = np.random.randint(0, _w - w)
+            top = self._rng.integers(0, _h - h)
+            left = self._rng.integers(0, _w - w)
 
             img_list.append(_x[:, top:top + h, left:left + w])
             new_y.append(_y[:, top:top + h, left:left + w])
@@ -578,7 +579,6 @@ class CenterCrop(ProcessBase):
         new_y = []
         for i in range(n):
             c, h, w = x[i].shape
-            temp_y = []
             assert self.size[0] < w and self.size[1] < h, 'crop size should be smaller than original image size'
             left = np.ceil((w - self.size[0]) / 2.).astype(int)
             top = np.ceil((h - self.size[1]) / 2.).astype(int)
@@ -586,17 +586,12 @@ class CenterCrop(ProcessBase):
             bottom = np.floor((h + self.size[1]) / 2.).astype(int)
             img = x[i][:, top:bottom, left:right]
 
-            for j, obj in enumerate(y[i]):
-                ox, oy, ow, oh = obj["box"]
-                # print(ox,oy,ow,oh)
-                if self.check_point(left, top, right, bottom, ox, oy):
-                    px, py, pw, ph = self.cal_overlap(
-                        left, top, right, bottom, ox - ow / 2, oy - oh / 2, ox + ow / 2, oy + oh / 2)
-                    # print(px,py,pw,ph)
-                    temp_y.append({
-                        "box": [px, py, pw, ph],
-                        **{k: v for k, v in obj.items() if k != 'box'}
-                    })
+            boxes = box_array(y[i])
+            ox, oy, ow, oh = boxes.T
+            inside = (ox > left) & (ox < right) & (oy > top) & (oy < bottom)
+            px, py, pw, ph = self.cal_overlap(
+                left, top, right, bottom, ox - ow / 2, oy - oh / 2, ox + ow / 2, oy + oh / 2)
+            temp_y = replace_boxes(y[i], np.stack([px, py, pw, ph], axis=1)[inside], inside)
             if len(temp_y) > 0:
                 new_x.append(img)
                 new_y.append(temp_y)
@@ -641,8 +636,8 @@ class Shift(ProcessBase):
         for i in range(n):
             c, h, w = x[i].shape
             new_x = np.zeros_like(np.asarray(x[i]))
-            rand_h = ((np.random.rand(1) * 2 - 1) * self._h).astype(np.int)
-            rand_v = ((np.random.rand(1) * 2 - 1) * self._v).astype(np.int)
+            rand_h = ((self._rng.random(1) * 2 - 1) * self._h).astype(np.int)
+            rand_v = ((self._rng.random(1) * 2 - 1) * self._v).astype(np.int)
 
             new_min_x = np.clip(rand_h, 0, w)
             new_min_y = np.clip(rand_v, 0, h)
@@ -670,8 +665,8 @@ class Shift(ProcessBase):
                 c, h, w = x[i].shape
                 new_x = np.zeros_like(np.asarray(x[i]))
 
-                rand_h = ((np.random.rand(1) * 2 - 1) * self._h).astype(np.int)
-                rand_v = ((np.random.rand(1) * 2 - 1) * self._v).astype(np.int)
+                rand_h = ((self._rng.random(1) * 2 - 1) * self._h).astype(np.int)
+                rand_v = ((self._rng.random(1) * 2 - 1) * self._v).astype(np.int)
 
                 new_min_x = np.clip(rand_h, 0, w)
                 new_min_y = np.clip(rand_v, 0, h)
@@ -685,24 +680,18 @@ class Shift(ProcessBase):
 
                 new_x[:, new_min_y[0]: new_max_y[0], new_min_x[0]:new_max_x[0]] = \
                     x[i][:, orig_min_y[0]:orig_max_y[0], orig_min_x[0]:orig_max_x[0]]
-                ny = []
-                for j, obj in enumerate(y[i]):
-                    pw = obj["box"][2]
-                    ph = obj["box"][3]
-                    px1 = np.clip(obj["box"][0] - pw / 2. + rand_h[0], 0, w - 1)
-                    py1 = np.clip(obj["box"][1] - ph / 2. + rand_v[0], 0, h - 1)
-                    px2 = np.clip(obj["box"][0] + pw / 2. + rand_h[0], 0, w - 1)
-                    py2 = np.clip(obj["box"][1] + ph / 2. + rand_v[0], 0, h - 1)
-                    pw = px2 - px1
-                    ph = py2 - py1
-                    if pw == 0 or ph == 0:
-                        continue
-                    px = px1 + pw / 2.
-                    py = py1 + ph / 2.
-                    ny.append({
-                        "box": [px, py, pw, ph],
-                        **{k: v for k, v in obj.items() if k != 'box'}
-                    })
+                boxes = box_array(y[i])
+                pw = boxes[:, 2]
+                ph = boxes[:, 3]
+                px1 = np.clip(boxes[:, 0] - pw / 2. + rand_h[0], 0, w - 1)
+                py1 = np.clip(boxes[:, 1] - ph / 2. + rand_v[0], 0, h - 1)
+                px2 = np.clip(boxes[:, 0] + pw / 2. + rand_h[0], 0, w - 1)
+                py2 = np.clip(boxes[:, 1] + ph / 2. + rand_v[0], 0, h - 1)
+                pw = px2 - px1
+                ph = py2 - py1
+                keep = (pw != 0) & (ph != 0)
+                shifted = np.stack([px1 + pw / 2., py1 + ph / 2., pw, ph], axis=1)
+                ny = replace_boxes(y[i], shifted[keep], keep)
                 if len(ny) > 0:
                     success = True
                     new_y.append(ny)
@@ -719,8 +708,8 @@ class Shift(ProcessBase):
             c, h, w = x[i].shape
             new_x = np.zeros_like(np.asarray(x[i]))
             new_y = np.zeros_like(np.asarray(y[i]))
-            rand_h = ((np.random.rand(1) * 2 - 1) * self._h).astype(np.int)
-            rand_v = ((np.random.rand(1) * 2 - 1) * self._v).astype(np.int)
+            rand_h = ((self._rng.random(1) * 2 - 1) * self._h).astype(np.int)
+            rand_v = ((self._rng.random(1) * 2 - 1) * self._v).astype(np.int)
 
             new_min_x = np.clip(rand_h, 0, w)
             new_min_y = np.clip(rand_v, 0, h)
@@ -784,10 +773,10 @@ class Rotate(ProcessBase):
             c, h, w = x[i].shape
             if h == w:
                 # 0, 90, 180 or 270 degree.
-                r = np.random.randint(4)
+                r = self._rng.integers(4)
             else:
                 # 0 or 180 degree.
-                r = np.random.randint(2) * 2
+                r = self._rng.integers(2) * 2
 
             img_list.append(np.rot90(x[i], r, axes=(1, 2)))
 
@@ -803,49 +792,23 @@ class Rotate(ProcessBase):
             c_w = w // 2
             c_h = h // 2
             if w == h:
-                r = np.random.randint(4)
+                r = self._rng.integers(4)
             else:
-                r = np.random.randint(2) * 2
+                r = self._rng.integers(2) * 2
 
             img_list.append(np.rot90(x[i], r, axes=(1, 2)))
             if r == 0:
                 new_y.append(y[i])
-            elif r == 1:
-                new_y.append([
-                    {
-                        "box": [
-                            obj["box"][1],
-                            (2 * c_h - obj["box"][0]),
-                            obj["box"][3],
-                            obj["box"][2],
-                        ],
-                        **{k: v for k, v in obj.items() if k != 'box'}
-                    }
-                    for j, obj in enumerate(y[i])])
+                continue
+            boxes = box_array(y[i])
+            bx, by, bw, bh = boxes.T
+            if r == 1:
+                rotated = [by, 2 * c_h - bx, bh, bw]
             elif r == 2:
-                new_y.append([
-                    {
-                        "box": [
-                            (2 * c_w - obj["box"][0]),
-                            (2 * c_h - obj["box"][1]),
-                            obj["box"][2],
-                            obj["box"][3],
-                        ],
-                        **{k: v for k, v in obj.items() if k != 'box'}
-                    }
-                    for j, obj in enumerate(y[i])])
+                rotated = [2 * c_w - bx, 2 * c_h - by, bw, bh]
             elif r == 3:
-                new_y.append([
-                    {
-                        "box": [
-                            (2 * c_w - obj["box"][1]),
-                            obj["box"][0],
-                            obj["box"][3],
-                            obj["box"][2],
-                        ],
-                        **{k: v for k, v in obj.items() if k != 'box'}
-                    }
-                    for j, obj in enumerate(y[i])])
+                rotated = [2 * c_w - by, bx, bh, bw]
+            new_y.append(replace_boxes(y[i], np.stack(rotated, axis=1)))
         return img_list, new_y
 
     def _transform_segmentation(self, x, y):
@@ -857,10 +820,10 @@ class Rotate(ProcessBase):
             c, h, w = x[i].shape
             if h == w:
                 # 0, 90, 180 or 270 degree.
-                r = np.random.randint(4)
+                r = self._rng.integers(4)
             else:
                 # 0 or 180 degree.
-                r = np.random.randint(2) * 2
+                r = self._rng.integers(2) * 2
             new_x.append(np.rot90(x[i], r, axes=(1, 2)))
             new_y.append(np.rot90(y[i], r, axes=(1, 2)))
         return new_x, new_y
@@ -906,7 +869,7 @@ class WhiteNoise(ProcessBase):
         img_list = []
         n = len(x)
         for i in range(n):
-            img_list.append(x[i] + self._std * np.random.randn(*x[i].shape))
+            img_list.append(x[i] + self._std * self._rng.standard_normal(x[i].shape))
         return img_list, y
 
     def _transform_detection(self, x, y):
@@ -914,7 +877,7 @@ class WhiteNoise(ProcessBase):
         img_list = []
         n = len(x)
         for i in range(n):
-            img_list.append(x[i] + self._std * np.random.randn(*x[i].shape))
+            img_list.append(x[i] + self._std * self._rng.standard_normal(x[i].shape))
         return img_list, y
 
     def _transform_segmentation(self, x, y):
@@ -922,7 +885,7 @@ class WhiteNoise(ProcessBase):
         img_list = []
         n = len(x)
         for i in range(n):
-            img_list.append(x[i] + self._std * np.random.randn(*x[i].shape))
+            img_list.append(x[i] + self._std * self._rng.standard_normal(x[i].shape))
         return img_list, y
 
 
@@ -963,24 +926,27 @@ class Distortion(ProcessBase):
                             (1201, 10),
                             (1501, 12),
                             (991, 8))
+
+    def _random_field(self, shape):
         if self.random_state is None:
-            self.random_state = np.random.RandomState(None)
+            return self._rng.random(shape)
+        return self.random_state.rand(*shape)
 
     def _transform_classification(self, x, y):
         n = len(x)
         new_x = []
         for i in range(n):
-            choice = np.random.choice(self.choice_list)
+            choice = self._choice(self.choice_list)
             if choice is None:
                 new_x.append(x[i])
             else:
-                self.alpha, self.sigma = choice[0], choice[1]
+                alpha, sigma = choice[0], choice[1]
                 img = x[i]
                 shape = img.shape
-                dx = gaussian_filter((self.random_state.rand(*shape) * 2 - 1),
-                                     self.sigma, mode='constant', cval=0) * self.alpha
-                dy = gaussian_filter((self.random_state.rand(*shape) * 2 - 1),
-                                     self.sigma, mode='constant', cval=0) * self.alpha
+                dx = gaussian_filter((self._random_field(shape) * 2 - 1),
+                                     sigma, mode='constant', cval=0) * alpha
+                dy = gaussian_filter((self._random_field(shape) * 2 - 1),
+                                     sigma, mode='constant', cval=0) * alpha
 
                 ax, ay, z = np.meshgrid(np.arange(shape[1]), np.arange(
                     shape[0]), np.arange(shape[2]))
@@ -997,19 +963,19 @@ class Distortion(ProcessBase):
         n = len(x)
         new_x = []
         for i in range(n):
-            choice = np.random.choice(self.choice_list)
+            choice = self._choice(self.choice_list)
             if choice is None:
                 # print('return original')
                 new_x.append(x[i])
             else:
                 # print('distorted')
-                self.alpha, self.sigma = choice[0], choice[1]
+                alpha, sigma = choice[0], choice[1]
                 img = x[i]
                 shape = img.shape
-                dx = gaussian_filter((self.random_state.rand(*shape) * 2 - 1),
-                                     self.sigma, mode='constant', cval=0) * self.alpha
-                dy = gaussian_filter((self.random_state.rand(*shape) * 2 - 1),
-                                     self.sigma, mode='constant', cval=0) * self.alpha
+                dx = gaussian_filter((self._random_field(shape) * 2 - 1),
+                                     sigma, mode='constant', cval=0) * alpha
+                dy = gaussian_filter((self._random_field(shape) * 2 - 1),
+                                     sigma, mode='constant', cval=0) * alpha
 
                 ax, ay, z = np.meshgrid(np.arange(shape[1]), np.arange(
                     shape[0]), np.arange(shape[2]))
@@ -1027,20 +993,20 @@ class Distortion(ProcessBase):
         new_x = []
         new_y = []
         for i in range(n):
-            choice = np.random.choice(self.choice_list)
+            choice = self._choice(self.choice_list)
             if choice is None:
                 # print('return original')
                 new_x.append(x[i])
                 new_y.append(y[i])
             else:
                 # print('distorted')
-                self.alpha, self.sigma = choice[0], choice[1]
+                alpha, sigma = choice[0], choice[1]
                 img = x[i]
                 shape = img.shape
-                dx = gaussian_filter((self.random_state.rand(*shape) * 2 - 1),
-                                     self.sigma, mode='constant', cval=0) * self.alpha
-                dy = gaussian_filter((self.random_state.rand(*shape) * 2 - 1),
-                                     self.sigma, mode='constant', cval=0) * self.alpha
+                dx = gaussian_filter((self._random_field(shape) * 2 - 1),
+                                     sigma, mode='constant', cval=0) * alpha
+                dy = gaussian_filter((self._random_field(shape) * 2 - 1),
+                                     sigma, mode='constant', cval=0) * alpha
 
                 ax, ay, z = np.meshgrid(np.arange(shape[1]), np.arange(
                     shape[0]), np.arange(shape[2]))
@@ -1054,10 +1020,10 @@ class Distortion(ProcessBase):
 
                 label = y[i]
                 shape = label.shape
-                dx = gaussian_filter((self.random_state.rand(*shape) * 2 - 1),
-                                     self.sigma, mode='constant', cval=0) * self.alpha
-                dy = gaussian_filter((self.random_state.rand(*shape) * 2 - 1),
-                                     self.sigma, mode='constant', cval=0) * self.alpha
+                dx = gaussian_filter((self._random_field(shape) * 2 - 1),
+                                     sigma, mode='constant', cval=0) * alpha
+                dy = gaussian_filter((self._random_field(shape) * 2 - 1),
+                                     sigma, mode='constant', cval=0) * alpha
 
                 ax, ay, z = np.meshgrid(np.arange(shape[1]), np.arange(
                     shape[0]), np.arange(shape[2]))
@@ -1087,9 +1053,9 @@ class Jitter(ProcessBase):
         raise NotImplementedError
         N = len(x)
         dim0 = np.arange(N)
-        scale_h = np.random.uniform(0.9, 1.1)
-        scale_s = np.random.uniform(0.9, 1.1)
-        scale_v = np.random.uniform(0.9, 1.1)
+        scale_h = self._rng.uniform(0.9, 1.1)
+        scale_s = self._rng.uniform(0.9, 1.1)
+        scale_v = self._rng.uniform(0.9, 1.1)
         new_x = np.zeros_like(x)
         max_color_index = np.argmax(x, axis=1)
         max_color = x[(dim0, max_color_index)]
@@ -1111,9 +1077,9 @@ class Jitter(ProcessBase):
         raise NotImplementedError
         N = len(x)
         dim0 = np.arange(N)
-        scale_h = np.random.uniform(0.9, 1.1)
-        scale_s = np.random.uniform(0.9, 1.1)
-        scale_v = np.random.uniform(0.9, 1.1)
+        scale_h = self._rng.uniform(0.9, 1.1)
+        scale_s = self._rng.uniform(0.9, 1.1)
+        scale_v = self._rng.uniform(0.9, 1.1)
         new_x = np.zeros_like(x)
         max_color_index = np.argmax(x, axis=1)
         max_color = x[(dim0, max_color_index)]
@@ -1135,9 +1101,9 @@ class Jitter(ProcessBase):
         raise NotImplementedError
         N = len(x)
         dim0 = np.arange(N)
-        scale_h = np.random.uniform(0.9, 1.1)
-        scale_s = np.random.uniform(0.9, 1.1)
-        scale_v = np.random.uniform(0.9, 1.1)
+        scale_h = self._rng.uniform(0.9, 1.1)
+        scale_s = self._rng.uniform(0.9, 1.1)
+        scale_v = self._rng.uniform(0.9, 1.1)
         new_x = np.zeros_like(x)
         max_color_index = np.argmax(x, axis=1)
         max_color = x[(dim0, max_color_index)]
@@ -1165,7 +1131,7 @@ class ContrastNorm(ProcessBase):
 
     def _draw_sample(self, size=1):
         if isinstance(self._alpha, list):
-            return np.random.uniform(self._alpha[0], self._alpha[1], size)
+            return self._rng.uniform(self._alpha[0], self._alpha[1], size)
         else:
             return self._alpha
 
@@ -1267,8 +1233,8 @@ class RandomBrightness(ProcessBase):
         n = len(x)
         img_list = []
         for i in range(n):
-            if np.random.randint(2):
-                delta = np.random.uniform(-self._delta, self._delta)
+            if self._rng.integers(2):
+                delta = self._rng.uniform(-self._delta, self._delta)
                 x[i] = x[i] + delta
                 img_list.append(np.clip(x[i], 0, 255))
             else:
@@ -1281,8 +1247,8 @@ class RandomBrightness(ProcessBase):
         n = len(x)
         img_list = []
         for i in range(n):
-            if np.random.randint(2):
-                delta = np.random.uniform(-self._delta, self._delta)
+            if self._rng.integers(2):
+                delta = self._rng.uniform(-self._delta, self._delta)
                 x[i] = x[i] + delta
                 img_list.append(np.clip(x[i], 0, 255))
             else:
@@ -1295,8 +1261,8 @@ class RandomBrightness(ProcessBase):
         n = len(x)
         img_list = []
         for i in range(n):
-            if np.random.randint(2):
-                delta = np.random.uniform(-self._delta, self._delta)
+            if self._rng.integers(2):
+                delta = self._rng.uniform(-self._delta, self._delta)
                 x[i] = x[i] + delta
                 img_list.append(np.clip(x[i], 0, 255))
             else:
@@ -1327,7 +1293,7 @@ class RandomHue(ProcessBase):
         n = len(x)
         img_list = []
         for i in range(n):
-            alpha = np.random.uniform(-self.max_delta, self.max_delta)
+            alpha = self._rng.uniform(-self.max_delta, self.max_delta)
             u = np.cos(alpha * np.pi)
             w = np.sin(alpha * np.pi)
             bt = np.array([[1.0, 0.0, 0.0],
@@ -1343,7 +1309,7 @@ class RandomHue(ProcessBase):
         n = len(x)
         img_list = []
         for i in range(n):
-            alpha = np.random.uniform(-self.max_delta, self.max_delta)
+            alpha = self._rng.uniform(-self.max_delta, self.max_delta)
             u = np.cos(alpha * np.pi)
             w = np.sin(alpha * np.pi)
             bt = np.array([[1.0, 0.0, 0.0],
@@ -1359,7 +1325,7 @@ class RandomHue(ProcessBase):
         n = len(x)
         img_list = []
         for i in range(n):
-            alpha = np.random.uniform(-self.max_delta, self.max_delta)
+            alpha = self._rng.uniform(-self.max_delta, self.max_delta)
             u = np.cos(alpha * np.pi)
             w = np.sin(alpha * np.pi)
             bt = np.array([[1.0, 0.0, 0.0],
@@ -1387,7 +1353,7 @@ class RandomSaturation(ProcessBase):
         n = len(x)
         img_list = []
         for i in range(n):
-            alpha = 1.0 + np.random.uniform(-self.ratio, self.ratio)
+            alpha = 1.0 + self._rng.uniform(-self.ratio, self.ratio)
             gray = x[i].transpose(1, 2, 0) * self.coef
             gray = np.sum(gray, axis=2, keepdims=True)
             gray *= (1.0 - alpha)
@@ -1401,7 +1367,7 @@ class RandomSaturation(ProcessBase):
         n = len(x)
         img_list = []
         for i in range(n):
-            alpha = 1.0 + np.random.uniform(-self.ratio, self.ratio)
+            alpha = 1.0 + self._rng.uniform(-self.ratio, self.ratio)
             gray = x[i].transpose(1, 2, 0) * self.coef
             gray = np.sum(gray, axis=2, keepdims=True)
             gray *= (1.0 - alpha)
@@ -1415,7 +1381,7 @@ class RandomSaturation(ProcessBase):
         n = len(x)
         img_list = []
         for i in range(n):
-            alpha = 1.0 + np.random.uniform(-self.ratio, self.ratio)
+            alpha = 1.0 + self._rng.uniform(-self.ratio, self.ratio)
             gray = x[i].transpose(1, 2, 0) * self.coef
             gray = np.sum(gray, axis=2, keepdims=True)
             gray *= (1.0 - alpha)
@@ -1441,7 +1407,7 @@ class RandomLighting(ProcessBase):
         n = len(x)
         img_list = []
         for i in range(n):
-            choice = np.random.choice(self.choice)
+            choice = self._choice(self.choice)
             if choice == None:
                 choice = (0, 1, 2)
             new_x = np.empty_like(x[i])
@@ -1456,7 +1422,7 @@ class RandomLighting(ProcessBase):
         n = len(x)
         img_list = []
         for i in range(n):
-            choice = np.random.choice(self.choice)
+            choice = self._choice(self.choice)
             if choice == None:
                 choice = (0, 1, 2)
             new_x = np.empty_like(x[i])
@@ -1471,7 +1437,7 @@ class RandomLighting(ProcessBase):
         n = len(x)
         img_list = []
         for i in range(n):
-            choice = np.random.choice(self.choice)
+            choice = self._choice(self.choice)
             if choice == None:
                 choice = (0, 1, 2)
             new_x = np.empty_like(x[i])
@@ -1496,9 +1462,9 @@ class RandomExpand(ProcessBase):
         img_list = []
         for i in range(n):
             c, h, w = x[i].shape
-            ratio = np.random.uniform(1, 4)
-            left = np.random.uniform(0, w * ratio - w)
-            top = np.random.uniform(0, h * ratio - h)
+            ratio = self._rng.uniform(1, 4)
+            left = self._rng.uniform(0, w * ratio - w)
+            top = self._rng.uniform(0, h * ratio - h)
             expand_image = np.zeros((c, int(h * ratio), int(w * ratio)), dtype=x[i].dtype)
             expand_image[:, :, :] = np.mean(x[i])
             expand_image[:, int(top):int(top + h),
@@ -1512,23 +1478,19 @@ class RandomExpand(ProcessBase):
         img_list = []
         new_y = []
         for i in range(n):
-            ny = []
             c, h, w = x[i].shape
-            ratio = np.random.uniform(1, 4)
-            left = np.random.uniform(0, w * ratio - w)
-            top = np.random.uniform(0, h * ratio - h)
+            ratio = self._rng.uniform(1, 4)
+            left = self._rng.uniform(0, w * ratio - w)
+            top = self._rng.uniform(0, h * ratio - h)
             expand_image = np.zeros((c, int(h * ratio), int(w * ratio)), dtype=x[i].dtype)
             expand_image[:, :, :] = np.mean(x[i])
             expand_image[:, int(top):int(top + h),
                          int(left):int(left + w)] = x[i]
             img_list.append(expand_image)
-            for j, obj in enumerate(y[i]):
-                ox, oy, ow, oh = obj["box"]
-                ny.append({
-                    "box": [ox + int(left), oy + int(top), ow, oh],
-                    **{k: v for k, v in obj.items() if k != 'box'}
-                })
-            new_y.append(ny)
+            boxes = box_array(y[i])
+            boxes[:, 0] += int(left)
+            boxes[:, 1] += int(top)
+            new_y.append(replace_boxes(y[i], boxes))
         return img_list, new_y
 
     def _transform_segmentation(self, x, y):
@@ -1539,9 +1501,9 @@ class RandomExpand(ProcessBase):
         for i in range(n):
             c, h, w = x[i].shape
             c2, h2, w2 = y[i].shape
-            ratio = np.random.uniform(1, 4)
-            left = np.random.uniform(0, w * ratio - w)
-            top = np.random.uniform(0, h * ratio - h)
+            ratio = self._rng.uniform(1, 4)
+            left = self._rng.uniform(0, w * ratio - w)
+            top = self._rng.uniform(0, h * ratio - h)
             expand_image = np.zeros((c, int(h * ratio), int(w * ratio)), dtype=x[i].dtype)
             expand_label = np.zeros((c2, int(h2 * ratio), int(w2 * ratio)), dtype=y[i].dtype)
             expand_image[:, :, :] = np.mean(x[i])
@@ -1571,9 +1533,9 @@ class Shear(ProcessBase):
         new_x = []
         for i in range(n):
             c, h, w = x[i].shape
-            angle_to_shear = int(np.random.uniform(-self.max_shear_factor, self.max_shear_factor))
+            angle_to_shear = int(self._rng.uniform(-self.max_shear_factor, self.max_shear_factor))
             angle = np.tan(np.radians(angle_to_shear))
-            choice = np.random.choice(self.choice_list)
+            choice = self._choice(self.choice_list)
 
             if choice == 0:
                 # print('return original')
@@ -1626,16 +1588,15 @@ class Shear(ProcessBase):
         for i in range(n):
             c, h, w = x[i].shape
             img, label = x[i], y[i]
-            angle_to_shear = int(np.random.uniform(-self.max_shear_factor, self.max_shear_factor))
+            angle_to_shear = int(self._rng.uniform(-self.max_shear_factor, self.max_shear_factor))
             angle = np.tan(np.radians(angle_to_shear))
-            choice = np.random.choice(self.choice_list)
+            choice = self._choice(self.choice_list)
             if choice == 0:
                 # print('return original')
                 new_x.append(img)
                 new_y.append(label)
             elif choice == 1:
                 # print('x axis')
-                ny = []
                 shift_in_pixels = angle * h
                 if shift_in_pixels > 0:
                     shift_in_pixels = np.ceil(shift_in_pixels)
@@ -1661,19 +1622,16 @@ class Shear(ProcessBase):
                                     transform_matrix,
                                     Image.BICUBIC)
 
-                for j, obj in enumerate(label):
-                    ox, oy, ow, oh = obj["box"]
-                    if angle == 0:
-                        px, pw = ox, ow
-                    else:
-                        px1 = ox - (ow / 2) + (((oy - (oh / 2)) * abs(angle))).astype(int)
-                        px2 = ox + (ow / 2) + (((oy + (oh / 2)) * abs(angle))).astype(int)
-                        pw = px2 - px1
-                        px = px1 + pw / 2
-                    ny.append({
-                        "box": [px - (offset * angle), oy, pw, oh],
-                        **{k: v for k, v in obj.items() if k != 'box'}
-                    })
+                boxes = box_array(label)
+                ox, oy, ow, oh = boxes.T
+                if angle == 0:
+                    px, pw = ox, ow
+                else:
+                    px1 = ox - (ow / 2) + (((oy - (oh / 2)) * abs(angle))).astype(int)
+                    px2 = ox + (ow / 2) + (((oy + (oh / 2)) * abs(angle))).astype(int)
+                    pw = px2 - px1
+                    px = px1 + pw / 2
+                ny = replace_boxes(label, np.stack([px - (offset * angle), oy, pw, oh], axis=1))
                 if angle_to_shear > 0:
                     img = np.asarray(img).transpose(2, 0, 1)
                     tmp1, tmp2 = [], []
@@ -1694,9 +1652,9 @@ class Shear(ProcessBase):
         new_y = []
         for i in range(n):
             c, h, w = x[i].shape
-            angle_to_shear = int(np.random.uniform(-self.max_shear_factor, self.max_shear_factor))
+            angle_to_shear = int(self._rng.uniform(-self.max_shear_factor, self.max_shear_factor))
             angle = np.tan(np.radians(angle_to_shear))
-            choice = np.random.choice(self.choice_list)
+            choice = self._choice(self.choice_list)
 
             if choice == 0:
                 # print('return original')
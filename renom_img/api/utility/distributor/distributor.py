@@ -1,4 +1,6 @@
 import os
+import shutil
+import tempfile
 import threading
 import numpy as np
 from PIL import Image
@@ -6,6 +8,7 @@ from queue import Queue
 from concurrent.futures import ThreadPoolExecutor as Executor
 
 from renom_img.api.utility.load import load_img
+from renom_img.api.utility.annotation import scale_boxes
 
 
 class ImageDistributorBase(object):
@@ -24,6 +27,9 @@ class ImageDistributorBase(object):
         self._augmentation = augmentation
         self._builder = target_builder
         self._imsize = imsize
+        self._epoch = 0
+        self._image_size_list = None
+        self._batch_cache = {}
 
     def __len__(self):
         return len(self._img_path_list)
@@ -46,18 +52,61 @@ class ImageDistributorBase(object):
               resized_annotation_list(list): resized_annotation
         """
         resized_annotation_list = []
-        for path, annotation in zip(self.img_path_list, self.annotation_list):
-            ims = Image.open(path).size
+        for ims, annotation in zip(self.image_size_list, self.annotation_list):
             sw = 1. / ims[0]
             sh = 1. / ims[1]
-            resized_annotation_list.append([{
-                'box': [obj['box'][0] * sw, obj['box'][1] * sh, obj['box'][2] * sw, obj['box'][3] * sh],
-                **{k: v for k, v in obj.items() if k != 'box'}
-            }
-                for obj in annotation])
+            resized_annotation_list.append(scale_boxes(annotation, sw, sh))
         return resized_annotation_list
 
-    def batch(self, batch_size, callback=None, shuffle=True):
+    @property
+    def image_size_list(self):
+        """List of original image sizes (width, height). Images are opened only once."""
+        if self._image_size_list is None:
+            size_list = []
+            for path in self.img_path_list:
+                with Image.open(path) as img:
+                    size_list.append(img.size)
+            self._image_size_list = size_list
+        return self._image_size_list
+
+    def cached_batch(self, batch_size, callback=None, memory_budget=1024**3, cache_dir=None):
+        """Yields same batches as ``batch(shuffle=False)``. Built batches are cached
+        at the first complete iteration and reused after that. This is for
+        validation data, which is not augmented.
+
+        Batches are kept in memory while the total size is under ``memory_budget``.
+        Remaining batches are saved to ``cache_dir`` and loaded as memory-mapped arrays.
+
+        Args:
+            batch_size(int): batch size
+            callback(function): target builder
+            memory_budget(int): Max bytes of batches kept in memory.
+            cache_dir(str): Directory for memory-mapped batches. If None is given,
+                a temporary directory is created.
+        """
+        assert self._augmentation is None, "Augmented batches can not be cached."
+        cache = self._batch_cache.get(batch_size, None)
+        if cache is not None and cache.completed:
+            for x, y in cache:
+                yield x, y
+            return
+
+        cache = BatchCache(memory_budget, cache_dir)
+        for x, y in self.batch(batch_size, callback, shuffle=False):
+            yield cache.append(x, y)
+        cache.completed = True
+        old_cache = self._batch_cache.pop(batch_size, None)
+        if old_cache is not None:
+            old_cache.clear()
+        self._batch_cache[batch_size] = cache
+
+    def clear_cache(self):
+        """Removes cached batches."""
+        for cache in self._batch_cache.values():
+            cache.clear()
+        self._batch_cache = {}
+
+    def batch(self, batch_size, callback=None, shuffle=True, epoch=None):
         """
 
         Default
@@ -67,7 +116,12 @@ class ImageDistributorBase(object):
             * Segmentation
 
         Input data format is specified with task.
+        Augmentation of each batch is seeded by (epoch, batch index). If epoch
+        is None, the number of times this method was called is used.
         """
+        if epoch is None:
+            epoch = self._epoch
+        self._epoch = epoch + 1
         N = len(self)
         batch_loop = int(np.ceil(N / batch_size))
         builder = callback
@@ -87,7 +141,10 @@ class ImageDistributorBase(object):
 
         def build(args):
             img_path_list, annotation_list, nth = args
-            return builder(img_path_list, annotation_list, augmentation=self._augmentation, nth=nth)
+            augmentation = self._augmentation
+            if hasattr(augmentation, "for_batch"):
+                augmentation = augmentation.for_batch(epoch, nth)
+            return builder(img_path_list, annotation_list, augmentation=augmentation, nth=nth)
 
         with Executor(max_workers=self._num_worker) as exector:
             batch_perm = [perm[nth * batch_size:(nth + 1) * batch_size]
@@ -112,6 +169,147 @@ class ImageDistributorBase(object):
                 yield work_thread.pop(0).result()
 
 
+class BatchCache(object):
+    """Holds built batches. Arrays which exceed the memory budget are saved as
+    .npy files and loaded with memory mapping.
+
+    Args:
+        memory_budget(int): Max bytes of arrays kept in memory.
+        cache_dir(str): Directory for saved arrays.
+    """
+
+    def __init__(self, memory_budget, cache_dir=None):
+        self.memory_budget = memory_budget
+        self.completed = False
+        self._cache_dir = cache_dir
+        self._tmp_dir = None
+        self._used_bytes = 0
+        self._batches = []
+
+    def _store(self, array, name):
+        if not isinstance(array, np.ndarray):
+            return array
+        if self._used_bytes + array.nbytes <= self.memory_budget:
+            self._used_bytes += array.nbytes
+            return array
+        if self._tmp_dir is None:
+            self._tmp_dir = tempfile.mkdtemp(prefix="renom_img_batch_", dir=self._cache_dir)
+        path = os.path.join(self._tmp_dir, "{}_{}.npy".format(name, len(self._batches)))
+        np.save(path, array)
+        return np.load(path, mmap_mode="r")
+
+    def append(self, x, y):
+        x = self._store(x, "x")
+        y = self._store(y, "y")
+        self._batches.append((x, y))
+        return x, y
+
+    def clear(self):
+        self._batches = []
+        self._used_bytes = 0
+        self.completed = False
+        if self._tmp_dir is not None:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+            self._tmp_dir = None
+
+    def __iter__(self):
+        return iter(self._batches)
+
+    def __len__(self):
+        return len(self._batches)
+
+    def __del__(self):
+        if self._tmp_dir is not None:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+
+
+class FeatureDistributor(object):
+    """Distributes outputs of the frozen part of a model with their targets.
+
+    The frozen part runs only once for each image, and the outputs are saved
+    in a memory-mapped file. This is used for fine-tuning only the head of a
+    model. The given distributor must not have augmentation because cached
+    outputs would be same in every epoch.
+
+    The features are computed with the frozen part in inference mode. Layers
+    such as batch normalization and dropout in the frozen part therefore behave
+    differently from training without the cache, and the results can differ.
+
+    Args:
+        model(Base): Model which implements ``forward_frozen``.
+        distributor(ImageDistributor): Distributor of training images.
+        target_builder(function): Target builder of the model.
+        batch_size(int): Batch size used for running the frozen part.
+        cache_dir(str): Directory of the memory-mapped file. If None is given,
+            a temporary directory is created.
+    """
+
+    def __init__(self, model, distributor, target_builder=None, batch_size=64, cache_dir=None):
+        assert distributor._augmentation is None, "Features of augmented images can not be cached."
+        self._model = model
+        self._distributor = distributor
+        self._builder = target_builder
+        self._build_batch_size = batch_size
+        self._cache_dir = cache_dir
+        self._tmp_dir = None
+        self._features = None
+        self._targets = None
+
+    def __len__(self):
+        return len(self._distributor)
+
+    def _build(self):
+        self._tmp_dir = tempfile.mkdtemp(prefix="renom_img_feature_", dir=self._cache_dir)
+        N = len(self)
+        offset = 0
+        self._model.set_models(inference=True)
+        for x, y in self._distributor.batch(self._build_batch_size, self._builder, shuffle=False):
+            z = self._model.forward_frozen(x)
+            z = z.as_ndarray() if hasattr(z, "as_ndarray") else np.asarray(z)
+            y = np.asarray(y)
+            if self._features is None:
+                self._features = np.lib.format.open_memmap(
+                    os.path.join(self._tmp_dir, "features.npy"), mode="w+",
+                    dtype=np.float32, shape=(N, ) + z.shape[1:])
+                self._targets = np.lib.format.open_memmap(
+                    os.path.join(self._tmp_dir, "targets.npy"), mode="w+",
+                    dtype=y.dtype, shape=(N, ) + y.shape[1:])
+            self._features[offset:offset + len(z)] = z
+            self._targets[offset:offset + len(y)] = y
+            offset += len(z)
+        self._features.flush()
+        self._targets.flush()
+
+    def batch(self, batch_size, shuffle=True):
+        """
+        Args:
+            batch_size(int): batch size
+            shuffle(bool): shuffle or not
+
+        Yields:
+            (outputs of the frozen part(ndarray), targets(ndarray))
+        """
+        if self._features is None:
+            self._build()
+        N = len(self)
+        perm = np.random.permutation(N) if shuffle else np.arange(N)
+        for nth in range(int(np.ceil(N / batch_size))):
+            # Sorted indices make reading the memory-mapped file sequential.
+            index = np.sort(perm[nth * batch_size:(nth + 1) * batch_size])
+            yield self._features[index], self._targets[index]
+
+    def clear(self):
+        """Removes cached features."""
+        self._features = None
+        self._targets = None
+        if self._tmp_dir is not None:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+            self._tmp_dir = None
+
+    def __del__(self):
+        self.clear()
+
+
 class ImageDistributor(ImageDistributorBase):
 
     def __init__(self, img_path_list, label_list=None,
@@ -122,19 +320,35 @@ class ImageDistributor(ImageDistributorBase):
         super(ImageDistributor, self).__init__(img_path_list,
                                                label_list, target_builder, augmentation, imsize, num_worker)
 
-    def batch(self, batch_size, target_builder=None, shuffle=True):
+    def batch(self, batch_size, target_builder=None, shuffle=True, epoch=None):
         """
 
         Args:
             batch_size(int): batch size
             target_builder(ImageDistributor): target builder
             shuffle(bool): shuffle or not when splitting data
+            epoch(int): epoch index used for seeding augmentation
+
+        Yields:
+            (path of images(list), path of labels(list)
+
+       """
+        return super(ImageDistributor, self).batch(batch_size, target_builder, shuffle, epoch)
+
+    def cached_batch(self, batch_size, target_builder=None, memory_budget=1024**3, cache_dir=None):
+        """
+
+        Args:
+            batch_size(int): batch size
+            target_builder(ImageDistributor): target builder
+            memory_budget(int): max bytes of batches kept in memory
+            cache_dir(str): directory for batches exceeding the memory budget
 
         Yields:
             (path of images(list), path of labels(list)
 
        """
-        return super(ImageDistributor, self).batch(batch_size, target_builder, shuffle)
+        return super(ImageDistributor, self).cached_batch(batch_size, target_builder, memory_budget, cache_dir)
 
     def split(self, ratio, shuffle=True):
         """ split image and laebls
@@ -0,0 +1,37 @@
+import numpy as np
+from renom.cuda import is_cuda_active
+
+
+def as_ndarray_output(z):
+    """Converts a Node or tuple of Nodes to ndarray."""
+    if isinstance(z, (tuple, list)):
+        return tuple(as_ndarray_output(t) for t in z)
+    if hasattr(z, "as_ndarray"):
+        return z.as_ndarray()
+    return np.asarray(z)
+
+
+def run_stages(stages, x):
+    """Applies the functions of ``stages`` to ``x`` in order.
+
+    On CPU, the output of each stage except the last one is converted to a plain
+    array before the next stage runs, so the computational graph of a stage is
+    released as soon as the stage is finished. On GPU, copying activations to
+    the host costs more than it saves, so the stages are run continuously.
+    See test/script/benchmark_stages.py for the effect on peak memory and latency.
+
+    Args:
+        stages (list): Functions returned by ``Base.inference_stages``.
+        x (ndarray): Input array.
+
+    Returns:
+        (ndarray, tuple): Output of the last stage.
+    """
+    z = x
+    for stage in stages[:-1]:
+        z = stage(z)
+        if not is_cuda_active():
+            z = as_ndarray_output(z)
+            assert isinstance(z, np.ndarray), \
+                "Only the last stage can return multiple outputs."
+    return as_ndarray_output(stages[-1](z))
@@ -1,7 +1,15 @@
 import numpy as np
-from .detection import get_prec_and_rec, get_ap_and_map, get_mean_iou
-from .classification import precision_score, recall_score, f1_score, accuracy_score
+from .detection import get_prec_and_rec, get_ap_and_map, get_mean_iou, match_boxes, prec_and_rec_from_match
+from .detection import match_image, get_matches, mean_iou_from_match
+from .detection import get_matches_multi, prec_and_rec_multi, average_precision
+from .detection import COCO_IOU_THRESHOLDS, COCO_AREA_RANGES
+from .classification import precision_score, recall_score, f1_score, accuracy_score, top_k_correct
+from .classification import confusion_matrix as classification_confusion_matrix
+from .classification import metrics_from_confusion as classification_metrics_from_confusion
 from .segmentation import segmentation_iou, segmentation_precision, segmentation_recall, segmentation_f1, get_segmentation_metrics
+from .segmentation import confusion_matrix as segmentation_confusion_matrix
+from .segmentation import confusion_matrices as segmentation_confusion_matrices
+from .segmentation import metrics_from_confusion
 from collections import defaultdict
 
 
@@ -71,23 +79,43 @@ class EvaluatorDetection(EvaluatorBase):
     def __init__(self, prediction, target, num_class=None):
         super(EvaluatorDetection, self).__init__(prediction, target)
         self.num_class = num_class
-
-    def mAP(self, iou_thresh=0.5, round_off=3):
+        self._matches = None
+        self._results = {}
+        self._multi_results = {}
+
+    def _evaluate(self, iou_thresh):
+        # IoU matrices are computed once and matching results are cached for each threshold.
+        if self._matches is None:
+            self._matches = [match_image(p, t) for p, t in zip(self.prediction, self.target)]
+        if iou_thresh not in self._results:
+            class_map, n_pos_list, scores, match, ious = get_matches(
+                self.prediction, self.target, iou_thresh, self._matches)
+            prec = {}
+            rec = {}
+            n_pred = {}
+            for c in class_map:
+                prec[c], rec[c] = prec_and_rec_from_match(scores[c], match[c], n_pos_list[c])
+                n_pred[c] = int(np.sum(match[c]))
+            self._results[iou_thresh] = (prec, rec, n_pred, n_pos_list, ious)
+        return self._results[iou_thresh]
+
+    def mAP(self, iou_thresh=0.5, round_off=3, method="11point"):
         """ Returns mAP (mean Average Precision)
 
         Args:
             iou_thresh(float): IoU threshold. The default value is 0.5.
             round_off(int): The number of output decimal
+            method(str): "11point" for the VOC2007 11 point interpolation or "all" for the all-point interpolation.
 
         Returns:
             (float): mAP(mean Average Precision).
         """
 
-        prec, rec, _, _ = get_prec_and_rec(self.prediction, self.target, self.num_class, iou_thresh)
-        _, mAP = get_ap_and_map(prec, rec, round_off)
+        prec, rec, _, _, _ = self._evaluate(iou_thresh)
+        _, mAP = get_ap_and_map(prec, rec, n_round_off=round_off, method=method)
         return mAP
 
-    def AP(self, iou_thresh=0.5, round_off=3):
+    def AP(self, iou_thresh=0.5, round_off=3, method="11point"):
         """ Returns AP(Average Precision) for each class.
 
         :math:`AP = 1/11 \sum_{r \in \{0.0,..1.0\}} AP_{r}`
@@ -95,6 +123,7 @@ class EvaluatorDetection(EvaluatorBase):
         Args:
             iou_thresh: IoU threshold. The default value is 0.5.
             round_off(int): The number of output decimal
+            method(str): "11point" for the VOC2007 11 point interpolation or "all" for the all-point interpolation.
 
         Returns:
             (dictionary): AP for each class. The format is as follows
@@ -108,10 +137,99 @@ class EvaluatorDetection(EvaluatorBase):
             }
         """
 
-        prec, rec, _, _ = get_prec_and_rec(self.prediction, self.target, self.num_class, iou_thresh)
-        AP, _ = get_ap_and_map(prec, rec, round_off)
+        prec, rec, _, _, _ = self._evaluate(iou_thresh)
+        AP, _ = get_ap_and_map(prec, rec, n_round_off=round_off, method=method)
         return AP
 
+    def _evaluate_multi(self, iou_thresholds, area_ranges, method, max_detections):
+        # All thresholds and area ranges are matched in one pass over the images.
+        key = (tuple(iou_thresholds), tuple(area_ranges), max_detections)
+        if key not in self._multi_results:
+            self._multi_results[key] = get_matches_multi(
+                self.prediction, self.target, iou_thresholds, area_ranges, max_detections)
+        class_names = sorted(self._multi_results[key].keys())
+        ap = np.full((len(class_names), len(area_ranges), len(iou_thresholds)), np.nan)
+        for i, c in enumerate(class_names):
+            scores, tp, ignored, n_pos = self._multi_results[key][c]
+            prec, rec = prec_and_rec_multi(scores, tp, ignored, n_pos)
+            has_target = n_pos > 0
+            ap[i, has_target] = average_precision(prec[has_target], rec[has_target], method)
+        return class_names, ap
+
+    def coco_AP(self, iou_thresholds=COCO_IOU_THRESHOLDS, area="all", method="101point",
+                max_detections=100, round_off=3):
+        """ Returns AP averaged over IoU thresholds for each class and its mean, as the COCO evaluation does.
+        By default, this is AP@[.5:.95].
+
+        Args:
+            iou_thresholds (list): IoU thresholds. Defaults to 0.5, 0.55, ..., 0.95.
+            area (str, tuple): One of "all", "small", "medium" and "large", or (min area, max area).
+                Boxes are required to be in pixels to use the named ranges.
+            method (str): Interpolation of the precision-recall curve. "all", "11point" or "101point".
+            max_detections (int): Max number of evaluated boxes per image and class.
+            round_off (int): The number of output decimal
+
+        Returns:
+            (tuple): 2 values are returned. Each element represents a dictionary of AP for each class and mAP.
+            Classes which do not have ground truth boxes in the range are excluded.
+
+        Example:
+            >>> evaluator = EvaluatorDetection(pred, gt)
+            >>> AP, mAP = evaluator.coco_AP()
+            >>> AP, mAP50 = evaluator.coco_AP(iou_thresholds=[0.5], method="all")
+        """
+        if isinstance(area, str):
+            # Named ranges are matched together so that the other ranges are cached.
+            area_names = list(COCO_AREA_RANGES.keys())
+            area_ranges = [COCO_AREA_RANGES[a] for a in area_names]
+            area_index = area_names.index(area)
+        else:
+            area_ranges = [tuple(area)]
+            area_index = 0
+        class_names, ap = self._evaluate_multi(iou_thresholds, area_ranges, method, max_detections)
+        ap = ap[:, area_index].mean(axis=1)
+        AP = {c: round(float(v), round_off) for c, v in zip(class_names, ap) if not np.isnan(v)}
+        if len(AP) == 0:
+            return AP, 0.0
+        mAP = round(float(np.mean(list(AP.values()))), round_off)
+        return AP, mAP
+
+    def coco_summary(self, method="101point", max_detections=100, round_off=3):
+        """ Returns the standard COCO detection metrics.
+
+        Returns:
+            (dictionary): The format is as follows
+
+        .. code-block :: python
+
+            {
+                'mAP': mAP@[.5:.95] (float),
+                'mAP50': mAP@.5 (float),
+                'mAP75': mAP@.75 (float),
+                'mAP_small': mAP@[.5:.95] of small objects (float),
+                'mAP_medium': mAP@[.5:.95] of medium objects (float),
+                'mAP_large': mAP@[.5:.95] of large objects (float),
+            }
+        """
+        area_names = list(COCO_AREA_RANGES.keys())
+        area_ranges = [COCO_AREA_RANGES[a] for a in area_names]
+        _, ap = self._evaluate_multi(COCO_IOU_THRESHOLDS, area_ranges, method, max_detections)
+        all_area = area_names.index("all")
+        thresholds = list(COCO_IOU_THRESHOLDS)
+
+        def mean(x):
+            x = x[~np.isnan(x)]
+            return round(float(np.mean(x)), round_off) if len(x) > 0 else 0.0
+
+        summary = {
+            "mAP": mean(ap[:, all_area].mean(axis=1)),
+            "mAP50": mean(ap[:, all_area, thresholds.index(0.5)]),
+            "mAP75": mean(ap[:, all_area, thresholds.index(0.75)]),
+        }
+        for a in ["small", "medium", "large"]:
+            summary["mAP_" + a] = mean(ap[:, area_names.index(a)].mean(axis=1))
+        return summary
+
     def mean_iou(self, iou_thresh=0.5, round_off=3):
         """ Returns mean IoU for all classes
 
@@ -122,8 +240,7 @@ class EvaluatorDetection(EvaluatorBase):
         Returns:
             (float): Mean IoU
         """
-        _, mean_iou = get_mean_iou(self.prediction, self.target,
-                                   self.num_class, iou_thresh, round_off)
+        _, mean_iou = self._iou(iou_thresh, round_off)
         return mean_iou
 
     def iou(self, iou_thresh=0.5, round_off=3):
@@ -145,9 +262,14 @@ class EvaluatorDetection(EvaluatorBase):
                 }
         """
 
-        iou, _ = get_mean_iou(self.prediction, self.target, self.num_class, iou_thresh, round_off)
+        iou, _ = self._iou(iou_thresh, round_off)
         return iou
 
+    def _iou(self, iou_thresh, round_off):
+        _, _, _, n_pos_list, ious = self._evaluate(iou_thresh)
+        target_class = [c for c, n in n_pos_list.items() if n > 0]
+        return mean_iou_from_match(ious, target_class, round_off)
+
     def plot_pr_curve(self, iou_thresh=0.5, class_names=None):
         """ Plot a precision-recall curve.
 
@@ -156,7 +278,7 @@ class EvaluatorDetection(EvaluatorBase):
             class_names(list): List of keys in a prediction list or string if you output precision-recall curve of only one class. This specifies which precision-recall curve of classes to output.
         """
 
-        prec, rec, _, _ = get_prec_and_rec(self.prediction, self.target, self.num_class, iou_thresh)
+        prec, rec, _, _, _ = self._evaluate(iou_thresh)
         if not isinstance(class_names, list) and class_names is not None:
             class_names = [class_names]
 
@@ -198,9 +320,8 @@ class EvaluatorDetection(EvaluatorBase):
                 })
         """
 
-        precision, recall, _, _ = get_prec_and_rec(
-            self.prediction, self.target, self.num_class, iou_thresh)
-        return precision. recall
+        precision, recall, _, _, _ = self._evaluate(iou_thresh)
+        return precision, recall
 
     def report(self, iou_thresh=0.5, round_off=3):
         """ Outputs a table which shows AP, IoU, the number of predicted instances for each class, and the number of ground truth instances for each class.
@@ -224,12 +345,10 @@ class EvaluatorDetection(EvaluatorBase):
 
         """
 
-        prec, rec, n_pred, n_pos_list = get_prec_and_rec(
-            self.prediction, self.target, self.num_class, iou_thresh)
-        AP, mAP = get_ap_and_map(prec, rec, round_off)
-        iou = self.iou()
+        prec, rec, n_pred, n_pos_list, _ = self._evaluate(iou_thresh)
+        AP, mAP = get_ap_and_map(prec, rec, n_round_off=round_off)
+        iou, mean_iou = self._iou(iou_thresh, round_off)
         class_names = list(AP.keys())
-        mean_iou = self.mean_iou()
 
         headers = ["AP", "IoU", "  #pred/#target"]
         rows = []
@@ -265,8 +384,18 @@ class EvaluatorClassification(EvaluatorBase):
             >>> evaluator.recall()
     """
 
-    def __init__(self, prediction, target):
+    def __init__(self, prediction, target, scores=None):
         super(EvaluatorClassification, self).__init__(prediction, target)
+        self.scores = scores
+        self._hist = None
+        self._metrics = None
+
+    def _confusion(self):
+        # All metrics are derived from the confusion matrix, which is computed once.
+        if self._hist is None:
+            self._hist = classification_confusion_matrix(self.prediction, self.target)
+            self._metrics = classification_metrics_from_confusion(self._hist)
+        return self._hist
 
     def precision(self):
         """ Returns precision for each class and mean precision
@@ -283,7 +412,8 @@ class EvaluatorClassification(EvaluatorBase):
                     class_id2(int): precision(float),
                 }, mean_precision(float))
         """
-        precision, mean_precision = precision_score(self.prediction, self.target)
+        self._confusion()
+        precision, mean_precision = self._metrics[0:2]
         return precision, mean_precision
 
     def recall(self):
@@ -302,7 +432,8 @@ class EvaluatorClassification(EvaluatorBase):
                 }, mean_recall(float))
         """
 
-        recall, mean_recall = recall_score(self.prediction, self.target)
+        self._confusion()
+        recall, mean_recall = self._metrics[2:4]
         return recall, mean_recall
 
     def accuracy(self):
@@ -312,9 +443,22 @@ class EvaluatorClassification(EvaluatorBase):
             (float): Accuracy
         """
 
-        accuracy = accuracy_score(self.prediction, self.target)
+        hist = self._confusion()
+        accuracy = float(np.diag(hist).sum()) / max(hist.sum(), 1)
         return accuracy
 
+    def top_k_accuracy(self, k=5):
+        """ Returns top-k accuracy. This requires ``scores`` given to the constructor.
+
+        Args:
+            k(int): A sample is correct if the target class is in the k classes with the highest scores.
+
+        Returns:
+            (float): Top-k accuracy
+        """
+        assert self.scores is not None, "Scores of each class are required for top-k accuracy."
+        return float(top_k_correct(self.scores, self.target, k)) / max(len(self.target), 1)
+
     def f1(self):
         """
         Returns f1 for each class and mean f1 score.
@@ -332,7 +476,8 @@ class EvaluatorClassification(EvaluatorBase):
                 }, mean_f1_score(float))
         """
 
-        f1, mean_f1 = f1_score(self.prediction, self.target)
+        self._confusion()
+        f1, mean_f1 = self._metrics[4:6]
         return f1, mean_f1
 
     def report(self, round_off=3):
@@ -361,13 +506,9 @@ class EvaluatorClassification(EvaluatorBase):
         accuracy = self.accuracy()
         class_names = list(precision.keys())
 
-        tp = defaultdict(int)
-        true_sum = defaultdict(int)
-
-        for p, t in zip(self.prediction, self.target):
-            true_sum[t] += 1
-            if p == t:
-                tp[p] += 1
+        hist = self._confusion()
+        tp = {c: int(hist[c, c]) for c in class_names}
+        true_sum = {c: int(hist[c].sum()) for c in class_names}
 
         headers = ["Precision", "Recall", "F1 score", "#pred/#target"]
         rows = []
@@ -523,24 +664,216 @@ class EvaluatorSegmentation(EvaluatorBase):
         return report
 
 
+class StreamingEvaluatorDetection(object):
+    """ Evaluator for object detection tasks which accumulates results batch by batch.
+    Only the score and the matching result of each predicted box are kept,
+    so predictions of the whole set are not required at once.
+
+    Args:
+        iou_thresh (float): IoU threshold. The default value is 0.5.
+
+    Example:
+            >>> evaluator = StreamingEvaluatorDetection()
+            >>> for x, target in batches:
+            ...     evaluator.update(model.predict(x), target)
+            >>> prec, rec, iou, mean_iou = evaluator.compute()
+            >>> evaluator.mAP()
+    """
+
+    def __init__(self, iou_thresh=0.5):
+        self.iou_thresh = iou_thresh
+        self.reset()
+
+    def reset(self):
+        self.n_pos = defaultdict(int)
+        self.scores = defaultdict(list)
+        self.match = defaultdict(list)
+        self.ious = defaultdict(list)
+
+    def update(self, prediction, target):
+        """ Adds results of a batch.
+
+        Args:
+            prediction (list): Predicted objects of each image. The format is the same as ``EvaluatorDetection``.
+            target (list): Ground truth objects of each image.
+        """
+        assert len(prediction) == len(target)
+        for pred, gt in zip(prediction, target):
+            for obj in gt:
+                self.n_pos[obj['name']] += 1
+            for name, score, matched, iou in match_boxes(pred, gt, self.iou_thresh):
+                self.scores[name].append(score)
+                self.match[name].append(matched)
+                if matched:
+                    self.ious[name].append(iou)
+
+    def compute(self, round_off=3):
+        """ Returns precision, recall and IoU of the accumulated results.
+
+        Returns:
+            (tuple): Same as ``get_prec_rec_iou``.
+        """
+        class_map = sorted(set(self.n_pos.keys()) | set(self.scores.keys()))
+        precisions = {}
+        recalls = {}
+        mean_iou_per_cls = {}
+        for c in class_map:
+            precisions[c], recalls[c] = prec_and_rec_from_match(
+                self.scores[c], self.match[c], self.n_pos[c])
+            if len(self.ious[c]) > 0:
+                mean_iou_per_cls[c] = round(np.mean(self.ious[c]), round_off)
+            else:
+                mean_iou_per_cls[c] = 0.0
+        if mean_iou_per_cls:
+            mean_iou = round(np.mean(list(mean_iou_per_cls.values())), round_off)
+        else:
+            mean_iou = 0.0
+        return precisions, recalls, mean_iou_per_cls, mean_iou
+
+    def mAP(self, round_off=3):
+        """ Returns mAP (mean Average Precision) of the accumulated results.
+        """
+        prec, rec, _, _ = self.compute(round_off)
+        _, mAP = get_ap_and_map(prec, rec, n_round_off=round_off)
+        return mAP
+
+
+class StreamingEvaluatorClassification(object):
+    """ Evaluator for classification tasks which accumulates a confusion matrix
+    batch by batch.
+
+    Args:
+        num_class (int): The number of classes. If None is given, the matrix grows
+            with the largest given class id.
+        top_k (tuple): Top-k accuracies which are accumulated when scores are given to ``update``.
+
+    Example:
+            >>> evaluator = StreamingEvaluatorClassification(num_class)
+            >>> for x, target in batches:
+            ...     evaluator.update(rm.softmax(model(x)).as_ndarray(), target)
+            >>> precision, mean_precision, recall, mean_recall, f1, mean_f1 = evaluator.compute()
+            >>> evaluator.top_k_accuracy(5)
+    """
+
+    def __init__(self, num_class=None, top_k=(5, )):
+        self.hist = np.zeros((num_class or 0, num_class or 0), dtype=np.int64)
+        self.top_k = top_k
+        self.reset()
+
+    def reset(self):
+        self.hist[...] = 0
+        self.top_k_count = {k: 0 for k in self.top_k}
+        self.n_scored = 0
+
+    def update(self, prediction, target):
+        """ Adds results of a batch.
+
+        Args:
+            prediction (ndarray): Predicted class ids, or scores whose shape is (N, num_class).
+            target (ndarray): Target class ids.
+        """
+        prediction = np.asarray(prediction)
+        target = np.asarray(target, dtype=np.int64).ravel()
+        if prediction.ndim == 2:
+            for k in self.top_k:
+                self.top_k_count[k] += top_k_correct(prediction, target, k)
+            self.n_scored += len(target)
+            prediction = np.argmax(prediction, axis=1)
+        prediction = prediction.astype(np.int64).ravel()
+        assert len(prediction) == len(target)
+        if len(target) == 0:
+            return
+        n = max(len(self.hist), int(prediction.max()) + 1, int(target.max()) + 1)
+        if n > len(self.hist):
+            hist = np.zeros((n, n), dtype=np.int64)
+            hist[:len(self.hist), :len(self.hist)] = self.hist
+            self.hist = hist
+        self.hist += classification_confusion_matrix(prediction, target, n)
+
+    def compute(self):
+        """ Returns precision, recall and F1 score of the accumulated results.
+
+        Returns:
+            (tuple): Same as ``precision_recall_f1_score``.
+        """
+        return classification_metrics_from_confusion(self.hist)
+
+    def accuracy(self):
+        """ Returns accuracy of the accumulated results.
+        """
+        return float(np.diag(self.hist).sum()) / max(self.hist.sum(), 1)
+
+    def top_k_accuracy(self, k=5):
+        """ Returns top-k accuracy of the accumulated results.
+        """
+        assert k in self.top_k_count, "Top-{} accuracy is not accumulated.".format(k)
+        return float(self.top_k_count[k]) / max(self.n_scored, 1)
+
+
+class StreamingEvaluatorSegmentation(object):
+    """ Evaluator for semantic segmentation tasks which accumulates a confusion
+    matrix batch by batch.
+
+    Args:
+        num_class (int): The number of classes.
+        ignore_class(int): background class is ignored in the output. defaults to 0.
+
+    Example:
+            >>> evaluator = StreamingEvaluatorSegmentation(num_class)
+            >>> for x, target in batches:
+            ...     evaluator.update(np.argmax(model(x).as_ndarray(), axis=1), target)
+            >>> _, mean_precision, _, mean_recall, _, mean_f1, iou, mean_iou, _, _ = evaluator.compute()
+    """
+
+    def __init__(self, num_class, ignore_class=0):
+        self.num_class = num_class
+        self.ignore_class = [ignore_class] if isinstance(ignore_class, int) else ignore_class
+        self.hist = np.zeros((num_class + 1, num_class + 1), dtype=np.int64)
+
+    def reset(self):
+        self.hist[...] = 0
+
+    def update(self, prediction, target):
+        """ Adds results of a batch.
+
+        Args:
+            prediction (ndarray): Predicted class maps whose shape is (N, height, width).
+            target (ndarray): Target class maps whose shape is (N, height, width).
+
+        Returns:
+            (ndarray): Confusion matrices of each image in the batch.
+        """
+        hists = segmentation_confusion_matrices(prediction, target, self.num_class)
+        self.hist += hists.sum(axis=0)
+        return hists
+
+    def compute(self):
+        """ Returns metrics of the accumulated results.
+
+        Returns:
+            (tuple): Same as ``get_segmentation_metrics``.
+        """
+        return metrics_from_confusion(self.hist, self.ignore_class)
+
+
 class Fast_Segmentation_Evaluator(object):
     def __init__(self, preds, trues, class_map):
         self.preds = preds
         self.trues = trues
         self.class_map = [str(c) for c in class_map]
         self.n_class = len(class_map)
+        self._hist = None
 
-    def _fast_hist(self, label_true, label_pred, n_class):
-        mask = (label_true >= 0) & (label_true < n_class)
-        hist = np.bincount(
-            n_class * label_true[mask].astype(int) +
-            label_pred[mask], minlength=n_class**2).reshape(n_class, n_class)
-        return hist
+    def _confusion(self):
+        # Pixels whose ground truth is out of range are excluded.
+        if self._hist is None:
+            hist = np.sum([segmentation_confusion_matrix(lp, lt, self.n_class)
+                           for lt, lp in zip(self.trues, self.preds)], axis=0)
+            self._hist = hist[:self.n_class, :self.n_class].astype(np.float64)
+        return self._hist
 
     def evaluate(self):
-        hist = np.zeros((self.n_class, self.n_class))
-        for lt, lp in zip(self.trues, self.preds):
-            hist += self._fast_hist(lt.flatten(), lp.flatten(), self.n_class)
+        hist = self._confusion()
         acc = np.diag(hist).sum() / hist.sum()
         with np.errstate(divide="ignore", invalid="ignore"):
             acc_cls = np.diag(hist) / hist.sum(axis=1)
@@ -554,10 +887,7 @@ class Fast_Segmentation_Evaluator(object):
         return acc, acc_cls, mean_iou, fwavacc
 
     def confusion_matrix(self):
-        hist = np.zeros((self.n_class, self.n_class))
-        for lt, lp in zip(self.trues, self.preds):
-            hist += self._fast_hist(lt.flatten(), lp.flatten(), self.n_class)
-        return hist.astype(int)
+        return self._confusion().astype(int)
 
     def classification_report(self):
         labels = list(range(self.n_class))
@@ -592,9 +922,7 @@ class Fast_Segmentation_Evaluator(object):
 
     def metrics(self):
         # confusion matrix
-        hist = np.zeros((self.n_class, self.n_class))
-        for lt, lp in zip(self.trues, self.preds):
-            hist += self._fast_hist(lt.flatten(), lp.flatten(), self.n_class)
+        hist = self._confusion()
         # accuracy
         with np.errstate(divide="ignore", invalid="ignore"):
             acc_cls = np.diag(hist) / hist.sum(axis=1)
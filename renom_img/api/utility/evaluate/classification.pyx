@@ -1,5 +1,4 @@
 import numpy as np
-from collections import defaultdict
 
 cpdef precision_score(y_pred, y_true):
     """ Precision score for classification
@@ -44,6 +43,50 @@ cpdef f1_score(y_pred, y_true):
     return f1_score, mean_f1_score
 
 
+cpdef confusion_matrix(y_pred, y_true, n_class=None):
+    """ Returns the confusion matrix whose rows are target classes and columns are predicted classes.
+
+    Args:
+        y_pred(list): A list of predicted class id
+        y_true(list): A list of target class id
+        n_class(int): The number of classes. If None is given, the largest class id + 1 is used.
+
+    Return:
+        (ndarray): Confusion matrix whose shape is (n_class, n_class).
+    """
+    y_pred = np.asarray(y_pred, dtype=np.int64).ravel()
+    y_true = np.asarray(y_true, dtype=np.int64).ravel()
+    assert len(y_pred) == len(y_true)
+    if n_class is None:
+        n_class = int(max(y_pred.max(), y_true.max())) + 1 if len(y_true) > 0 else 0
+    return np.bincount(n_class * y_true + y_pred, minlength=n_class * n_class).reshape(n_class, n_class)
+
+
+cpdef metrics_from_confusion(hist):
+    """ Returns precision, recall, F1 score from a confusion matrix created by ``confusion_matrix``.
+    Classes which appear in neither predictions nor targets are not included.
+
+    Return:
+        (tuple): Same as ``precision_recall_f1_score``.
+    """
+    tp = np.diag(hist).astype(np.float64)
+    true_sum = hist.sum(axis=1).astype(np.float64)
+    pred_sum = hist.sum(axis=0).astype(np.float64)
+    classes = np.where(true_sum + pred_sum > 0)[0]
+    tp, true_sum, pred_sum = tp[classes], true_sum[classes], pred_sum[classes]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(pred_sum > 0, tp / pred_sum, 0.)
+        recall = np.where(true_sum > 0, tp / true_sum, 0.)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.)
+        # Means are weighted by the number of targets of each class.
+        weight = true_sum / true_sum.sum()
+
+    return {int(c): float(v) for c, v in zip(classes, precision)}, float(np.sum(precision * weight)), \
+        {int(c): float(v) for c, v in zip(classes, recall)}, float(np.sum(recall * weight)), \
+        {int(c): float(v) for c, v in zip(classes, f1)}, float(np.sum(f1 * weight))
+
+
 cpdef precision_recall_f1_score(y_pred, y_true):
     """ Returns precision, recall, F1 score
 
@@ -56,42 +99,33 @@ cpdef precision_recall_f1_score(y_pred, y_true):
                  mean precision of float, a dictionary of recall, mean recall of float,
                  a dictionary of F1 score, and F1 score of float value.
     """
-    tp = defaultdict(int)
-    pred_sum = defaultdict(int)
-    true_sum = defaultdict(int)
-
-    for p, t in zip(y_pred, y_true):
-        pred_sum[p] += 1
-        true_sum[t] += 1
-        if p == t:
-            tp[p] += 1
-
-    class_ids = set(pred_sum.keys()) | set(true_sum.keys())
-    precision = {}
-    recall = {}
-    f1 = {}
-    mean_f1 = 0
-    mean_precision = 0
-    mean_recall = 0
-    for c in class_ids:
-        if pred_sum[c] > 0:
-            precision[c] = float(tp[c]) / float(pred_sum[c])
-        else:
-            precision[c] = 0
-        if true_sum[c] > 0:
-            recall[c] = float(tp[c]) / float(true_sum[c])
-        else:
-            recall[c] = 0
-
-        if recall[c] + precision[c] > 0:
-            f1[c] = 2 * precision[c] * recall[c] / (precision[c] + recall[c])
-        else:
-            f1[c] = 0.
-        mean_f1 += f1[c] * (float(true_sum[c]) / np.fromiter(true_sum.values(), dtype=float).sum())
-        mean_precision += precision[c] * (float(true_sum[c]) / np.fromiter(true_sum.values(), dtype=float).sum())
-        mean_recall += recall[c] * (float(true_sum[c]) / np.fromiter(true_sum.values(), dtype=float).sum())
-
-    return precision, mean_precision, recall, mean_recall, f1, mean_f1
+    return metrics_from_confusion(confusion_matrix(y_pred, y_true))
+
+
+cpdef top_k_accuracy(scores, y_true, k=5):
+    """ Top-k accuracy. A sample is correct if the target class is in the k classes with the highest scores.
+
+    Args:
+        scores(ndarray): Scores whose shape is (N, n_class).
+        y_true(list): A list of target class id
+        k(int): The number of classes
+
+    Return:
+        (float): Returns top-k accuracy
+    """
+    return float(top_k_correct(scores, y_true, k)) / max(len(y_true), 1)
+
+
+cpdef top_k_correct(scores, y_true, k=5):
+    """ Returns the number of samples whose target class is in the top-k classes.
+    """
+    scores = np.asarray(scores)
+    y_true = np.asarray(y_true, dtype=np.int64).ravel()
+    if k >= scores.shape[1]:
+        return len(y_true)
+    top_k = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return int(np.sum(top_k == y_true[:, None]))
+
 
 cpdef accuracy_score(y_pred, y_true):
     """ Accuracy
@@ -103,6 +137,6 @@ cpdef accuracy_score(y_pred, y_true):
     Return:
         (float): Returns accuracy
     """
-    accuracy = np.sum(y_pred==y_true) / len(y_true)
+    accuracy = np.sum(np.asarray(y_pred) == np.asarray(y_true)) / len(y_true)
     return accuracy
 
@@ -3,106 +3,250 @@ from renom_img.api.utility.box import *
 from renom_img.api.utility.nms import *
 import warnings
 
-cpdef get_prec_and_rec(pred_list, gt_list, n_class=None, iou_threshold=0.5):
-    """ This function calculates precision and recall value of provided ground truth box list(gt_list) and predicted box list(pred_list).
+# IoU thresholds and object areas (in pixels) used by the COCO evaluation.
+COCO_IOU_THRESHOLDS = np.round(np.linspace(0.5, 0.95, 10), 2)
+COCO_AREA_RANGES = {
+    "all": (0, 1e10),
+    "small": (0, 32 ** 2),
+    "medium": (32 ** 2, 96 ** 2),
+    "large": (96 ** 2, 1e10),
+}
+
+
+cpdef box_iou_matrix(boxes1, boxes2):
+    """ Returns IoU of every pair of boxes.
 
     Args:
-        gt_list (list):
-        pred_list (list): A list of predicted bounding boxes.
-        n_class(int): The number of classes
-        iou_threshold(float): This represents the ratio of overlapped area between two boxes. Defaults to 0.5
+        boxes1(ndarray): Boxes whose shape is (N, 4). The format is (x1, y1, x2, y2).
+        boxes2(ndarray): Boxes whose shape is (M, 4). The format is (x1, y1, x2, y2).
 
     Returns:
-        4-tuples. Each element represents a dictionary pf precisions, a dictionary of recall. the number of predicted boxes which match to ground truth boxes,
-        and the number of positive boxes for each class.
+        (ndarray): IoU matrix whose shape is (N, M).
+    """
+    boxes1 = np.asarray(boxes1, dtype=np.float64).reshape(-1, 4)
+    boxes2 = np.asarray(boxes2, dtype=np.float64).reshape(-1, 4)
+    x1 = np.maximum(boxes1[:, None, 0], boxes2[None, :, 0])
+    y1 = np.maximum(boxes1[:, None, 1], boxes2[None, :, 1])
+    x2 = np.minimum(boxes1[:, None, 2], boxes2[None, :, 2])
+    y2 = np.minimum(boxes1[:, None, 3], boxes2[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area1 = (boxes1[:, 2] - boxes1[:, 0]) * (boxes1[:, 3] - boxes1[:, 1])
+    area2 = (boxes2[:, 2] - boxes2[:, 0]) * (boxes2[:, 3] - boxes2[:, 1])
+    union = area1[:, None] + area2[None, :] - inter
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(inter > 0, inter / union, 0.)
+
+
+cpdef xywh_to_xyxy(boxes):
+    """ Converts boxes of (x, y, w, h) format to (x1, y1, x2, y2) format.
+
+    Args:
+        boxes(list): Boxes whose format is (x, y, w, h). (x, y) is the center.
+
+    Returns:
+        (ndarray): Boxes whose shape is (N, 4).
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    half = boxes[:, 2:] / 2.
+    return np.concatenate([boxes[:, :2] - half, boxes[:, :2] + half], axis=1)
+
+
+cpdef match_image(pred_list_per_img, gt_list_per_img):
+    """ Finds the ground truth box of the same class which has the largest IoU
+    for each predicted box of an image. The result does not depend on the IoU
+    threshold, so it can be reused for any threshold with ``true_positive``.
+
+    Args:
+        pred_list_per_img (list): Predicted objects of an image.
+        gt_list_per_img (list): Ground truth objects of the image.
+
+    Returns:
+        2-tuple of arrays whose length is the number of predicted boxes. Each element represents
+        the largest IoU and the index of the ground truth box. The IoU is -1 if there is no
+        ground truth box of the same class.
+    """
+    n_pred = len(pred_list_per_img)
+    if n_pred == 0 or len(gt_list_per_img) == 0:
+        return np.full(n_pred, -1.), np.zeros(n_pred, dtype=np.int64)
+    iou = box_iou_matrix(xywh_to_xyxy([obj['box'] for obj in pred_list_per_img]),
+                         xywh_to_xyxy([obj['box'] for obj in gt_list_per_img]))
+    pred_labels = np.array([obj['class'] for obj in pred_list_per_img])
+    gt_labels = np.array([obj['class'] for obj in gt_list_per_img])
+    iou = np.where(pred_labels[:, None] == gt_labels[None, :], iou, -1.)
+    gt_index = np.argmax(iou, axis=1)
+    return iou[np.arange(n_pred), gt_index], gt_index
+
+
+cpdef true_positive(maxiou, gt_index, iou_threshold=0.5):
+    """ Returns whether each predicted box is a true positive. A ground truth box
+    is assigned to the first predicted box whose IoU is over the threshold, and the
+    following boxes which overlap it are false positives.
+
+    Args:
+        maxiou(ndarray): The largest IoU of each predicted box returned by ``match_image``.
+        gt_index(ndarray): Index of the ground truth box returned by ``match_image``.
+        iou_threshold(float): IoU threshold. Defaults to 0.5
+
+    Returns:
+        (ndarray): Boolean array.
     """
+    tp = np.zeros(len(maxiou), dtype=bool)
+    candidate = np.where(maxiou >= iou_threshold)[0]
+    _, first = np.unique(gt_index[candidate], return_index=True)
+    tp[candidate[first]] = True
+    return tp
+
+
+cpdef get_matches(pred_list, gt_list, iou_threshold=0.5, matches=None):
+    """ Matches predicted boxes to ground truth boxes and groups the results by class name.
 
+    Args:
+        pred_list (list): A list of predicted bounding boxes.
+        gt_list (list): A list of ground truth bounding boxes.
+        iou_threshold(float): IoU threshold. Defaults to 0.5
+        matches(list): Results of ``match_image`` for each image. If given,
+            the IoU computation is skipped.
+
+    Returns:
+        5-tuple. Each element represents a list of class names, a dictionary of the number of
+        ground truth boxes, a dictionary of scores, a dictionary of matching results (1 for true positive)
+        and a dictionary of IoU of true positives.
+    """
     class_map = np.unique(np.concatenate([[g['name'] for gt in gt_list for g in gt], [p['name'] for pre in pred_list for p in pre]]))
 
     n_pos_list = dict()
     match = {}
     scores = {}
+    ious = {}
     for c in class_map:
         n_pos_list[c] = 0
         match[c] = []
         scores[c] = []
+        ious[c] = []
 
     for i in range(len(gt_list)):
         gt_list_per_img = gt_list[i]
         pred_list_per_img = pred_list[i]
 
-        gt_labels = [obj['class'] for obj in gt_list_per_img]
-        gt_boxes = [obj['box'] for obj in gt_list_per_img]
-        gt_names = [obj['name'] for obj in gt_list_per_img]
-
-        pred_labels = [obj['class'] for obj in pred_list_per_img]
-        pred_names = [obj['name'] for obj in pred_list_per_img]
-        pred_boxes = [obj['box'] for obj in pred_list_per_img]
-        pred_confs = [float(obj['score']) for obj in pred_list_per_img]
-
-        for l in gt_names:
-            n_pos_list[l] += 1
-
-        gt_seen = np.zeros(len(gt_boxes), dtype=bool)
-        for label, name, box, conf in zip(pred_labels, pred_names, pred_boxes, pred_confs):
-            x1, y1, x2, y2 = transform2xy12(box)
-
-            maxiou = -1
-            maxiou_id = -1
-            for j, (gt_label, gt_box) in enumerate(zip(gt_labels, gt_boxes)):
-                if gt_label != label:
-                    continue
-                gt_x1, gt_y1, gt_x2, gt_y2 = transform2xy12(gt_box)
-
-                iou = calc_iou_xyxy([x1, y1, x2, y2], [gt_x1, gt_y1, gt_x2, gt_y2])
-                if iou > maxiou:
-                    maxiou = iou
-                    maxiou_id = j
-
-            if maxiou < 0:
-                match[name].append(0)
-                scores[name].append(conf)
-                continue
-
-            if maxiou >= iou_threshold:
-                if not gt_seen[maxiou_id]:
-                    match[name].append(1)
-                    gt_seen[maxiou_id] = True
-                else:
-                    match[name].append(0)
-            else:
-                match[name].append(0)
-            scores[name].append(conf)
+        for obj in gt_list_per_img:
+            n_pos_list[obj['name']] += 1
+
+        if matches is None:
+            maxiou, gt_index = match_image(pred_list_per_img, gt_list_per_img)
+        else:
+            maxiou, gt_index = matches[i]
+        tp = true_positive(maxiou, gt_index, iou_threshold)
+        for obj, t, iou in zip(pred_list_per_img, tp, maxiou):
+            match[obj['name']].append(int(t))
+            scores[obj['name']].append(float(obj['score']))
+            if t:
+                ious[obj['name']].append(iou)
+    return class_map, n_pos_list, scores, match, ious
+
+
+cpdef match_boxes(pred_list_per_img, gt_list_per_img, iou_threshold=0.5):
+    """ Matches predicted boxes of an image to its ground truth boxes.
+    The matching is the same as ``get_prec_rec_iou``.
+
+    Args:
+        pred_list_per_img (list): Predicted objects of an image.
+        gt_list_per_img (list): Ground truth objects of the image.
+        iou_threshold(float): IoU threshold. Defaults to 0.5
+
+    Returns:
+        (list): A list of (name, score, matched, iou) for each predicted box.
+        ``matched`` is 1 if the box is a true positive. ``iou`` is None for false positives.
+    """
+    maxiou, gt_index = match_image(pred_list_per_img, gt_list_per_img)
+    tp = true_positive(maxiou, gt_index, iou_threshold)
+    return [(obj['name'], float(obj['score']), int(t), float(iou) if t else None)
+            for obj, t, iou in zip(pred_list_per_img, tp, maxiou)]
+
+
+cpdef prec_and_rec_from_match(scores, match, n_pos):
+    """ Returns precision and recall curves of a class.
+
+    Args:
+        scores (list): Scores of predicted boxes.
+        match (list): 1 for true positive and 0 for false positive of each box.
+        n_pos (int): The number of ground truth boxes.
+
+    Returns:
+        2-tuple of precision and recall arrays in descending order of score.
+        Recall is None if there is no ground truth box.
+    """
+    sorted_indices = np.argsort(scores)[::-1]
+    match_per_cls = np.array(match, dtype=np.int64)[sorted_indices]
+    tp = np.cumsum(match_per_cls == 1)
+    fp = np.cumsum(match_per_cls == 0)
+    precision = tp.astype(float) / (tp + fp).astype(float)
+    if n_pos > 0:
+        recall = tp.astype(float) / float(n_pos)
+    else:
+        recall = None
+    return precision, recall
+
+
+cpdef mean_iou_from_match(ious, target_class, n_round_off=3):
+    """ Returns IoU for each class and mean IoU from the IoU of true positives.
+
+    Args:
+        ious(dict): IoU of true positives of each class returned by ``get_matches``.
+        target_class(list): Class names which appear in the ground truth.
+
+    Returns:
+        2-tuple. Each element represents a dictioanry of IoU for each class and mean IoU.
+    """
+    mean_iou_per_cls = {}
+    no_target_class = []
+    for k, v in ious.items():
+        if len(v) > 0:
+            mean_iou_per_cls[k] = round(np.nanmean(v), n_round_off)
+        else:
+            mean_iou_per_cls[k] = 0.0
+            if k not in target_class:
+                no_target_class.append(k)
+    if len(no_target_class) > 2:
+        tmp = no_target_class[:3]
+        tmp.append('...')
+        warnings.warn("There is no following classes in the target data, (%s)"%",".join(tmp))
+    elif len(no_target_class) > 0:
+        warnings.warn("There is no following classes in the target data. (%s)"%",".join(no_target_class))
+    mean_iou = round(np.nanmean(list(mean_iou_per_cls.values())), n_round_off)
+    return mean_iou_per_cls, mean_iou
+
+
+cpdef get_prec_and_rec(pred_list, gt_list, n_class=None, iou_threshold=0.5):
+    """ This function calculates precision and recall value of provided ground truth box list(gt_list) and predicted box list(pred_list).
+
+    Args:
+        gt_list (list):
+        pred_list (list): A list of predicted bounding boxes.
+        n_class(int): The number of classes
+        iou_threshold(float): This represents the ratio of overlapped area between two boxes. Defaults to 0.5
+
+    Returns:
+        4-tuples. Each element represents a dictionary pf precisions, a dictionary of recall. the number of predicted boxes which match to ground truth boxes,
+        and the number of positive boxes for each class.
+    """
+    class_map, n_pos_list, scores, match, _ = get_matches(pred_list, gt_list, iou_threshold)
 
     precisions = {}
     recalls = {}
     n_pred = {}
     for l in class_map:
-        sorted_indices = np.argsort(scores[l])[::-1]
-        match_per_cls = np.array(match[l])
-        match_per_cls = match_per_cls[sorted_indices]
-        tp = np.cumsum(match_per_cls == 1)
-        fp = np.cumsum(match_per_cls == 0)
-        if len(tp) > 0:
-            n_pred[l] = tp[-1]
-        else:
-            n_pred[l] = 0
-        precision = tp.astype(float) / (tp+fp).astype(float)
-        precisions[l] = precision
-        if n_pos_list[l] > 0:
-            recall = tp.astype(float) / float(n_pos_list[l])
-        else:
-            recall = None
-        recalls[l] = recall
+        precisions[l], recalls[l] = prec_and_rec_from_match(scores[l], match[l], n_pos_list[l])
+        n_pred[l] = int(np.sum(match[l]))
     return precisions, recalls, n_pred, n_pos_list
 
 
-cpdef get_ap_and_map(prec, rec, n_class=None, n_round_off=3):
+cpdef get_ap_and_map(prec, rec, n_class=None, n_round_off=3, method="11point"):
     """ Returns AP and mAP
 
     Args:
         prec(dict): Dictionary of precision for each class returned by get_prec_and_rec method
         rec(dict): Dictionary of recall for each class returned by get_prec_and_rec method
+        method(str): Interpolation of the precision-recall curve. See ``average_precision``.
 
     Returns:
         2-tuple. Each element represetns a dictionary of AP for each class and mAP (mean Average Precision).
@@ -115,6 +259,9 @@ cpdef get_ap_and_map(prec, rec, n_class=None, n_round_off=3):
             aps[c] = 0.0
             no_target_class.append(c)
             continue
+        if method != "11point":
+            aps[c] = round(float(average_precision(np.nan_to_num(prec[c]), rec[c], method)), n_round_off)
+            continue
         ap = 0
         for t in np.arange(0, 1.1, 0.1):
             if np.sum(rec[c] >= t) == 0:
@@ -145,69 +292,10 @@ cpdef get_mean_iou(pred_list, gt_list, n_class=None, iou_threshold=0.5, n_round_
     Returns:
         2-tuple. Each element represents a dictioanry of IoU for each class and mean IoU.
     """
-
-    class_map = np.unique(np.concatenate([[g['name'] for gt in gt_list for g in gt], [p['name'] for pre in pred_list for p in pre]]))
-
-    ious = {}
-    for c in class_map:
-        ious[c] = []
-
-
-    for i in range(len(gt_list)):
-        gt_list_per_img = gt_list[i]
-        pred_list_per_img = pred_list[i]
-
-        gt_labels = [obj['class'] for obj in gt_list_per_img]
-        gt_names = [obj['name'] for obj in gt_list_per_img]
-        gt_boxes = [obj['box'] for obj in gt_list_per_img]
-
-        pred_labels = [obj['class'] for obj in pred_list_per_img]
-        pred_names = [obj['name'] for obj in pred_list_per_img]
-        pred_boxes = [obj['box'] for obj in pred_list_per_img]
-
-        gt_seen = np.zeros(len(gt_boxes), dtype=bool)
-        for label, name, box in zip(pred_labels, pred_names, pred_boxes):
-            x1, y1, x2, y2 = transform2xy12(box)
-
-            maxiou = -1
-            maxiou_id = -1
-            for j, (gt_label, gt_box) in enumerate(zip(gt_labels, gt_boxes)):
-                if gt_label != label:
-                    continue
-                gt_x1, gt_y1, gt_x2, gt_y2 = transform2xy12(gt_box)
-
-                iou = calc_iou_xyxy([x1, y1, x2, y2], [gt_x1, gt_y1, gt_x2, gt_y2])
-                if iou > maxiou:
-                    maxiou = iou
-                    maxiou_id = j
-
-            if maxiou >= iou_threshold:
-                if not gt_seen[maxiou_id]:
-                    ious[name].append(maxiou)
-                    gt_seen[maxiou_id] = True
-                else:
-                    continue
-            else:
-                continue
-
-    mean_iou_per_cls = {}
-    no_target_class = []
+    _, _, _, _, ious = get_matches(pred_list, gt_list, iou_threshold)
     target_class = np.unique([g['name'] for gt in gt_list for g in gt])
-    for k, v in ious.items():
-        if len(v) > 0:
-            mean_iou_per_cls[k] =  round(np.nanmean(v), n_round_off)
-        else:
-            mean_iou_per_cls[k] = 0.0
-            if k not in target_class:
-                no_target_class.append(k)
-    if len(no_target_class) > 2:
-        tmp = no_target_class[:3]
-        tmp.append('...')
-        warnings.warn("There is no following classes in the target data, (%s)"%",".join(tmp))
-    elif len(no_target_class) > 0:
-        warnings.warn("There is no following classes in the target data. (%s)"%",".join(no_target_class))
-    mean_iou = round(np.nanmean(list(mean_iou_per_cls.values())), n_round_off)
-    return mean_iou_per_cls, mean_iou
+    return mean_iou_from_match(ious, target_class, n_round_off)
+
 
 cpdef get_prec_rec_iou(pred_list, gt_list, n_class=None, iou_threshold=0.5, n_round_off=3):
     """ Returns preision, recall and IoU.
@@ -222,98 +310,208 @@ cpdef get_prec_rec_iou(pred_list, gt_list, n_class=None, iou_threshold=0.5, n_ro
         4-tuple. Each element represetns a ditionary of precision foe each class, a dictionary of recall for each class,
         a dictionary for IoU for each class, and mean IoU (float).
     """
-
-    class_map = np.unique(np.concatenate([[g['name'] for gt in gt_list for g in gt], [p['name'] for pre in pred_list for p in pre]]))
-
-    n_pos_list = dict()
-    match = {}
-    scores = {}
-    ious = {}
-    for c in class_map:
-        n_pos_list[c] = 0
-        match[c] = []
-        scores[c] = []
-        ious[c] = []
-
-    for i in range(len(gt_list)):
-        gt_list_per_img = gt_list[i]
-        pred_list_per_img = pred_list[i]
-
-        gt_labels = [obj['class'] for obj in gt_list_per_img]
-        gt_names = [obj['name'] for obj in gt_list_per_img]
-        gt_boxes = [obj['box'] for obj in gt_list_per_img]
-
-        pred_labels = [obj['class'] for obj in pred_list_per_img]
-        pred_names = [obj['name'] for obj in pred_list_per_img]
-        pred_boxes = [obj['box'] for obj in pred_list_per_img]
-        pred_confs = [obj['score'] for obj in pred_list_per_img]
-
-        for l in gt_names:
-            n_pos_list[l] += 1
-
-        gt_seen = np.zeros(len(gt_boxes), dtype=bool)
-        for label, name, box, conf in zip(pred_labels, pred_names, pred_boxes, pred_confs):
-            x1, y1, x2, y2 = transform2xy12(box)
-
-            iou_list = []
-            indices = []
-            maxiou = -1
-            maxiou_id = -1
-            for j, (gt_label, gt_box) in enumerate(zip(gt_labels, gt_boxes)):
-                if gt_label != label:
-                    continue
-                gt_x1, gt_y1, gt_x2, gt_y2 = transform2xy12(gt_box)
-
-                iou = calc_iou_xyxy([x1, y1, x2, y2], [gt_x1, gt_y1, gt_x2, gt_y2])
-                if iou > maxiou:
-                    maxiou = iou
-                    maxiou_id = j
-
-            if maxiou < 0:
-                match[name].append(0)
-                scores[name].append(conf)
-                continue
-
-            if maxiou >= iou_threshold:
-                if not gt_seen[maxiou_id]:
-                    match[name].append(1)
-                    ious[name].append(maxiou)
-                    gt_seen[maxiou_id] = True
-                else:
-                    match[name].append(0)
-            else:
-                match[name].append(0)
-            scores[name].append(conf)
+    class_map, n_pos_list, scores, match, ious = get_matches(pred_list, gt_list, iou_threshold)
 
     precisions = {}
     recalls = {}
     for l in class_map:
-        sorted_indices = np.argsort(scores[l])[::-1]
-        match_per_cls = np.array(match[l])
-        match_per_cls = match_per_cls[sorted_indices]
-        tp = np.cumsum(match_per_cls == 1)
-        fp = np.cumsum(match_per_cls == 0)
-        precision = tp.astype(float) / (tp+fp).astype(float)
-        precisions[l] = precision
-        if n_pos_list[l] > 0:
-            recall = tp.astype(float) / float(n_pos_list[l])
-        else:
-            recall = None
-        recalls[l] = recall
+        precisions[l], recalls[l] = prec_and_rec_from_match(scores[l], match[l], n_pos_list[l])
 
-    mean_iou_per_cls = {}
-    no_target_class = []
     target_class = np.unique([g['name'] for gt in gt_list for g in gt])
-    for k, v in ious.items():
-        if len(v) > 0:
-            mean_iou_per_cls[k] =  round(np.nanmean(v), n_round_off)
-        else:
-            mean_iou_per_cls[k] = 0.0
-            if k in target_class:
-                no_target_class.append(k)
-    if len(no_target_class) > 2:
-        warnings.warn("There is no following classes in the target data, (%s)"%",".join(no_target_class[:3]) + '...')
-    elif len(no_target_class) > 0:
-        warnings.warn("There is no following classes in the target data. (%s)"%",".join(no_target_class))
-    mean_iou = round(np.nanmean(list(mean_iou_per_cls.values())), n_round_off)
+    mean_iou_per_cls, mean_iou = mean_iou_from_match(ious, target_class, n_round_off)
     return precisions, recalls, mean_iou_per_cls, mean_iou
+
+
+cpdef average_precision(prec, rec, method="all"):
+    """ Returns the area under interpolated precision-recall curves.
+
+    Args:
+        prec(ndarray): Precision whose shape is (..., N). The last axis is in descending order of score.
+        rec(ndarray): Recall whose shape is the same as prec.
+        method(str): "all" for the all-point interpolation (VOC2010 and later),
+            "11point" for the VOC2007 11 point interpolation and "101point" for the COCO 101 point interpolation.
+
+    Returns:
+        (ndarray): AP whose shape is prec.shape[:-1].
+    """
+    assert method in ("all", "11point", "101point"), "Unknown method {}".format(method)
+    prec = np.asarray(prec, dtype=np.float64)
+    rec = np.asarray(rec, dtype=np.float64)
+    shape = prec.shape[:-1]
+    N = prec.shape[-1]
+    if N == 0:
+        return np.zeros(shape)
+    prec = prec.reshape(-1, N)
+    rec = rec.reshape(-1, N)
+    # Precision at each point is replaced with the max precision at the same or higher recall.
+    envelope = np.maximum.accumulate(prec[:, ::-1], axis=1)[:, ::-1]
+    if method == "all":
+        step = np.diff(np.concatenate([np.zeros((len(rec), 1)), rec], axis=1), axis=1)
+        ap = np.sum(step * envelope, axis=1)
+    else:
+        points = np.linspace(0, 1, 11 if method == "11point" else 101)
+        ap = np.empty(len(rec))
+        for k in range(len(rec)):
+            index = np.searchsorted(rec[k], points, side="left")
+            ap[k] = np.mean(np.where(index < N, envelope[k][np.minimum(index, N - 1)], 0.))
+    return ap.reshape(shape)
+
+
+cpdef match_image_multi(pred_list_per_img, gt_list_per_img, iou_thresholds, area_ranges, max_detections=100):
+    """ Matches predicted boxes of an image to ground truth boxes for several IoU
+    thresholds and area ranges at once, as the COCO evaluation does.
+
+    Predicted boxes are visited in descending order of score and each one takes the
+    unmatched ground truth box of the same class which has the largest IoU. The IoU matrix
+    is computed once and all thresholds are matched together.
+    Ground truth boxes out of an area range are ignored. Predicted boxes matched to them,
+    and unmatched predicted boxes out of the range, are neither true nor false positives.
+
+    Args:
+        pred_list_per_img (list): Predicted objects of an image.
+        gt_list_per_img (list): Ground truth objects of the image.
+        iou_thresholds (ndarray): IoU thresholds whose length is T.
+        area_ranges (list): List of (min area, max area) whose length is A.
+        max_detections(int): Only this number of boxes with the highest scores are evaluated
+            for each class.
+
+    Returns:
+        5-tuple. Each element represents names of predicted boxes (P, ), their scores (P, ),
+        true positive flags (A, T, P), ignored flags (A, T, P) and the number of
+        ground truth boxes which are not ignored for each class and area range.
+    """
+    thresholds = np.asarray(iou_thresholds, dtype=np.float64)
+    T = len(thresholds)
+    A = len(area_ranges)
+
+    scores = np.array([float(obj['score']) for obj in pred_list_per_img], dtype=np.float64)
+    order = np.argsort(-scores, kind="mergesort")
+    # The limit is applied to each class, as the COCO evaluation does.
+    n_kept = {}
+    kept = []
+    for i in order:
+        c = pred_list_per_img[i]['class']
+        if n_kept.get(c, 0) < max_detections:
+            n_kept[c] = n_kept.get(c, 0) + 1
+            kept.append(i)
+    order = np.array(kept, dtype=np.int64)
+    pred = [pred_list_per_img[i] for i in order]
+    scores = scores[order]
+    names = [obj['name'] for obj in pred]
+    P = len(pred)
+    G = len(gt_list_per_img)
+
+    pred_boxes = np.array([obj['box'] for obj in pred], dtype=np.float64).reshape(-1, 4)
+    gt_boxes = np.array([obj['box'] for obj in gt_list_per_img], dtype=np.float64).reshape(-1, 4)
+    pred_area = pred_boxes[:, 2] * pred_boxes[:, 3]
+    gt_area = gt_boxes[:, 2] * gt_boxes[:, 3]
+    gt_names = [obj['name'] for obj in gt_list_per_img]
+
+    tp = np.zeros((A, T, P), dtype=bool)
+    ignored = np.zeros((A, T, P), dtype=bool)
+    n_pos = {}
+    for name in gt_names:
+        n_pos[name] = np.zeros(A, dtype=np.int64)
+
+    if P > 0 and G > 0:
+        iou = box_iou_matrix(xywh_to_xyxy(pred_boxes), xywh_to_xyxy(gt_boxes))
+        pred_labels = np.array([obj['class'] for obj in pred])
+        gt_labels = np.array([obj['class'] for obj in gt_list_per_img])
+        iou = np.where(pred_labels[:, None] == gt_labels[None, :], iou, -1.)
+    t_index = np.arange(T)
+
+    for a in range(A):
+        lo, hi = area_ranges[a]
+        gt_ignore = (gt_area < lo) | (gt_area > hi)
+        for name, ig in zip(gt_names, gt_ignore):
+            if not ig:
+                n_pos[name][a] += 1
+        if P > 0 and G > 0:
+            matched = np.zeros((T, G), dtype=bool)
+            for i in range(P):
+                available = ~matched & (iou[i][None, :] >= thresholds[:, None])
+                # Ground truth boxes which are not ignored are preferred.
+                best = np.argmax(np.where(available & ~gt_ignore[None, :], iou[i][None, :], -1.), axis=1)
+                found = available[t_index, best] & ~gt_ignore[best]
+                best_ignored = np.argmax(np.where(available & gt_ignore[None, :], iou[i][None, :], -1.), axis=1)
+                found_ignored = ~found & available[t_index, best_ignored] & gt_ignore[best_ignored]
+                best = np.where(found, best, best_ignored)
+                hit = found | found_ignored
+                matched[t_index[hit], best[hit]] = True
+                tp[a, :, i] = found
+                ignored[a, :, i] = found_ignored
+        out_of_range = (pred_area < lo) | (pred_area > hi)
+        ignored[a] |= ~tp[a] & ~ignored[a] & out_of_range[None, :]
+    return names, scores, tp, ignored, n_pos
+
+
+cpdef get_matches_multi(pred_list, gt_list, iou_thresholds=COCO_IOU_THRESHOLDS, area_ranges=None, max_detections=100):
+    """ Matches all images with ``match_image_multi`` and groups the results by class name.
+
+    Args:
+        pred_list (list): A list of predicted bounding boxes.
+        gt_list (list): A list of ground truth bounding boxes.
+        iou_thresholds (ndarray): IoU thresholds. Defaults to 0.5:0.05:0.95.
+        area_ranges (list): List of (min area, max area). Defaults to the whole range.
+        max_detections(int): Max number of evaluated boxes per image and class.
+
+    Returns:
+        (dict): Dictionary of (scores, true positive flags, ignored flags, the number of ground truth boxes)
+        for each class. Shapes are (N, ), (A, T, N), (A, T, N) and (A, ).
+    """
+    if area_ranges is None:
+        area_ranges = [COCO_AREA_RANGES["all"]]
+    A = len(area_ranges)
+    T = len(iou_thresholds)
+    scores = {}
+    tp = {}
+    ignored = {}
+    n_pos = {}
+    for i in range(len(gt_list)):
+        names, score, t, ig, n = match_image_multi(pred_list[i], gt_list[i], iou_thresholds,
+                                                   area_ranges, max_detections)
+        names = np.array(names, dtype=object)
+        for c in set(names.tolist()) | set(n.keys()):
+            if c not in scores:
+                scores[c] = []
+                tp[c] = []
+                ignored[c] = []
+                n_pos[c] = np.zeros(A, dtype=np.int64)
+            mask = names == c
+            scores[c].append(score[mask])
+            tp[c].append(t[:, :, mask])
+            ignored[c].append(ig[:, :, mask])
+            if c in n:
+                n_pos[c] += n[c]
+
+    result = {}
+    for c in scores:
+        result[c] = (np.concatenate(scores[c]),
+                     np.concatenate(tp[c], axis=2).reshape(A, T, -1),
+                     np.concatenate(ignored[c], axis=2).reshape(A, T, -1),
+                     n_pos[c])
+    return result
+
+
+cpdef prec_and_rec_multi(scores, tp, ignored, n_pos):
+    """ Returns precision and recall curves for each area range and IoU threshold.
+
+    Args:
+        scores (ndarray): Scores whose shape is (N, ).
+        tp (ndarray): True positive flags whose shape is (A, T, N).
+        ignored (ndarray): Ignored flags whose shape is (A, T, N).
+        n_pos (ndarray): The number of ground truth boxes for each area range.
+
+    Returns:
+        2-tuple of precision and recall whose shapes are (A, T, N).
+        Recall is nan for area ranges without ground truth boxes.
+    """
+    order = np.argsort(-scores, kind="mergesort")
+    tp = tp[:, :, order]
+    ignored = ignored[:, :, order]
+    tps = np.cumsum(tp & ~ignored, axis=2).astype(np.float64)
+    fps = np.cumsum(~tp & ~ignored, axis=2).astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        prec = np.where(tps + fps > 0, tps / (tps + fps), 0.)
+        rec = tps / np.asarray(n_pos, dtype=np.float64)[:, None, None]
+    return prec, rec
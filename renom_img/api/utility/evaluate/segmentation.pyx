@@ -1,70 +1,96 @@
 import numpy as np
-from collections import defaultdict
 
-cpdef get_segmentation_metrics(pred_list, gt_list, n_class, round_off=3, ignore_class=0):
-    """Computing IoU for each class and mean IoU
+
+cpdef confusion_matrix(pred, gt, n_class):
+    """Returns the confusion matrix whose rows are true classes and columns are
+    predicted classes. Labels which are out of [0, n_class) are counted in the
+    last row and column, so the shape is (n_class + 1, n_class + 1).
+
+    Args:
+        pred(ndarray): Predicted class map.
+        gt(ndarray): Ground truth class map. Its shape is the same as pred.
+        n_class(int): Number of classes.
+    """
+    pred = np.asarray(pred).ravel().astype(np.int64)
+    gt = np.asarray(gt).ravel().astype(np.int64)
+    n = n_class + 1
+    pred = np.where((pred >= 0) & (pred < n_class), pred, n_class)
+    gt = np.where((gt >= 0) & (gt < n_class), gt, n_class)
+    return np.bincount(n * gt + pred, minlength=n * n).reshape(n, n)
+
+
+cpdef confusion_matrices(pred, gt, n_class):
+    """Returns confusion matrices of each image at once.
+
+    Args:
+        pred(ndarray): Predicted class maps whose shape is (N, height, width).
+        gt(ndarray): Ground truth class maps whose shape is (N, height, width).
+        n_class(int): Number of classes.
+
+    Returns:
+        (ndarray): Array whose shape is (N, n_class + 1, n_class + 1).
+    """
+    pred = np.asarray(pred)
+    N = len(pred)
+    pred = pred.reshape(N, -1).astype(np.int64)
+    gt = np.asarray(gt).reshape(N, -1).astype(np.int64)
+    n = n_class + 1
+    pred = np.where((pred >= 0) & (pred < n_class), pred, n_class)
+    gt = np.where((gt >= 0) & (gt < n_class), gt, n_class)
+    index = np.arange(N, dtype=np.int64)[:, None] * (n * n) + n * gt + pred
+    return np.bincount(index.ravel(), minlength=N * n * n).reshape(N, n, n)
+
+
+cpdef metrics_from_confusion(hist, ignore_class=0):
+    """Computes precision, recall, F1 score and IoU of each class from a
+    confusion matrix created by ``confusion_matrix``.
+
+    Returns:
+        (tuple): Same as ``get_segmentation_metrics``.
     """
     if isinstance(ignore_class, int):
         ignore_class = [ignore_class]
-    assert len(pred_list)==len(gt_list)
-    class_num = n_class
-
-    tp = defaultdict(int)
-    true_sum = defaultdict(int)
-    pred_sum = defaultdict(int)
-
-    #for pred, gt in zip(pred_list, gt_list):
-    for i in range(len(pred_list)):
-        pred = pred_list[i]
-        gt = gt_list[i]
-        for c in range(class_num):
-            if c in ignore_class:
-                continue
-            pred_sum[c] += np.sum(np.where(pred==c, True, False))
-            true_sum[c] += np.sum(np.where(gt==c, True, False))
-            tp[c] += np.sum(np.where(pred==c, True, False) * np.where(gt==c, True, False))
-
-    ious = {}
-    precision = {}
-    f1 = {}
-    recall = {}
-    total_area = 0
-    total_tp = 0
-    mean_f1 = 0
-    mean_precision = 0
-    mean_recall = 0
-    for c in range(class_num):
-        if c in ignore_class:
-            continue
-        area = true_sum[c] + pred_sum[c] - tp[c]
-        total_area += float(area)
-        total_tp += float(tp[c])
-        if area == 0:
-            ious[c] = 0.
-        else:
-            ious[c] = float(tp[c]) / float(area)
-
-        if pred_sum[c] == 0:
-            precision[c] = 0
-        else:
-            precision[c] = float(tp[c]) / float(pred_sum[c])
-
-        if true_sum[c] == 0:
-            recall[c] = 0
-        else:
-            recall[c] = float(tp[c]) / float(true_sum[c])
-
-        if recall[c] + precision[c] > 0:
-            f1[c] = 2 * precision[c] * recall[c] / (precision[c] + recall[c])
-        else:
-            f1[c] = 0.
-
-        mean_f1 += f1[c] * (float(true_sum[c]) / np.fromiter(true_sum.values(), dtype=float).sum())
-        mean_precision += precision[c] * (float(true_sum[c]) / np.fromiter(true_sum.values(), dtype=float).sum())
-        mean_recall += recall[c] * (float(true_sum[c]) / np.fromiter(true_sum.values(), dtype=float).sum())
-
-    mean_iou = total_tp / total_area
-    return precision, mean_precision, recall, mean_recall, f1, mean_f1, ious, mean_iou, tp, true_sum
+    n_class = hist.shape[0] - 1
+    classes = [c for c in range(n_class) if c not in ignore_class]
+    index = np.array(classes, dtype=np.int64)
+
+    tp = np.diag(hist)[index].astype(np.float64)
+    true_sum = hist[index].sum(axis=1).astype(np.float64)
+    # Predicted pixels are counted even if the ground truth is out of range.
+    pred_sum = hist[:, index].sum(axis=0).astype(np.float64)
+    area = true_sum + pred_sum - tp
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        iou = np.where(area > 0, tp / area, 0.)
+        precision = np.where(pred_sum > 0, tp / pred_sum, 0.)
+        recall = np.where(true_sum > 0, tp / true_sum, 0.)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.)
+        weight = true_sum / true_sum.sum()
+        mean_iou = float(tp.sum() / area.sum())
+
+    mean_precision = float(np.sum(precision * weight))
+    mean_recall = float(np.sum(recall * weight))
+    mean_f1 = float(np.sum(f1 * weight))
+
+    return {c: float(v) for c, v in zip(classes, precision)}, mean_precision, \
+        {c: float(v) for c, v in zip(classes, recall)}, mean_recall, \
+        {c: float(v) for c, v in zip(classes, f1)}, mean_f1, \
+        {c: float(v) for c, v in zip(classes, iou)}, mean_iou, \
+        {c: int(v) for c, v in zip(classes, tp)}, {c: int(v) for c, v in zip(classes, true_sum)}
+
+
+cpdef get_segmentation_metrics(pred_list, gt_list, n_class=None, round_off=3, ignore_class=0):
+    """Computing IoU for each class and mean IoU
+    """
+    assert len(pred_list) == len(gt_list)
+    if n_class is None:
+        n_class = int(max([np.max(p) for p in list(pred_list) + list(gt_list)])) + 1
+    if isinstance(pred_list, np.ndarray) and isinstance(gt_list, np.ndarray):
+        hist = confusion_matrix(pred_list, gt_list, n_class)
+    else:
+        # Images may have different sizes.
+        hist = np.sum([confusion_matrix(p, g, n_class) for p, g in zip(pred_list, gt_list)], axis=0)
+    return metrics_from_confusion(hist, ignore_class)
 
 cpdef segmentation_iou(pred_list, gt_list, n_class=None, round_off=3, ignore_class=0):
     _, _, _, _, _, _, iou, mean_iou, _, _ = get_segmentation_metrics(pred_list, gt_list, n_class, round_off, ignore_class)
@@ -81,5 +107,3 @@ cpdef segmentation_recall(pred_list, gt_list, n_class=None, round_off=3, ignore_
 cpdef segmentation_f1(pred_list, gt_list, n_class=None, round_off=3, ignore_class=0):
     _, _, _, _, f1, mean_f1, _, _, _, _ = get_segmentation_metrics(pred_list, gt_list, n_class, round_off, ignore_class)
     return f1, mean_f1
-
-
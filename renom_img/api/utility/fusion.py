@@ -0,0 +1,106 @@
+import numpy as np
+import renom as rm
+
+# Pairs of attribute names (convolution, batch normalization) which are applied
+# successively in forward propagation of the blocks.
+FUSABLE_ATTRIBUTES = [
+    ("conv1", "bn1"),
+    ("conv2", "bn2"),
+    ("conv3", "bn3"),
+    ("_conv", "_bn"),
+]
+
+
+class Identity(rm.Model):
+    """Layer which returns the input as it is. Folded batch normalization
+    layers are replaced with this.
+    """
+
+    def forward(self, x):
+        return x
+
+
+def _to_ndarray(value):
+    if hasattr(value, "as_ndarray"):
+        return value.as_ndarray()
+    elif hasattr(value, "new_array"):
+        return value.new_array()
+    return np.asarray(value)
+
+
+def _is_conv(layer):
+    return isinstance(layer, (rm.Conv2d, rm.GroupConv2d))
+
+
+def fold_batch_normalize(conv, bn):
+    """Folds the scale and shift of batch normalization in inference mode into
+    the weight and bias of the preceding convolution.
+
+    .. math::
+
+        W' = W \\gamma / \\sqrt{\\sigma^2 + \\epsilon}, \\quad
+        b' = (b - \\mu) \\gamma / \\sqrt{\\sigma^2 + \\epsilon} + \\beta
+
+    Args:
+        conv (Conv2d, GroupConv2d): Convolution layer.
+        bn (BatchNormalize): Batch normalization layer whose mode is 'feature'.
+    """
+    w = _to_ndarray(conv.params["w"])
+    channel = w.shape[0]
+    if "b" in conv.params:
+        b = _to_ndarray(conv.params["b"]).reshape(channel)
+    else:
+        b = np.zeros(channel, dtype=w.dtype)
+
+    # Moving variance is stored as '_mov_std'.
+    mean = np.broadcast_to(_to_ndarray(bn._mov_mean), (1, channel, 1, 1)).reshape(channel)
+    var = np.broadcast_to(_to_ndarray(bn._mov_std), (1, channel, 1, 1)).reshape(channel)
+    gamma = _to_ndarray(bn.params["w"]).reshape(channel)
+    beta = _to_ndarray(bn.params["b"]).reshape(channel)
+
+    scale = gamma / np.sqrt(var + bn._epsilon)
+    conv.params["w"] = rm.Variable((w * scale.reshape(-1, 1, 1, 1)).astype(w.dtype))
+    conv.params["b"] = rm.Variable(((b - mean) * scale + beta).reshape(1, channel, 1, 1).astype(w.dtype))
+    conv._ignore_bias = False
+
+
+def fuse_batch_normalize(model):
+    """Folds every batch normalization layer which directly follows a convolution
+    in ``model``, and replaces it with Identity. Successive layers in Sequential
+    and the attribute pairs listed in FUSABLE_ATTRIBUTES are fused.
+
+    Args:
+        model (Model): Model whose parameters are initialized.
+
+    Returns:
+        (int): Number of folded layers.
+    """
+    targets = []
+    for m in model.iter_models():
+        if isinstance(m, rm.Sequential):
+            layers = m._layers
+            for i in range(1, len(layers)):
+                if _is_conv(layers[i - 1]) and isinstance(layers[i], rm.BatchNormalize):
+                    targets.append((m, layers[i - 1], layers[i]))
+        else:
+            for conv_name, bn_name in FUSABLE_ATTRIBUTES:
+                conv = getattr(m, conv_name, None)
+                bn = getattr(m, bn_name, None)
+                if _is_conv(conv) and isinstance(bn, rm.BatchNormalize):
+                    targets.append((m, conv, bn))
+
+    # A model can be visited more than once.
+    unique = {}
+    for owner, conv, bn in targets:
+        unique[id(bn)] = (owner, conv, bn)
+    targets = list(unique.values())
+
+    for owner, conv, bn in targets:
+        fold_batch_normalize(conv, bn)
+        identity = Identity()
+        for name, value in list(vars(owner).items()):
+            if value is bn:
+                setattr(owner, name, identity)
+        if isinstance(owner, rm.Sequential):
+            owner._layers = [identity if l is bn else l for l in owner._layers]
+    return len(targets)
@@ -6,6 +6,7 @@ from PIL import Image
 from xml.etree import ElementTree
 from concurrent.futures import ThreadPoolExecutor as Executor
 from renom_img.api.utility.misc.display import draw_segment
+from renom_img.api.utility.annotation import AnnotationList, scale_boxes, replace_boxes, box_array
 
 
 def check_class_name(cn):
@@ -16,12 +17,15 @@ def check_class_name(cn):
     return cn
 
 
-def parse_xml_detection(xml_path_list, num_thread=8):
+def parse_xml_detection(xml_path_list, num_thread=8, columnar=False):
     """XML format must be Pascal VOC format.
 
     Args:
         xml_path_list (list): List of xml-file's path.
         num_thread (int): Number of thread for parsing xml files.
+        columnar (bool): If True, annotations are returned as an ``AnnotationList``
+            which stores all boxes and class ids in flat arrays. Each element of it
+            can be used in the same way as the list of dictionaries shown below.
 
     Returns:
         (list): This returns list of annotations.
@@ -47,19 +51,26 @@ def parse_xml_detection(xml_path_list, num_thread=8):
     """
 
     global class_map
-    annotation_list = []
-    class_map = {}
+    # Objects of all files are stored in flat lists. Objects of the n-th file
+    # are boxes[offsets[n]:offsets[n + 1]].
+    boxes = []
+    names = []
+    counts = []
+    sizes = []
 
     def load_thread(path_list):
-        local_annotation_list = []
+        local_boxes = []
+        local_names = []
+        local_counts = []
+        local_sizes = []
         for filename in path_list:
             tree = ElementTree.parse(filename)
             root = tree.getroot()
             size_tree = root.find('size')
             width = float(size_tree.find('width').text)
             height = float(size_tree.find('height').text)
-            image_data = []
-            for object_tree in root.findall('object'):
+            object_trees = root.findall('object')
+            for object_tree in object_trees:
                 bounding_box = object_tree.find('bndbox')
                 # Clip width and height to fit the image size.
                 xmin = np.clip(float(bounding_box.find('xmin').text), 0, width)
@@ -72,13 +83,12 @@ def parse_xml_detection(xml_path_list, num_thread=8):
                 x = xmin + w / 2.
                 y = ymin + h / 2.
 
-                bounding_box = [x, y, w, h]
-                class_name = check_class_name(object_tree.find('name').text.strip())
-                class_map[class_name] = 1
-                image_data.append(
-                    {'box': bounding_box, 'name': class_name, 'size': (width, height)})
-            local_annotation_list.append(image_data)
-        return local_annotation_list
+                local_boxes.append([x, y, w, h])
+                local_names.append(check_class_name(object_tree.find('name').text.strip()))
+            local_counts.append(len(object_trees))
+            local_sizes.append((width, height))
+        return local_boxes, local_names, local_counts, local_sizes
+
     N = len(xml_path_list)
     if N > num_thread:
         batch = int(N / num_thread)
@@ -86,17 +96,30 @@ def parse_xml_detection(xml_path_list, num_thread=8):
         with Executor(max_workers=num_thread + int(N % num_thread > 0)) as exc:
             ret = exc.map(load_thread, [xml_path_list[batch * i:batch * (i + 1)]
                                         for i in range(total_batch)])
-
-        for r in ret:
-            annotation_list += r
     else:
-        annotation_list += load_thread(xml_path_list)
-
-    class_map = [k for i, k in enumerate(sorted(class_map.keys()))]
-    for annotation in annotation_list:
-        for obj in annotation:
-            obj["class"] = class_map.index(obj["name"])
-
+        ret = [load_thread(xml_path_list)]
+
+    for local_boxes, local_names, local_counts, local_sizes in ret:
+        boxes += local_boxes
+        names += local_names
+        counts += local_counts
+        sizes += local_sizes
+
+    class_map = sorted(set(names))
+    class_index = {k: i for i, k in enumerate(class_map)}
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(counts)
+    if columnar:
+        boxes = np.array(boxes, dtype=np.float32).reshape(-1, 4)
+        classes = np.array([class_index[n] for n in names], dtype=np.int32)
+        sizes = np.array(sizes, dtype=np.float32).reshape(-1, 2)
+        return AnnotationList(boxes, classes, offsets, class_map, sizes), class_map
+
+    annotation_list = [
+        [{'box': boxes[i], 'name': names[i], 'size': size, 'class': class_index[names[i]]}
+         for i in range(start, end)]
+        for start, end, size in zip(offsets[:-1], offsets[1:], sizes)
+    ]
     return annotation_list, class_map
 
 
@@ -110,12 +133,8 @@ def resize_detection_data(img_list, annotation_list, imsize):
         w, h = img.size
         sw, sh = imsize[0] / float(w), imsize[1] / float(h)
         img = img.resize(imsize, Image.BILINEAR).convert('RGB')
-        new_obj_list = [{
-            "box": [obj["box"][0] * sw, obj["box"][1] * sh, obj["box"][2] * sw, obj["box"][3] * sh],
-            **{k: v for k, v in obj.items() if k != "box"}
-        } for obj in obj_list]
         im_list.append(np.asarray(img))
-        label_list.append(new_obj_list)
+        label_list.append(scale_boxes(obj_list, sw, sh))
     return np.asarray(im_list).transpose(0, 3, 1, 2).astype(np.float32), label_list
 
 
@@ -126,12 +145,8 @@ def prepare_detection_data(img_path_list, annotation_list):
         img = Image.open(path).convert('RGB')
         # sw, sh = imsize[0] / float(w), imsize[1] / float(h)
         # img = img.resize(imsize, Image.BILINEAR)
-        new_obj_list = [{
-            "box": [obj["box"][0], obj["box"][1], obj["box"][2], obj["box"][3]],
-            **{k: v for k, v in obj.items() if k != "box"}
-        } for obj in obj_list]
         img_list.append(np.asarray(img).transpose(2, 0, 1))
-        label_list.append(new_obj_list)
+        label_list.append(replace_boxes(obj_list, box_array(obj_list)))
     return img_list, label_list
 
 
@@ -167,12 +182,23 @@ def parse_txt_classification(path, separator=" "):
 # so this method has nothing to do with augmentation processes
 
 
-def load_img(img_path, imsize=None):
+def load_img(img_path, imsize=None, return_size=False):
+    """Loads an image as an array whose shape is (channel, height, width).
+
+    Args:
+        img_path(str): Path to the image.
+        imsize(tuple): Image is resized to this size if given.
+        return_size(bool): If True, the original size (width, height) is also returned.
+    """
     img = Image.open(img_path)
+    size = img.size
     img = img.convert('RGB')
     if imsize is not None:
         img = img.resize(imsize, Image.BILINEAR)
-    return np.asarray(img).transpose(2, 0, 1).astype(np.float32)
+    img = np.asarray(img).transpose(2, 0, 1).astype(np.float32)
+    if return_size:
+        return img, size
+    return img
 
 
 def parse_classmap_file(class_map_file, separator=" "):
@@ -3,6 +3,7 @@
 from __future__ import division
 import numpy as np
 from PIL import Image
+from renom_img.api.utility.annotation import box_array, replace_boxes, scale_boxes, name_list
 
 
 """Naming Rule.
@@ -127,12 +128,8 @@ class DataBuilderDetection(DataBuilderBase):
             w, h = img.size
             sw, sh = self.imsize[0] / float(w), self.imsize[1] / float(h)
             img = img.resize(self.imsize, Image.BILINEAR).convert('RGB')
-            new_obj_list = [{
-                "box": [obj["box"][0] * sw, obj["box"][1] * sh, obj["box"][2] * sw, obj["box"][3] * sh],
-                **{k: v for k, v in obj.items() if k != "box"}
-            } for obj in obj_list]
             im_list.append(np.asarray(img))
-            label_list.append(new_obj_list)
+            label_list.append(scale_boxes(obj_list, sw, sh))
         return np.asarray(im_list).transpose(0, 3, 1, 2).astype(np.float32), label_list
 
     def build(self, img_path_list, annotation_list, augmentation=None, **kwargs):
@@ -150,8 +147,8 @@ class DataBuilderDetection(DataBuilderBase):
         if self.class_map is None:
             class_dict = {}
             for annotation in annotation_list:
-                for obj in annotation:
-                    class_dict[obj['name']] = 1
+                for name in name_list(annotation):
+                    class_dict[name] = 1
             self.class_map = {k: i for i, k in enumerate(sorted(class_dict.keys()))}
 
         img_list = []
@@ -159,21 +156,13 @@ class DataBuilderDetection(DataBuilderBase):
         for i, img_path in enumerate(img_path_list):
             img, sw, sh = self.load_img(img_path)
             img_list.append(img)
-            new_annotation_list.append([
-                {
-                    "box": [
-                        an["box"][0],
-                        an["box"][1],
-                        an["box"][2],
-                        an["box"][3],
-                    ],
-                    **{k: v for k, v in an.items() if k != 'box'}
-                }
-                for an in annotation_list[i]])
+            new_annotation_list.append(
+                replace_boxes(annotation_list[i], box_array(annotation_list[i])))
 
+        annotation_list = new_annotation_list
         if augmentation is not None:
             img_list, annotation_list = augmentation(
-                img_list, new_annotation_list, mode="detection")
+                img_list, annotation_list, mode="detection")
 
         img_list, annotation_list = self.resize_img(img_list, annotation_list)
 
@@ -183,10 +172,11 @@ class DataBuilderDetection(DataBuilderBase):
         target = np.zeros((len(annotation_list), max_obj_num * dlt), dtype=np.float32)
 
         for i, annotation in enumerate(annotation_list):
-            for j, obj in enumerate(annotation):
-                target[i, j * dlt:(j + 1) * dlt - 1] = [obj['box'][0],
-                                                        obj['box'][1], obj['box'][2], obj['box'][3]]
-                target[i, (j + 1) * dlt - 1] = self.class_map[obj['name']]
+            if len(annotation) == 0:
+                continue
+            target_i = target[i, :len(annotation) * dlt].reshape(-1, dlt)
+            target_i[:, :4] = box_array(annotation)
+            target_i[:, 4] = [self.class_map[name] for name in name_list(annotation)]
         return img_list, target
 
 
@@ -0,0 +1,155 @@
+import numpy as np
+from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+
+
+def tile_starts(length, tile, overlap):
+    """Returns start positions of tiles which cover ``length`` pixels.
+    The last tile is aligned to the end.
+
+    Args:
+        length (int): Width or height of the image.
+        tile (int): Width or height of a tile.
+        overlap (int): Overlapping pixels between adjacent tiles.
+    """
+    assert 0 <= overlap < tile, "The overlap must be smaller than the tile size."
+    if length <= tile:
+        return [0]
+    stride = tile - overlap
+    starts = list(range(0, length - tile, stride))
+    starts.append(length - tile)
+    return starts
+
+
+def tile_weight(tile_size, overlap):
+    """Returns a weight map of a tile for blending. The weight increases linearly
+    from the border in the overlapping area, so seams between tiles are smoothed.
+
+    Args:
+        tile_size (tuple): Tile size (width, height).
+        overlap (int): Overlapping pixels between adjacent tiles.
+
+    Returns:
+        (ndarray): Weight map whose shape is (height, width).
+    """
+    def ramp(length):
+        w = np.ones(length, dtype=np.float32)
+        if overlap > 0:
+            r = (np.arange(overlap, dtype=np.float32) + 1) / (overlap + 1)
+            n = min(overlap, length // 2)
+            w[:n] = r[:n]
+            w[length - n:] = r[:n][::-1]
+        return w
+    return ramp(tile_size[1])[:, None] * ramp(tile_size[0])[None]
+
+
+class TileLoader(object):
+    """Splits a large image into tiles and yields them batch by batch.
+
+    Only the header of the image is read when the loader is created. The image
+    is decoded when the iteration starts and released when it ends. If tiles are
+    shrunk to ``imsize``, JPEG images are decoded at a reduced scale with
+    ``Image.draft``, so the full resolution image is never held in memory.
+    Tiles are cropped, resized and converted to arrays by worker threads while
+    the previous batch is being processed.
+    Tiles at the right and bottom borders are aligned to the image border.
+    If the image is smaller than a tile, the tile is padded with zeros.
+
+    Args:
+        img_path (str): Path to the image.
+        tile_size (tuple): Tile size (width, height) in the original resolution.
+        overlap (int): Overlapping pixels between adjacent tiles.
+        imsize (tuple): Input size of the model. Tiles are resized to this size.
+        batch_size (int): Number of tiles in a batch.
+        num_worker (int): Number of threads for cropping tiles.
+
+    Example:
+        >>> loader = TileLoader("large.jpg", (512, 512), 64, model.imsize, 8)
+        >>> for boxes, img_array in loader:
+        ...     z = model(model.preprocess(img_array))
+    """
+
+    def __init__(self, img_path, tile_size, overlap, imsize, batch_size=8, num_worker=4):
+        self.img_path = img_path
+        with Image.open(img_path) as img:
+            self.size = img.size
+        self.tile_size = tuple(tile_size)
+        self.imsize = tuple(imsize)
+        self.batch_size = batch_size
+        self.num_worker = num_worker
+        tw, th = self.tile_size
+        # (left, top, right, bottom) of tiles in raster order.
+        self.tiles = [(left, top, left + tw, top + th)
+                      for top in tile_starts(self.size[1], th, overlap)
+                      for left in tile_starts(self.size[0], tw, overlap)]
+
+    def __len__(self):
+        return int(np.ceil(len(self.tiles) / self.batch_size))
+
+    def _open(self):
+        """Decodes the image. Returns the image and its scale to the original size."""
+        img = Image.open(self.img_path)
+        scale = min(self.imsize[0] / self.tile_size[0], self.imsize[1] / self.tile_size[1])
+        if scale < 1:
+            # Only JPEG supports this. The decoded size is not smaller than requested.
+            img.draft('RGB', (int(np.ceil(self.size[0] * scale)),
+                              int(np.ceil(self.size[1] * scale))))
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        # Decoded here, so that worker threads don't decode it at once.
+        img.load()
+        return img, (img.size[0] / self.size[0], img.size[1] / self.size[1])
+
+    def _load(self, img, scale, box):
+        if scale != (1, 1):
+            box = (int(round(box[0] * scale[0])), int(round(box[1] * scale[1])),
+                   int(round(box[2] * scale[0])), int(round(box[3] * scale[1])))
+        tile = img.crop(box)
+        if tile.size != self.imsize:
+            tile = tile.resize(self.imsize, Image.BILINEAR)
+        return np.asarray(tile, dtype=np.float32).transpose(2, 0, 1)
+
+    def __iter__(self):
+        batches = [self.tiles[i:i + self.batch_size]
+                   for i in range(0, len(self.tiles), self.batch_size)]
+        img, scale = self._open()
+        try:
+            with ThreadPoolExecutor(max_workers=self.num_worker) as executor:
+                futures = [executor.submit(self._load, img, scale, box) for box in batches[0]]
+                for n, boxes in enumerate(batches):
+                    arrays = [f.result() for f in futures]
+                    if n + 1 < len(batches):
+                        futures = [executor.submit(self._load, img, scale, box)
+                                   for box in batches[n + 1]]
+                    yield boxes, np.stack(arrays)
+        finally:
+            img.close()
+
+
+def nms_xyxy(boxes, scores, classes, threshold):
+    """Performs non maximum suppression for each class.
+
+    Args:
+        boxes (ndarray): Boxes whose shape is (N, 4). The format is (x1, y1, x2, y2).
+        scores (ndarray): Scores whose shape is (N, ).
+        classes (ndarray): Class ids whose shape is (N, ).
+        threshold (float): Boxes whose IoU with a box of higher score is larger than this are removed.
+
+    Returns:
+        (ndarray): Indices of kept boxes in descending order of score.
+    """
+    order = np.argsort(-scores, kind="mergesort")
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    while len(order) > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        x1 = np.maximum(boxes[i, 0], boxes[rest, 0])
+        y1 = np.maximum(boxes[i, 1], boxes[rest, 1])
+        x2 = np.minimum(boxes[i, 2], boxes[rest, 2])
+        y2 = np.minimum(boxes[i, 3], boxes[rest, 3])
+        inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+        iou = inter / np.maximum(area[i] + area[rest] - inter, 1e-8)
+        order = rest[(iou <= threshold) | (classes[rest] != classes[i])]
+    return np.array(keep, dtype=np.int64)
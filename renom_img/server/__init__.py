@@ -6,6 +6,9 @@ from pathlib import Path
 DB_DIR = Path("storage")
 DB_DIR_TRAINED_WEIGHT = DB_DIR / "trained_weight"
 DB_DIR_PRETRAINED_WEIGHT = DB_DIR / "pretrained_weight"
+DB_DIR_PREDICTION_MANIFEST = DB_DIR / "prediction_manifest"
+DB_DIR_RESULT = DB_DIR / "result"
+DB_DIR_THUMBNAIL = DB_DIR / "thumbnail"
 
 DATASET_DIR = Path("datasrc")
 DATASET_IMG_DIR = DATASET_DIR / "img"
@@ -18,6 +21,47 @@ DATASET_PREDICTION_DIR = DATASET_DIR / "prediction_set"
 DATASET_PREDICTION_IMG_DIR = DATASET_PREDICTION_DIR / "img"
 
 MAX_THREAD_NUM = 1
+MAX_CACHED_MODEL_NUM = 2
+PREDICTION_WORKER_NUM = 4
+
+# Online prediction of the deployed model.
+INFERENCE_MAX_BATCH_SIZE = 32
+INFERENCE_BATCH_WINDOW = 0.005  # Seconds
+INFERENCE_QUEUE_SIZE = 256
+INFERENCE_TIMEOUT = 30  # Seconds
+INFERENCE_MODEL_CHECK_INTERVAL = 1  # Seconds
+
+# Max seconds a polling request waits for the state change of a reserved thread
+# and for the progress of a running thread.
+POLLING_TIMEOUT = 60
+POLLING_UPDATE_TIMEOUT = 5
+# Min seconds between responses of polling requests of a client.
+POLLING_MIN_INTERVAL = 0.5
+
+# Seconds between writes of training progress to the database.
+PROGRESS_FLUSH_INTERVAL = 2
+
+# SQLite connections.
+DB_POOL_SIZE = 5
+DB_POOL_MAX_OVERFLOW = 10
+DB_BUSY_TIMEOUT = 30  # Seconds
+
+# Longer sides of thumbnails of dataset images. A requested size is rounded up to one of them.
+THUMBNAIL_SIZES = (64, 128, 256, 512)
+THUMBNAIL_WORKER_NUM = 4
+# Number of encoded segmentation target masks kept in memory.
+SEGMENTATION_MASK_CACHE_SIZE = 256
+# Number of loaded result artifacts kept in memory.
+RESULT_CACHE_SIZE = 4
+
+# Responses smaller than GZIP_MIN_SIZE bytes are not compressed.
+GZIP_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+
+# Number of items in a page of paginated APIs. Clients can request pages of
+# at most PAGE_MAX_LIMIT items.
+PAGE_DEFAULT_LIMIT = 100
+PAGE_MAX_LIMIT = 1000
 
 DATASET_NAME_MAX_LENGTH = 20
 DATASET_NAME_MIN_LENGTH = 1
@@ -27,7 +71,8 @@ DATASET_DESCRIPTION_MIN_LENGTH = 0
 
 def create_directories():
     dirs = [
-        DB_DIR, DB_DIR_TRAINED_WEIGHT, DB_DIR_PRETRAINED_WEIGHT,
+        DB_DIR, DB_DIR_TRAINED_WEIGHT, DB_DIR_PRETRAINED_WEIGHT, DB_DIR_PREDICTION_MANIFEST,
+        DB_DIR_RESULT, DB_DIR_THUMBNAIL,
         DATASET_IMG_DIR, DATASET_LABEL_DIR, DATASET_LABEL_CLASSIFICATION_DIR,
         DATASET_LABEL_DETECTION_DIR, DATASET_LABEL_SEGMENTATION_DIR,
         DATASET_PREDICTION_DIR, DATASET_PREDICTION_IMG_DIR
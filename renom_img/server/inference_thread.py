@@ -0,0 +1,182 @@
+import os
+import time
+import queue
+import traceback
+from threading import Thread, Event, Lock
+import numpy as np
+
+from renom.cuda import set_cuda_active, release_mem_pool
+from renom_img.api.utility.load import load_img
+from renom_img.server.prediction_thread import ModelLoader
+from renom_img.server.utility.storage import storage
+from renom_img.server import Task
+from renom_img.server import INFERENCE_MAX_BATCH_SIZE, INFERENCE_BATCH_WINDOW, \
+    INFERENCE_QUEUE_SIZE, INFERENCE_MODEL_CHECK_INTERVAL
+
+
+class InferenceOverloadError(Exception):
+    pass
+
+
+class InferenceRequest(object):
+    """A prediction request of one image. The result is set by the inference thread.
+
+    Args:
+        img (ndarray): Preprocessed image array whose shape is (channel, height, width).
+        size (tuple): Original image size (width, height).
+    """
+
+    def __init__(self, img, size):
+        self.img = img
+        self.size = size
+        self.result = None
+        self.error = None
+        self._done = Event()
+
+    def set_result(self, result):
+        self.result = result
+        self._done.set()
+
+    def set_error(self, error):
+        self.error = error
+        self._done.set()
+
+    def wait(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise InferenceOverloadError("Prediction timed out.")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class InferenceThread(object):
+    """Serves online prediction with the deployed model of a task.
+
+    Requests are put to a bounded queue. The thread takes a request and waits
+    at most ``batch_window`` seconds for following ones, then runs one forward
+    propagation for up to ``max_batch_size`` images. Requests which can not be
+    queued are rejected with InferenceOverloadError.
+
+    Args:
+        task_id (int): Task id of the deployed model.
+        max_batch_size (int): Max number of images coalesced into a batch.
+        batch_window (float): Seconds to wait for coalesced requests.
+        queue_size (int): Max number of waiting requests.
+    """
+
+    jobs = {}
+    jobs_lock = Lock()
+
+    @classmethod
+    def get(cls, task_id):
+        """Returns the thread of the task. A thread is created only for a task
+        which has a deployed model, so unknown ids never create threads.
+        """
+        if task_id not in [t.value for t in Task]:
+            raise Exception("Task {} is not found.".format(task_id))
+        if storage.fetch_deployed_model(task_id, columns=("id", )) is None:
+            raise Exception("No model deployed.")
+        with cls.jobs_lock:
+            thread = cls.jobs.get(task_id, None)
+            if thread is None:
+                thread = cls(task_id)
+                cls.jobs[task_id] = thread
+            return thread
+
+    def __init__(self, task_id, max_batch_size=INFERENCE_MAX_BATCH_SIZE,
+                 batch_window=INFERENCE_BATCH_WINDOW, queue_size=INFERENCE_QUEUE_SIZE):
+        set_cuda_active(True)
+        self.task_id = task_id
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.model = None
+        self.model_key = None
+        self.loader = None
+        self.model_lock = Lock()
+        self.checked_at = 0
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def load_model(self):
+        """Returns the deployed model. The deployed model is checked at most once
+        per INFERENCE_MODEL_CHECK_INTERVAL seconds, and loaded again if another
+        model is deployed or its weight file is updated.
+        """
+        with self.model_lock:
+            if self.model is not None and time.time() - self.checked_at < INFERENCE_MODEL_CHECK_INTERVAL:
+                return self.model, self.loader
+            deployed = storage.fetch_deployed_model(self.task_id, columns=("best_epoch_weight", ))
+            if deployed is None:
+                self.model = None
+                raise Exception("No model deployed.")
+            key = (deployed["id"], os.path.getmtime(deployed["best_epoch_weight"]))
+            self.checked_at = time.time()
+            if self.model_key != key:
+                loader = ModelLoader(deployed["id"])
+                self.model = loader.load()
+                self.model_key = key
+                self.loader = loader
+            return self.model, self.loader
+
+    def submit(self, img_file):
+        """Decodes an image in the caller's thread and queues it.
+
+        Args:
+            img_file (file): Image file object.
+
+        Returns:
+            (InferenceRequest): Request object. Call ``wait()`` to get the result.
+        """
+        model, _ = self.load_model()
+        img, size = load_img(img_file, model.imsize, return_size=True)
+        request = InferenceRequest(model.preprocess(img[None])[0], size)
+        try:
+            self.queue.put_nowait(request)
+        except queue.Full:
+            raise InferenceOverloadError("Too many prediction requests.")
+        return request
+
+    def next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.time() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            try:
+                model, loader = self.load_model()
+                shape = (model.imsize[1], model.imsize[0])
+                # Images decoded for a previously deployed model can not be stacked.
+                valid = []
+                for request in batch:
+                    if request.img.shape[1:] == shape:
+                        valid.append(request)
+                    else:
+                        request.set_error(Exception("Deployed model is changed. Retry the request."))
+                if not valid:
+                    continue
+                img_array = np.vstack([request.img[None] for request in valid])
+                # The model may be shared with prediction threads.
+                with loader.lock:
+                    results = model._predict_array(img_array)
+                for request, pred in zip(valid, results):
+                    request.set_result({
+                        "size": request.size,
+                        "prediction": loader.format_prediction(pred, columnar=False)
+                    })
+            except Exception as e:
+                traceback.print_exc()
+                release_mem_pool()
+                for request in batch:
+                    if not request._done.is_set():
+                        request.set_error(e)
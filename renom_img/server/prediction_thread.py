@@ -5,7 +5,6 @@ import json
 import weakref
 import traceback
 from threading import Event
-from PIL import Image
 sys.setrecursionlimit(10000)
 import numpy as np
 
@@ -22,143 +21,49 @@ from renom_img.api.segmentation.unet import UNet
 from renom_img.api.segmentation.fcn import FCN8s, FCN16s, FCN32s
 
 from renom_img.server.utility.semaphore import EventSemaphore, Semaphore
+from renom_img.server.utility.model_cache import ModelCache
+from renom_img.server.utility.notifier import UpdateNotifier
 from renom_img.server.utility.storage import storage
+from renom_img.server.utility.artifact import encode_mask, encode_boxes
 from renom_img.server import State, RunningState, MAX_THREAD_NUM, Algorithm, Task
+from renom_img.server import MAX_CACHED_MODEL_NUM, PREDICTION_WORKER_NUM, DB_DIR_PREDICTION_MANIFEST
 
 
-class PredictionThread(object):
+class ModelLoader(UpdateNotifier):
+    """Builds a trained model from the stored hyper parameters and loads its best weight.
+    Loaded models are shared through the LRU cache. Forward propagation of the
+    model must be performed holding ``self.lock``.
+    """
 
-    jobs = weakref.WeakValueDictionary()
-    semaphore = EventSemaphore(MAX_THREAD_NUM)  # Cancellable semaphore.
-    # semaphore = Semaphore(MAX_THREAD_NUM)
-
-    def __new__(cls, model_id):
-        ret = super(PredictionThread, cls).__new__(cls)
-        cls.jobs[model_id] = ret
-        return ret
-
-    def set_future(self, future_obj):
-        self.future = future_obj
+    model_cache = ModelCache(MAX_CACHED_MODEL_NUM)
 
     def __init__(self, model_id):
-        # Thread attrs.
-        set_cuda_active(True)
         self.model = None
-        self.stop_event = Event()
+        self.lock = None
         self.model_id = model_id
-        self.state = State.PRED_CREATED
-        self.running_state = RunningState.PREPARING
-        self.sync_state()
-
-        # If any value (train_loss or ...) is changed, this will be True.
-        self.updated = True
-
-        # This will be changed from web API.
-        self.error_msg = None
-
-        # Data path
-        self.img_dir = os.path.join("datasrc", "prediction_set", "img")
-
-        # Define attr
-        self.total_batch = 0
-        self.nth_batch = 0
-        self.need_pull = False
-        self.prediction_result = []
-
-    def __call__(self):
-        try:
-            self.state = State.PRED_RESERVED
-            self.sync_state()
-
-            # This guarantees the state information returns immediately.
-            self.updated = True
-
-            PredictionThread.semaphore.acquire(self.stop_event)
-            if self.stop_event.is_set():
-                # Watch stop event
-                self.updated = True
-                return
-
-            self.state = State.PRED_STARTED
-            self._prepare_params()
-            self._prepare_model()
-            release_mem_pool()
-            self.running_state = RunningState.STARTING
-            assert self.model is not None
-            self.sync_state()
-            self.run()
-        except Exception as e:
-            traceback.print_exc()
-            self.error_msg = e
-            self.model = None
-        finally:
-            release_mem_pool()
-            PredictionThread.semaphore.release()
-            self.state = State.STOPPED
-            self.running_state = RunningState.STOPPING
-            self.sync_state()
-
-    def returned2client(self):
+        self.stop_event = Event()
         self.updated = False
 
-    def consume_error(self):
-        if self.error_msg is not None:
-            e = self.error_msg
-            self.error_msg = None
-            raise e
-
-    def run(self):
-        model = self.model
-        self.state = State.PRED_STARTED
-        self.running_state = RunningState.PREDICTING
-
-        if self.stop_event.is_set():
-            # Watch stop event
-            self.updated = True
-            return
-        names = list(os.listdir(self.img_dir))
-        N = len(names)
-        results = []
-        sizes = []
-        imgs = []
-        self.total_batch = N
-        for i, p in enumerate(names):
-            self.nth_batch = i
-            path = os.path.join(self.img_dir, p)
-            pred = self.model.predict(path)
-            if not isinstance(pred, list):
-                pred = pred.tolist()
-            results.append(pred)
-            sizes.append(Image.open(path).size)
-            imgs.append(path)
-            self.updated = True
-
+    def load(self):
+        self._prepare_params()
+        self._prepare_model()
+        return self.model
+
+    def format_prediction(self, pred, columnar=True):
+        """Returns a prediction of one image in the form of the results.
+        Detected objects are packed into arrays as they are stored if ``columnar``
+        is True, otherwise they are returned as the list of dictionaries.
+        """
+        if self.task_id == Task.SEGMENTATION.value:
+            # Class maps are run length encoded.
+            return {"class": encode_mask(pred)}
+        if self.task_id == Task.DETECTION.value:
+            return encode_boxes(pred) if columnar else pred
+        if not isinstance(pred, list):
+            pred = pred.tolist()
         if self.task_id == Task.CLASSIFICATION.value:
-            results = [{"class": r} for r in results]
-        elif self.task_id == Task.DETECTION.value:
-            pass
-        elif self.task_id == Task.SEGMENTATION.value:
-            results = [{"class": r} for r in results]
-
-        self.prediction_result = {
-            "img": imgs,
-            "size": sizes,
-            "prediction": results,
-        }
-        self.need_pull = True
-        self.sync_result()
-        return
-
-    def stop(self):
-        self.stop_event.set()
-        self.running_state = RunningState.STOPPING
-
-    def sync_state(self):
-        storage.update_model(self.model_id, state=self.state.value,
-                             running_state=self.running_state.value)
-
-    def sync_result(self):
-        storage.update_model(self.model_id, last_prediction_result=self.prediction_result)
+            return {"class": pred}
+        return pred
 
     def _prepare_params(self):
         if self.stop_event.is_set():
@@ -166,15 +71,16 @@ class PredictionThread(object):
             self.updated = True
             return
 
-        params = storage.fetch_model(self.model_id)
+        params = storage.fetch_model(self.model_id, exclude=("best_epoch_valid_result", ))
         self.task_id = int(params["task_id"])
         self.dataset_id = int(params["dataset_id"])
         self.algorithm_id = int(params["algorithm_id"])
         self.hyper_parameters = params["hyper_parameters"]
         self.last_weight_path = params["last_weight"]
         self.best_weight_path = params["best_epoch_weight"]
+        self.last_prediction_result = params["last_prediction_result"]
 
-        dataset = storage.fetch_dataset(self.dataset_id)
+        dataset = storage.fetch_dataset(self.dataset_id, columns=("class_map", ))
         self.class_map = dataset["class_map"]
 
         self.common_params = [
@@ -202,6 +108,12 @@ class PredictionThread(object):
             self.updated = True
             return
 
+        # Reuse the loaded model if its weight file is not changed.
+        cache_key = (self.model_id, os.path.getmtime(self.best_weight_path))
+        self.model, self.lock = ModelLoader.model_cache.get(cache_key)
+        if self.model is not None:
+            return
+
         if self.algorithm_id == Algorithm.RESNET.value:
             self._setting_resnet()
         elif self.algorithm_id == Algorithm.RESNEXT.value:
@@ -227,6 +139,7 @@ class PredictionThread(object):
         else:
             assert False
         self.model.load(self.best_weight_path)
+        self.model, self.lock = ModelLoader.model_cache.put(cache_key, self.model)
 
     # Detection Algorithm
     def _setting_yolov1(self):
@@ -402,3 +315,187 @@ class PredictionThread(object):
             load_pretrained_weight=self.load_pretrained_weight,
             train_whole_network=self.train_whole
         )
+
+
+class PredictionThread(ModelLoader):
+
+    jobs = weakref.WeakValueDictionary()
+    semaphore = EventSemaphore(MAX_THREAD_NUM)  # Cancellable semaphore.
+    # semaphore = Semaphore(MAX_THREAD_NUM)
+
+    def __new__(cls, model_id, *args, **kwargs):
+        ret = super(PredictionThread, cls).__new__(cls)
+        cls.jobs[model_id] = ret
+        return ret
+
+    def set_future(self, future_obj):
+        self.future = future_obj
+
+    def __init__(self, model_id, incremental=True):
+        # Thread attrs.
+        set_cuda_active(True)
+        self.model = None
+        self.stop_event = Event()
+        self.model_id = model_id
+        self.state = State.PRED_CREATED
+        self.running_state = RunningState.PREPARING
+        self.sync_state()
+
+        # If any value (train_loss or ...) is changed, this will be True.
+        self.updated = True
+
+        # This will be changed from web API.
+        self.error_msg = None
+
+        # Data path
+        self.img_dir = os.path.join("datasrc", "prediction_set", "img")
+
+        # Define attr
+        self.total_batch = 0
+        self.nth_batch = 0
+        # Version at which the prediction result is created.
+        self.result_version = 0
+        self.prediction_result = []
+
+        # If True, only new or changed images are predicted.
+        self.incremental = incremental
+        self.manifest_path = DB_DIR_PREDICTION_MANIFEST / "model_{}.json".format(model_id)
+
+    def __call__(self):
+        try:
+            self.state = State.PRED_RESERVED
+            self.sync_state()
+
+            # This guarantees the state information returns immediately.
+            self.updated = True
+
+            PredictionThread.semaphore.acquire(self.stop_event)
+            if self.stop_event.is_set():
+                # Watch stop event
+                self.updated = True
+                return
+
+            self.state = State.PRED_STARTED
+            self.updated = True
+            self._prepare_params()
+            self._prepare_model()
+            release_mem_pool()
+            self.running_state = RunningState.STARTING
+            assert self.model is not None
+            self.sync_state()
+            self.run()
+        except Exception as e:
+            traceback.print_exc()
+            self.error_msg = e
+            self.model = None
+        finally:
+            release_mem_pool()
+            PredictionThread.semaphore.release()
+            self.state = State.STOPPED
+            self.running_state = RunningState.STOPPING
+            self.sync_state()
+            self.updated = True
+
+    def consume_error(self):
+        if self.error_msg is not None:
+            e = self.error_msg
+            self.error_msg = None
+            raise e
+
+    def run(self):
+        model = self.model
+        self.state = State.PRED_STARTED
+        self.running_state = RunningState.PREDICTING
+
+        if self.stop_event.is_set():
+            # Watch stop event
+            self.updated = True
+            return
+        imgs = [os.path.join(self.img_dir, p) for p in os.listdir(self.img_dir)]
+        manifest = self.create_manifest(imgs)
+        # Results of images which are not changed since the last prediction.
+        reusable = self.load_reusable_result(manifest) if self.incremental else {}
+        targets = [p for p in imgs if p not in reusable]
+
+        predicted = {}
+        self.total_batch = int(np.ceil(len(targets) / self.batch_size))
+        batch_iter = model.predict_iter(targets, self.batch_size, num_worker=PREDICTION_WORKER_NUM,
+                                        return_size=True, lock=self.lock)
+        offset = 0
+        for i, (preds, batch_sizes) in enumerate(batch_iter):
+            if self.stop_event.is_set():
+                # Watch stop event
+                self.updated = True
+                return
+            self.nth_batch = i
+            for path, pred, size in zip(targets[offset:], preds, batch_sizes):
+                predicted[path] = (size, self.format_prediction(pred))
+            offset += len(preds)
+            self.updated = True
+
+        merged = [reusable[p] if p in reusable else predicted[p] for p in imgs]
+        self.prediction_result = {
+            "img": imgs,
+            "size": [size for size, _ in merged],
+            "prediction": [pred for _, pred in merged],
+        }
+        self.sync_result()
+        # The version is recorded before waiting requests wake up.
+        with self._update_condition:
+            self.updated = True
+            self.result_version = self.version
+        self.save_manifest(manifest)
+        return
+
+    def create_manifest(self, img_path_list):
+        """Creates a manifest which identifies the weight and each image file.
+        Size and modification time are used for detecting changed files.
+        """
+        files = {}
+        for path in img_path_list:
+            stat = os.stat(path)
+            files[path] = [stat.st_size, stat.st_mtime_ns]
+        return {
+            "weight": [self.best_weight_path, os.stat(self.best_weight_path).st_mtime_ns],
+            "files": files
+        }
+
+    def save_manifest(self, manifest):
+        tmp_path = str(self.manifest_path) + ".tmp"
+        with open(tmp_path, "w") as writer:
+            json.dump(manifest, writer)
+        os.replace(tmp_path, str(self.manifest_path))
+
+    def load_reusable_result(self, manifest):
+        """Returns {path: (size, prediction)} of images whose predictions in
+        the last result are still valid for the given manifest.
+        """
+        if not self.manifest_path.exists() or not self.last_prediction_result:
+            return {}
+        try:
+            with open(str(self.manifest_path)) as reader:
+                last_manifest = json.load(reader)
+        except ValueError:
+            return {}
+        # Results of other weights can not be reused.
+        if last_manifest.get("weight") != manifest["weight"]:
+            return {}
+
+        last = self.last_prediction_result
+        last_files = last_manifest.get("files", {})
+        reusable = {}
+        for path, size, pred in zip(last["img"], last["size"], last["prediction"]):
+            if path in manifest["files"] and last_files.get(path) == manifest["files"][path]:
+                reusable[path] = (size, pred)
+        return reusable
+
+    def stop(self):
+        self.stop_event.set()
+        self.running_state = RunningState.STOPPING
+
+    def sync_state(self):
+        storage.update_model(self.model_id, state=self.state.value,
+                             running_state=self.running_state.value)
+
+    def sync_result(self):
+        storage.update_model(self.model_id, last_prediction_result=self.prediction_result)
@@ -3,6 +3,7 @@
 import os
 import time
 import base64
+import hashlib
 import pkg_resources
 import argparse
 import urllib
@@ -14,6 +15,7 @@ import random
 import pandas as pd
 from datetime import datetime
 from collections import OrderedDict
+from functools import lru_cache
 import xmltodict
 import simplejson as json
 from PIL import Image
@@ -34,11 +36,20 @@ from renom_img.server import wsgi_server
 from renom_img.server import wsgi_server
 from renom_img.server.train_thread import TrainThread
 from renom_img.server.prediction_thread import PredictionThread
-from renom_img.server.utility.storage import storage
+from renom_img.server.inference_thread import InferenceThread, InferenceOverloadError
+from renom_img.server.utility.storage import storage, MODEL_RESULT_COLUMNS
+from renom_img.server.utility.progress import progress_store
+from renom_img.server.utility.artifact import encode_mask, decode_mask, load_result, result_digest
+from renom_img.server.utility.artifact import decode_boxes, is_encoded_boxes
+from renom_img.server.utility.thumbnail import thumbnail_cache
+from renom_img.server.utility.http_cache import cached_static_file, encoded_response, gzip_compress
+from renom_img.server.utility.http_cache import is_not_modified, not_modified
 from renom_img.server import State, RunningState, Task
 from renom_img.server import DATASET_IMG_DIR, DATASET_LABEL_CLASSIFICATION_DIR, \
     DATASET_LABEL_DETECTION_DIR, DATASET_LABEL_SEGMENTATION_DIR
 from renom_img.server import DATASET_NAME_MAX_LENGTH, DATASET_DESCRIPTION_MAX_LENGTH
+from renom_img.server import INFERENCE_TIMEOUT, POLLING_TIMEOUT, POLLING_UPDATE_TIMEOUT, POLLING_MIN_INTERVAL
+from renom_img.server import PAGE_DEFAULT_LIMIT, PAGE_MAX_LIMIT, SEGMENTATION_MASK_CACHE_SIZE, GZIP_MIN_SIZE
 from renom_img.server.utility.setup_example import setup_example
 
 
@@ -46,7 +57,6 @@ from renom_img.server.utility.setup_example import setup_example
 executor = Executor(max_workers=2)
 train_thread_pool = {}
 prediction_thread_pool = {}
-respopnse_cache = {}
 
 # temporary stored dataset
 # {hash: dataset}
@@ -57,10 +67,21 @@ def get_train_thread_count():
     return len([th for th in train_thread_pool.values() if th[0].running()])
 
 
-def create_response(body, status=200):
-    r = HTTPResponse(status=status, body=body)
-    r.set_header('Content-Type', 'application/json')
-    return r
+def create_response(body, status=200, etag=None):
+    headers = {'Content-Type': 'application/json'}
+    if etag is not None:
+        headers['ETag'] = etag
+    return encoded_response(body, status, headers)
+
+
+def check_etag(etag):
+    """Raises "304 Not Modified" if the client already has the response of ``etag``.
+    Use this in a function decorated by ``json_handler`` before building a large
+    response which never changes, and pass the same ``etag`` to the response.
+    """
+    if is_not_modified(etag):
+        raise not_modified(etag)
+    request.environ['renom_img.etag'] = etag
 
 
 def strip_path(filename):
@@ -75,43 +96,66 @@ def strip_path(filename):
     return filename
 
 
+# {resource name: (body, gzipped body, etag)}
+_resource_cache = {}
+
+
+def _load_resource(name):
+    cached = _resource_cache.get(name, None)
+    if cached is None:
+        body = pkg_resources.resource_string(__name__, name)
+        # Use a pre-compressed variant if the build has it.
+        if pkg_resources.resource_exists(__name__, name + '.gz'):
+            gzipped = pkg_resources.resource_string(__name__, name + '.gz')
+        elif len(body) >= GZIP_MIN_SIZE:
+            gzipped = gzip_compress(body)
+        else:
+            gzipped = None
+        etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+        cached = (body, gzipped, etag)
+        _resource_cache[name] = cached
+    return cached
+
+
 def _get_resource(path, filename):
     filename = strip_path(filename)
-    body = pkg_resources.resource_string(__name__, posixpath.join('.build', path, filename))
+    body, gzipped, etag = _load_resource(posixpath.join('.build', path, filename))
+    if is_not_modified(etag):
+        return not_modified(etag)
 
-    headers = {}
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
     mimetype, encoding = mimetypes.guess_type(filename)
     if mimetype:
         headers['Content-Type'] = mimetype
     if encoding:
         headers['encoding'] = encoding
-    return HTTPResponse(body, **headers)
+    return encoded_response(body, headers=headers, gzipped=gzipped)
 
 
 def json_encoder(obj):
     if isinstance(obj, datetime):
         return obj.isoformat()
+    elif isinstance(obj, np.ndarray):
+        return obj.tolist()
+    elif isinstance(obj, np.generic):
+        return obj.item()
 
 
 def json_handler(func):
     def wrapped(*args, **kwargs):
-        global respopnse_cache
         try:
             ret = func(*args, **kwargs)
             if ret is None:
                 ret = {}
 
-            if respopnse_cache.get(func.__name__, None) == ret and False:
-                # If server will return same value as last response, return 204.
-                body = json.dumps({}, ignore_nan=True, default=json_encoder)
-                return create_response(body, 204)
-            else:
-                assert isinstance(ret, dict),\
-                    "The returned object of the API '{}' is not a dictionary.".format(func.__name__)
-                respopnse_cache[func.__name__] = ret
-                body = json.dumps(ret, ignore_nan=True, default=json_encoder)
-                return create_response(body)
+            assert isinstance(ret, dict),\
+                "The returned object of the API '{}' is not a dictionary.".format(func.__name__)
+            body = json.dumps(ret, ignore_nan=True, default=json_encoder)
+            return create_response(body, etag=request.environ.get('renom_img.etag', None))
 
+        except HTTPResponse as r:
+            # Raised by check_etag.
+            return r
         except Exception as e:
             release_mem_pool()
             traceback.print_exc()
@@ -121,6 +165,97 @@ def json_handler(func):
     return wrapped
 
 
+def get_seen_version():
+    """Returns the request parameter "version", which is the version of the thread
+    in the last response the client has received. None if it is not given.
+    """
+    version = request.query.get("version", None)
+    return int(version) if version else None
+
+
+def result_etag(model_id, name, ref, offset, limit, fields=()):
+    """Returns the entity tag of a page of a stored result. The tag has the
+    digest of the result, so results written in the same second don't share it.
+
+    Args:
+        ref (dict): Reference of the result returned by ``storage.fetch_model``
+            with ``load_results=False``.
+    """
+    key = "{}:{}:{}:{}:{}:{}".format(model_id, name, result_digest(ref), offset, limit,
+                                     ",".join(fields))
+    return '"{}"'.format(hashlib.sha1(key.encode()).hexdigest())
+
+
+def get_page():
+    """Returns the offset and the limit given as the request parameters
+    "offset" and "limit". The limit is PAGE_DEFAULT_LIMIT if it is not given,
+    and never exceeds PAGE_MAX_LIMIT.
+    """
+    offset = max(int(request.params.get("offset", None) or 0), 0)
+    limit = int(request.params.get("limit", None) or PAGE_DEFAULT_LIMIT)
+    limit = min(max(limit, 0), PAGE_MAX_LIMIT)
+    return offset, limit
+
+
+def get_fields(keys):
+    """Returns the keys given as the comma separated request parameter "fields".
+    Only the keys in ``keys`` are returned, and all of them if it is not given.
+    """
+    fields = request.params.get("fields", None)
+    if not fields:
+        return tuple(keys)
+    fields = fields.split(",")
+    return tuple(k for k in keys if k in fields)
+
+
+def paginate(result, keys, offset, limit, fields=None):
+    """Slices the lists of ``keys`` in ``result`` in the same way.
+
+    Args:
+        result (dict): Dictionary which has lists of the same length.
+        keys (list): Keys of the lists to be sliced.
+        offset (int): Index of the first item.
+        limit (int): Number of items.
+        fields (list): Keys of the lists to be returned. The other lists of ``keys``
+            are removed. All of them are returned if None.
+
+    Returns:
+        (tuple): Sliced copy of ``result`` and the number of items before slicing.
+    """
+    if not result:
+        return result, 0
+    end = offset + limit
+    sliced = dict(result)
+    total = 0
+    for k in keys:
+        if isinstance(sliced.get(k), list):
+            total = len(sliced[k])
+            if fields is None or k in fields:
+                sliced[k] = sliced[k][offset:end]
+            else:
+                del sliced[k]
+    return sliced, total
+
+
+def decode_page_boxes(result, model_id, thread=None):
+    """Converts the detected objects in ``result["prediction"]``, which are stored
+    as arrays, to the lists of dictionaries. The class map is read from ``thread``
+    if it is given, otherwise from the dataset of the model.
+    """
+    preds = result.get("prediction") if result else None
+    if not preds or not any(is_encoded_boxes(p) for p in preds):
+        return result
+    class_map = thread.class_map if thread is not None else model_class_map(model_id)
+    result["prediction"] = [decode_boxes(p, class_map) if is_encoded_boxes(p) else p
+                            for p in preds]
+    return result
+
+
+def model_class_map(model_id):
+    model = storage.fetch_model(model_id, columns=("dataset_id", ), load_results=False)
+    return storage.fetch_dataset(model["dataset_id"], columns=("class_map", ))["class_map"]
+
+
 @route("/")
 def index():
     return _get_resource('', 'index.html')
@@ -150,14 +285,32 @@ def error404(error):
 
 @route("/datasrc/<folder_name:path>/<file_name:path>")
 def datasrc(folder_name, file_name):
+    """
+    If the query parameter "size" is given, a thumbnail whose longer side is
+    at most "size" pixels is returned instead of the original image.
+    """
     file_dir = os.path.join('datasrc', folder_name)
-    return static_file(file_name, root=file_dir, mimetype='image/*')
+    size = request.query.get("size", None)
+    if size:
+        root = os.path.abspath('datasrc')
+        path = os.path.abspath(os.path.join(file_dir, file_name))
+        if path.startswith(root + os.sep) and os.path.isfile(path):
+            path = thumbnail_cache.get(path, int(size))
+            file_dir, file_name = os.path.split(path)
+    return cached_static_file(file_name, root=file_dir, mimetype='image/*')
+
+
+@lru_cache(maxsize=SEGMENTATION_MASK_CACHE_SIZE)
+def load_segmentation_mask(path, mtime_ns, size):
+    img = np.array(Image.open(path).resize(size)).astype(np.uint8)
+    img[img == 255] = 0
+    return encode_mask(img)
 
 
 @route("/api/renom_img/v2/model/<model_id:int>/export/", method="GET")
 def export_csv(model_id):
     try:
-        model = storage.fetch_model(model_id)
+        model = storage.fetch_model(model_id, exclude=("best_epoch_valid_result", ))
         prediction = model["last_prediction_result"]
         task_id = model["task_id"]
         print(task_id)
@@ -177,11 +330,12 @@ def export_csv(model_id):
             img_path = prediction["img"]
             sizes = prediction["size"]
             prediction = prediction["prediction"]
+            class_map = model_class_map(model_id)
             for img, size, pred in zip(img_path, sizes, prediction):
                 ret.append({
                     'path': img,
                     'size': size,
-                    'predictions': pred
+                    'predictions': decode_boxes(pred, class_map) if is_encoded_boxes(pred) else pred
                 })
 
         elif task_id == Task.SEGMENTATION.value:
@@ -192,7 +346,8 @@ def export_csv(model_id):
                 ret.append({
                     'path': img,
                     'size': size,
-                    'predictions': pred
+                    'predictions': pred if isinstance(pred["class"], list)
+                    else {"class": decode_mask(pred["class"]).tolist()}
                 })
         else:
             raise Exception("Not supported task id.")
@@ -217,10 +372,8 @@ def segmentation_target_mask():
     path = pathlib.Path(path)
     file_dir = path.with_suffix('.png').relative_to('datasrc/img')
     file_dir = 'datasrc/label/segmentation' / file_dir
-    img = np.array(Image.open(file_dir).resize(size)).astype(np.uint8)
-    img[img == 255] = 0
-    img = img.tolist()
-    return {"class": img}
+    # The mask is run length encoded and cached until the label file is modified.
+    return {"class": load_segmentation_mask(str(file_dir), os.stat(str(file_dir)).st_mtime_ns, tuple(size))}
 
 
 # WEB APIs
@@ -241,15 +394,32 @@ def model_create():
 @route("/api/renom_img/v2/model/load/task/<task_id:int>", method="GET")
 @json_handler
 def models_load_of_task(task_id):
-    models = storage.fetch_models_of_task(task_id)
-    # Remove best_valid_changed because it is very large.
-    models = [
-        {k: v if k not in [
-            "best_epoch_valid_result",
-            "last_prediction_result"] else {} for k, v in m.items()}
-        for m in models
-    ]
-    return {'model_list': models}
+    """
+    If the query parameter "since" (the "since" value of the last response) is given,
+    only models updated after it and models whose progress is not written yet are
+    returned in "model_list". "model_ids" always has ids of all models, so that
+    the client can find removed models.
+    """
+    since = request.query.get("since", None)
+    if since:
+        since = datetime.strptime(since.replace("T", " ")[:19], "%Y-%m-%d %H:%M:%S")
+    else:
+        since = None
+    # Results are very large, so they are not loaded. The client fetches them separately.
+    models = storage.fetch_models_of_task(task_id, since, ids=progress_store.pending_ids(),
+                                          exclude=MODEL_RESULT_COLUMNS)
+    for m in models:
+        # Progress of running models may not be written yet.
+        m.update(progress_store.pending(m["id"]))
+        m.update({c: {} for c in MODEL_RESULT_COLUMNS})
+    updated = [m["updated"] for m in models if m.get("updated") is not None]
+    if updated:
+        since = max(updated)
+    return {
+        'model_list': models,
+        'model_ids': storage.fetch_model_ids_of_task(task_id),
+        'since': since,
+    }
 
 
 @route("/api/renom_img/v2/model/thread/run/<id:int>", method="GET")
@@ -310,7 +480,7 @@ def model_undeploy(task_id):
 @route("/api/renom_img/v2/model/load/deployed/task/<id:int>", method="GET")
 @json_handler
 def model_load_id_deployed_of_task(id):
-    dep_model = storage.fetch_deployed_model(id)
+    dep_model = storage.fetch_deployed_model(id, columns=("id", ))
     if dep_model:
         return {"deployed_id": dep_model["id"]}
     else:
@@ -321,38 +491,61 @@ def model_load_id_deployed_of_task(id):
 @json_handler
 def model_load_best_result(id):
     thread = TrainThread.jobs.get(id, None)
+    offset, limit = get_page()
+    fields = get_fields(("prediction", ))
     if thread is None:
-        saved_model = storage.fetch_model(id)
+        # The result is read from the file only if the client doesn't have it.
+        saved_model = storage.fetch_model(id, exclude=("last_prediction_result", ), load_results=False)
         if saved_model is None:
             return
+        ref = saved_model['best_epoch_valid_result']
         # If the state == STOPPED, client will never throw request.
         if saved_model["state"] != State.STOPPED.value:
             storage.update_model(id, state=State.STOPPED.value,
                                  running_state=RunningState.STOPPING.value)
-            saved_model = storage.fetch_model(id)
-        return {"best_result": saved_model['best_epoch_valid_result']}
+        else:
+            check_etag(result_etag(id, "best_epoch_valid_result", ref, offset, limit, fields))
+        version = result_digest(ref)
+        result = load_result(ref)
     else:
-        thread.returned_best_result2client()
-        return {"best_result": thread.best_epoch_valid_result}
+        # The version is read before the result because the thread updates it after
+        # the result. Two pages of different results never share a version.
+        version = str(thread.best_valid_version)
+        result = thread.best_epoch_valid_result
+    result, total = paginate(result, ("prediction", ), offset, limit, fields)
+    result = decode_page_boxes(result, id, thread)
+    return {"best_result": result, "total": total, "offset": offset, "limit": limit,
+            "version": version}
 
 
 @route("/api/renom_img/v2/model/load/prediction/result/<id:int>", method="GET")
 @json_handler
 def model_load_prediction_result(id):
     thread = PredictionThread.jobs.get(id, None)
+    offset, limit = get_page()
+    fields = get_fields(("img", "size", "prediction"))
     if thread is None:
-        saved_model = storage.fetch_model(id)
+        # The result is read from the file only if the client doesn't have it.
+        saved_model = storage.fetch_model(id, exclude=("best_epoch_valid_result", ), load_results=False)
         if saved_model is None:
             raise Exception("Model id {} is not found".format(id))
+        ref = saved_model['last_prediction_result']
         # If the state == STOPPED, client will never throw request.
         if saved_model["state"] != State.STOPPED.value:
             storage.update_model(id, state=State.STOPPED.value,
                                  running_state=RunningState.STOPPING.value)
-            saved_model = storage.fetch_model(id)
-        return {"result": saved_model['last_prediction_result']}
+        else:
+            check_etag(result_etag(id, "last_prediction_result", ref, offset, limit, fields))
+        version = result_digest(ref)
+        result = load_result(ref)
     else:
-        thread.need_pull = False
-        return {"result": thread.prediction_result}
+        # See model_load_best_result.
+        version = str(thread.result_version)
+        result = thread.prediction_result
+    result, total = paginate(result, ("img", "size", "prediction"), offset, limit, fields)
+    result = decode_page_boxes(result, id, thread)
+    return {"result": result, "total": total, "offset": offset, "limit": limit,
+            "version": version}
 
 
 @route("/api/renom_img/v2/dataset/confirm", method="POST")
@@ -514,7 +707,11 @@ def dataset_confirm():
     }
     temp_dataset[dataset_hash] = dataset
 
-    # Client doesn't need 'train_data'
+    # Client doesn't need 'train_data'.
+    # Only the first page of 'valid_data' is returned.
+    # Other pages can be loaded from 'dataset_confirm_valid_data'.
+    offset, limit = get_page()
+    valid_data, total = paginate(valid_data, ("img", "target", "size"), offset, limit)
     return_dataset = {
         "task_id": task_id,
         "dataset_name": dataset_name,
@@ -524,11 +721,25 @@ def dataset_confirm():
         "valid_data": valid_data,
         "class_map": class_map,
         "test_dataset_id": test_dataset_id,
-        "class_info": class_info
+        "class_info": class_info,
+        "total": total,
+        "offset": offset,
+        "limit": limit,
     }
     return return_dataset
 
 
+@route("/api/renom_img/v2/dataset/confirm/<dataset_hash>/valid_data", method="GET")
+@json_handler
+def dataset_confirm_valid_data(dataset_hash):
+    dataset = temp_dataset.get(dataset_hash, None)
+    if dataset is None:
+        raise Exception("Dataset {} is not confirmed.".format(dataset_hash))
+    offset, limit = get_page()
+    valid_data, total = paginate(dataset["valid_data"], ("img", "target", "size"), offset, limit)
+    return {"valid_data": valid_data, "total": total, "offset": offset, "limit": limit}
+
+
 @route("/api/renom_img/v2/dataset/create", method="POST")
 @json_handler
 def dataset_create():
@@ -589,7 +800,8 @@ def dataset_create():
 @json_handler
 def dataset_load_of_task(id):
     # TODO: Remember last sent value and cache it.
-    datasets = storage.fetch_datasets_of_task(id)
+    # Only "valid_data" is sent to the client.
+    datasets = storage.fetch_datasets_of_task(id, exclude=("train_data",))
     return {
         "dataset_list": [
             {
@@ -762,14 +974,18 @@ def test_dataset_create():
 @json_handler
 def polling_train(id):
     """
+    If the query parameter "since" is given, "train_loss_list" and "valid_loss_list"
+    only have values from the index "since". The client already has values before it.
 
     Cations:
         This function is possible to return empty dictionary.
     """
+    since = int(request.query.get("since", None) or 0)
+    seen = get_seen_version()
     threads = TrainThread.jobs
     active_train_thread = threads.get(id, None)
     if active_train_thread is None:
-        saved_model = storage.fetch_model(id)
+        saved_model = storage.fetch_model(id, exclude=MODEL_RESULT_COLUMNS)
         if saved_model is None:
             return
 
@@ -777,7 +993,7 @@ def polling_train(id):
         if saved_model["state"] != State.STOPPED.value:
             storage.update_model(id, state=State.STOPPED.value,
                                  running_state=RunningState.STOPPING.value)
-            saved_model = storage.fetch_model(id)
+            saved_model = storage.fetch_model(id, exclude=MODEL_RESULT_COLUMNS)
 
         return {
             "state": saved_model["state"],
@@ -790,23 +1006,15 @@ def polling_train(id):
             "total_valid_batch": 0,
             "nth_valid_batch": 0,
             "best_result_changed": False,
-            "train_loss_list": saved_model["train_loss_list"],
-            "valid_loss_list": saved_model["valid_loss_list"],
+            "train_loss_list": (saved_model["train_loss_list"] or [])[since:],
+            "valid_loss_list": (saved_model["valid_loss_list"] or [])[since:],
+            "since": since,
         }
     elif active_train_thread.state == State.RESERVED or \
             active_train_thread.state == State.CREATED:
 
-        for _ in range(60):
-            if active_train_thread.state == State.RESERVED or \
-                    active_train_thread.state == State.CREATED:
-                time.sleep(1)
-                if active_train_thread.updated:
-                    active_train_thread.returned2client()
-                    break
-            else:
-                time.sleep(1)
-                break
-
+        # The thread wakes this up when it starts or its state changes.
+        version = active_train_thread.wait_version(seen, POLLING_TIMEOUT, POLLING_MIN_INTERVAL)
         active_train_thread.consume_error()
         return {
             "state": active_train_thread.state.value,
@@ -821,14 +1029,12 @@ def polling_train(id):
             "best_result_changed": False,
             "train_loss_list": [],
             "valid_loss_list": [],
+            "since": since,
+            "version": version,
         }
     else:
-        for _ in range(10):
-            time.sleep(0.5)  # Avoid many request.
-            if active_train_thread.updated:
-                break
-            active_train_thread.consume_error()
-        active_train_thread.returned2client()
+        version = active_train_thread.wait_version(seen, POLLING_UPDATE_TIMEOUT, POLLING_MIN_INTERVAL)
+        active_train_thread.consume_error()
         return {
             "state": active_train_thread.state.value,
             "running_state": active_train_thread.running_state.value,
@@ -839,9 +1045,11 @@ def polling_train(id):
             "last_batch_loss": active_train_thread.last_batch_loss,
             "total_valid_batch": 0,
             "nth_valid_batch": 0,
-            "best_result_changed": active_train_thread.best_valid_changed,
-            "train_loss_list": active_train_thread.train_loss_list,
-            "valid_loss_list": active_train_thread.valid_loss_list,
+            "best_result_changed": active_train_thread.best_valid_version > (seen or 0),
+            "train_loss_list": active_train_thread.train_loss_list[since:],
+            "valid_loss_list": active_train_thread.valid_loss_list[since:],
+            "since": since,
+            "version": version,
         }
 
 
@@ -852,6 +1060,7 @@ def polling_prediction(id):
     Cations:
         This function is possible to return empty dictionary.
     """
+    seen = get_seen_version()
     threads = PredictionThread.jobs
     active_prediction_thread = threads.get(id, None)
     if active_prediction_thread is None:
@@ -865,27 +1074,27 @@ def polling_prediction(id):
         }
     elif active_prediction_thread.state == State.PRED_RESERVED or \
             active_prediction_thread.state == State.PRED_CREATED:
-        time.sleep(0.5)  # Avoid many request.
+        version = active_prediction_thread.wait_version(
+            seen, POLLING_UPDATE_TIMEOUT, POLLING_MIN_INTERVAL)
         return {
-            "need_pull": active_prediction_thread.need_pull,
+            "need_pull": active_prediction_thread.result_version > (seen or 0),
             "state": active_prediction_thread.state.value,
             "running_state": active_prediction_thread.running_state.value,
             "total_batch": active_prediction_thread.total_batch,
             "nth_batch": active_prediction_thread.nth_batch,
+            "version": version,
         }
     else:
-        for _ in range(10):
-            time.sleep(0.5)  # Avoid many request.
-            if active_prediction_thread.updated:
-                break
-            active_prediction_thread.consume_error()
-        active_prediction_thread.returned2client()
+        version = active_prediction_thread.wait_version(
+            seen, POLLING_UPDATE_TIMEOUT, POLLING_MIN_INTERVAL)
+        active_prediction_thread.consume_error()
         return {
-            "need_pull": active_prediction_thread.need_pull,
+            "need_pull": active_prediction_thread.result_version > (seen or 0),
             "state": active_prediction_thread.state.value,
             "running_state": active_prediction_thread.running_state.value,
             "total_batch": active_prediction_thread.total_batch,
             "nth_batch": active_prediction_thread.nth_batch,
+            "version": version,
         }
 
 
@@ -894,8 +1103,13 @@ def polling_prediction(id):
 def test_dataset_load_of_task(id):
     # TODO: Remember last sent value and cache it.
     datasets = storage.fetch_test_datasets_of_task(id)
+    offset, limit = get_page()
+    for d in datasets:
+        d["data"], d["total"] = paginate(d["data"], ("img", "target"), offset, limit)
     return {
-        "test_dataset_list": datasets
+        "test_dataset_list": datasets,
+        "offset": offset,
+        "limit": limit,
     }
 
 
@@ -903,7 +1117,7 @@ def test_dataset_load_of_task(id):
 def pull_deployed_model(task_id):
     # This method will be called from python script.
     try:
-        ret = storage.fetch_deployed_model(task_id)
+        ret = storage.fetch_deployed_model(task_id, columns=("best_epoch_weight", ))
         if ret is None:
             raise Exception("No model deployed.")
         file_name = ret['best_epoch_weight']
@@ -915,11 +1129,36 @@ def pull_deployed_model(task_id):
         return ret
 
 
+@route("/api/renom_img/v2/deployed_model/task/<task_id:int>/predict", method="POST")
+def predict_deployed_model(task_id):
+    # This method will be called from python script.
+    # The image is sent as a multipart file or as the raw request body.
+    # Requests from many clients are coalesced into batches by InferenceThread.
+    try:
+        if len(request.files):
+            img_file = list(request.files.values())[0].file
+        else:
+            img_file = request.body
+        thread = InferenceThread.get(task_id)
+        ret = thread.submit(img_file).wait(INFERENCE_TIMEOUT)
+        body = json.dumps(ret, ignore_nan=True, default=json_encoder)
+        return create_response(body)
+    except InferenceOverloadError as e:
+        body = json.dumps({"error_msg": "{}: {}".format(type(e).__name__, str(e))})
+        r = create_response(body, 503)
+        r.set_header('Retry-After', '1')
+        return r
+    except Exception as e:
+        traceback.print_exc()
+        body = json.dumps({"error_msg": "{}: {}".format(type(e).__name__, str(e))})
+        return create_response(body, 500)
+
+
 @route("/api/renom_img/v2/deployed_model_info/task/<task_id:int>", method="GET")
 @json_handler
 def get_deployed_model_info(task_id):
     # This method will be called from python script.
-    saved_model = storage.fetch_deployed_model(task_id)
+    saved_model = storage.fetch_deployed_model(task_id, exclude=MODEL_RESULT_COLUMNS)
     if saved_model is None:
         raise Exception("No model deployed.")
 
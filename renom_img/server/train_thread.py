@@ -21,20 +21,24 @@ from renom_img.api.detection.ssd import SSD
 from renom_img.api.segmentation.unet import UNet
 from renom_img.api.segmentation.fcn import FCN8s, FCN16s, FCN32s
 from renom_img.api.utility.load import parse_xml_detection
-from renom_img.api.utility.evaluate.detection import get_ap_and_map, get_prec_rec_iou
-from renom_img.api.utility.evaluate.classification import precision_recall_f1_score
-from renom_img.api.utility.evaluate.segmentation import get_segmentation_metrics
+from renom_img.api.utility.evaluate import StreamingEvaluatorClassification, \
+    StreamingEvaluatorDetection, StreamingEvaluatorSegmentation
+from renom_img.api.utility.evaluate.detection import get_ap_and_map
+from renom_img.api.utility.evaluate.segmentation import metrics_from_confusion
 from renom_img.api.utility.augmentation.process import Shift, Rotate, Flip, WhiteNoise, ContrastNorm
 from renom_img.api.utility.augmentation import Augmentation
-from renom_img.api.utility.distributor.distributor import ImageDistributor
+from renom_img.api.utility.distributor.distributor import ImageDistributor, FeatureDistributor
 from renom_img.api.utility.misc.download import download
 
 from renom_img.server.utility.semaphore import EventSemaphore, Semaphore
-from renom_img.server.utility.storage import storage
+from renom_img.server.utility.notifier import UpdateNotifier
+from renom_img.server.utility.storage import storage, MODEL_RESULT_COLUMNS
+from renom_img.server.utility.progress import progress_store
+from renom_img.server.utility.artifact import encode_mask, encode_boxes
 from renom_img.server import State, RunningState, MAX_THREAD_NUM, Algorithm, Task, DB_DIR_PRETRAINED_WEIGHT
 
 
-class TrainThread(object):
+class TrainThread(UpdateNotifier):
 
     jobs = weakref.WeakValueDictionary()
     semaphore = EventSemaphore(MAX_THREAD_NUM)  # Cancellable semaphore.
@@ -58,13 +62,14 @@ class TrainThread(object):
         self.running_state = RunningState.PREPARING
         self.sync_state()
 
-        # If any value (train_loss or ...) is changed, this will be True.
+        # If any value (train_loss or ...) is changed, the version is incremented.
         self.updated = True
 
-        # This will be changed from web API.
         self.best_epoch_valid_result = {}
-        self.best_valid_changed = False
+        # Version at which the best result is changed.
+        self.best_valid_version = 0
         self.error_msg = None
+        self.feature_dist = None
 
     def __call__(self):
         try:
@@ -81,6 +86,7 @@ class TrainThread(object):
                 return
 
             self.state = State.STARTED
+            self.updated = True
             self._prepare_params()
             self._prepare_model()
             release_mem_pool()
@@ -96,17 +102,15 @@ class TrainThread(object):
             self.model = None
             self.sync_state()
         finally:
+            if self.feature_dist is not None:
+                self.feature_dist.clear()
+                self.feature_dist = None
             release_mem_pool()
             TrainThread.semaphore.release()
             self.state = State.STOPPED
             self.running_state = RunningState.STOPPING
             self.sync_state()
-
-    def returned2client(self):
-        self.updated = False
-
-    def returned_best_result2client(self):
-        self.best_valid_changed = False
+            self.updated = True
 
     def consume_error(self):
         if self.error_msg is not None:
@@ -126,6 +130,10 @@ class TrainThread(object):
             self.updated = True
             return
 
+        if self.augmentation is None and model.feature_cacheable:
+            # Outputs of the frozen part are computed once and only the head is trained.
+            self.feature_dist = FeatureDistributor(model, self.train_dist, batch_size=self.batch_size)
+
         for e in range(self.total_epoch):
             release_mem_pool()
             self.nth_epoch = e
@@ -140,7 +148,11 @@ class TrainThread(object):
             self.running_state = RunningState.TRAINING
             self.sync_state()
 
-            for b, (train_x, train_y) in enumerate(self.train_dist.batch(self.batch_size), 1):
+            if self.feature_dist is None:
+                train_batch = self.train_dist.batch(self.batch_size, epoch=e)
+            else:
+                train_batch = self.feature_dist.batch(self.batch_size)
+            for b, (train_x, train_y) in enumerate(train_batch, 1):
                 if isinstance(self.model, Yolov2) and (b - 1) % 10 == 0 and (b - 1):
                     release_mem_pool()
 
@@ -151,9 +163,17 @@ class TrainThread(object):
                     return
 
                 if len(train_x) > 0:
-                    with model.train():
-                        loss = model.loss(model(train_x), train_y)
-                        reg_loss = loss + model.regularize()
+                    if self.feature_dist is None:
+                        with model.train():
+                            loss = model.loss(model(train_x), train_y)
+                            reg_loss = loss + model.regularize()
+                    else:
+                        # Building the features switches the model to inference mode.
+                        # The head is trained in training mode.
+                        model.set_models(inference=False)
+                        with model.train():
+                            loss = model.loss(model.forward_head(train_x), train_y)
+                            reg_loss = loss + model.regularize()
 
                     try:
                         loss = loss.as_ndarray()[0]
@@ -191,12 +211,19 @@ class TrainThread(object):
             self.running_state = RunningState.VALIDATING
             self.sync_state()
 
-            if self.task_id != Task.DETECTION.value:
-                valid_target = []
-            valid_prediction = []
+            # Metrics are accumulated batch by batch, so the network outputs of
+            # the whole validation set are never kept in memory.
+            if self.task_id == Task.CLASSIFICATION.value:
+                evaluator = StreamingEvaluatorClassification(len(self.class_map))
+            elif self.task_id == Task.DETECTION.value:
+                evaluator = StreamingEvaluatorDetection()
+            elif self.task_id == Task.SEGMENTATION.value:
+                evaluator = StreamingEvaluatorSegmentation(len(self.class_map))
+            prediction = []
+            n_seen = 0
             temp_valid_batch_loss_list = []
             model.set_models(inference=True)
-            for b, (valid_x, valid_y) in enumerate(self.valid_dist.batch(self.batch_size, shuffle=False)):
+            for b, (valid_x, valid_y) in enumerate(self.valid_dist.cached_batch(self.batch_size)):
 
                 if self.stop_event.is_set():
                     # Watch stop event
@@ -206,12 +233,33 @@ class TrainThread(object):
                 valid_prediction_in_batch = model(valid_x)
                 loss = model.loss(valid_prediction_in_batch, valid_y)
                 if self.task_id == Task.CLASSIFICATION.value:
-                    valid_prediction.append(rm.softmax(valid_prediction_in_batch).as_ndarray())
-                else:
-                    valid_prediction.append(valid_prediction_in_batch.as_ndarray())
-
-                if self.task_id != Task.DETECTION.value:
-                    valid_target.append(valid_y)
+                    score = rm.softmax(valid_prediction_in_batch).as_ndarray()
+                    pred = np.argmax(score, axis=1)
+                    evaluator.update(pred, np.argmax(valid_y, axis=1))
+                    prediction.extend([
+                        {
+                            "score": v.astype(np.float32),
+                            "class":float(p)
+                        }
+                        for v, p in zip(score, pred)
+                    ])
+                elif self.task_id == Task.DETECTION.value:
+                    prediction_box = model.get_bbox(valid_prediction_in_batch.as_ndarray())
+                    target_box = valid_target[n_seen:n_seen + len(prediction_box)]
+                    prediction_box = prediction_box[:len(target_box)]
+                    evaluator.update(prediction_box, target_box)
+                    prediction.extend(encode_boxes(objects) for objects in prediction_box)
+                elif self.task_id == Task.SEGMENTATION.value:
+                    pred = np.argmax(valid_prediction_in_batch.as_ndarray(), axis=1)
+                    hists = evaluator.update(pred, np.argmax(valid_y, axis=1))
+                    for p, hist in zip(pred, hists):
+                        lep, lemp, ler, lemr, _, _, _, _, _, _ = metrics_from_confusion(hist)
+                        prediction.append({
+                            "class": encode_mask(p),
+                            "recall": {k: float(v) for k, v in ler.items()},
+                            "precision": {k: float(v) for k, v in lep.items()},
+                        })
+                n_seen += len(valid_x)
 
                 try:
                     loss = loss.as_ndarray()[0]
@@ -228,27 +276,14 @@ class TrainThread(object):
                 self.updated = True
                 return
 
-            valid_prediction = np.concatenate(valid_prediction, axis=0)
-            if self.task_id != Task.DETECTION.value:
-                valid_target = np.concatenate(valid_target, axis=0)
-            n_valid = min(len(valid_prediction), len(valid_target))
-
             # Depends on each task.
+            best_changed = False
             loss = self.valid_loss_list[-1]
             if self.task_id == Task.CLASSIFICATION.value:
-                pred = np.argmax(valid_prediction, axis=1)
-                targ = np.argmax(valid_target, axis=1)
-                _, pr, _, rc, _, f1 = precision_recall_f1_score(pred, targ)
-                prediction = [
-                    {
-                        "score": [float(vc) for vc in v],
-                        "class":float(p)
-                    }
-                    for v, p in zip(valid_prediction, pred)
-                ]
+                _, pr, _, rc, _, f1 = evaluator.compute()
                 if self.best_epoch_valid_result:
                     if self.best_epoch_valid_result["f1"] <= f1:
-                        self.best_valid_changed = True
+                        best_changed = True
                         self.save_best_model()
                         self.best_epoch_valid_result = {
                             "nth_epoch": e,
@@ -259,7 +294,7 @@ class TrainThread(object):
                             "loss": float(loss)
                         }
                 else:
-                    self.best_valid_changed = True
+                    best_changed = True
                     self.save_best_model()
                     self.best_epoch_valid_result = {
                         "nth_epoch": e,
@@ -272,53 +307,36 @@ class TrainThread(object):
                 self.sync_best_valid_result()
 
             elif self.task_id == Task.DETECTION.value:
-                prediction_box = model.get_bbox(valid_prediction[:n_valid])
-                prec, rec, _, iou = get_prec_rec_iou(
-                    prediction_box,
-                    valid_target[:n_valid]
-                )
+                prec, rec, _, iou = evaluator.compute()
                 _, mAP = get_ap_and_map(prec, rec)
                 if self.best_epoch_valid_result:
                     if self.best_epoch_valid_result["mAP"] <= mAP:
-                        self.best_valid_changed = True
+                        best_changed = True
                         self.save_best_model()
                         self.best_epoch_valid_result = {
                             "nth_epoch": e,
-                            "prediction": prediction_box,
+                            "prediction": prediction,
                             "mAP": float(mAP),
                             "IOU": float(iou),
                             "loss": float(loss)
                         }
                 else:
-                    self.best_valid_changed = True
+                    best_changed = True
                     self.save_best_model()
                     self.best_epoch_valid_result = {
                         "nth_epoch": e,
-                        "prediction": prediction_box,
+                        "prediction": prediction,
                         "mAP": float(mAP),
                         "IOU": float(iou),
                         "loss": float(loss)
                     }
                 self.sync_best_valid_result()
             elif self.task_id == Task.SEGMENTATION.value:
-                pred = np.argmax(valid_prediction, axis=1)
-                targ = np.argmax(valid_target, axis=1)
-                _, pr, _, rc, _, f1, _, _, _, _ = \
-                    get_segmentation_metrics(pred, targ, n_class=len(self.class_map))
-
-                prediction = []
-                for p, t in zip(pred, targ):
-                    lep, lemp, ler, lemr, _, _, _, _, _, _ = get_segmentation_metrics(p[None],
-                                                                                      t[None], n_class=len(self.class_map))
-                    prediction.append({
-                        "class": p.astype(np.int).tolist(),
-                        "recall": {k: float(v) for k, v in ler.items()},
-                        "precision": {k: float(v) for k, v in lep.items()},
-                    })
+                _, pr, _, rc, _, f1, _, _, _, _ = evaluator.compute()
 
                 if self.best_epoch_valid_result:
                     if self.best_epoch_valid_result["f1"] <= f1:
-                        self.best_valid_changed = True
+                        best_changed = True
                         self.save_best_model()
                         self.best_epoch_valid_result = {
                             "nth_epoch": e,
@@ -329,7 +347,7 @@ class TrainThread(object):
                             "loss": float(loss)
                         }
                 else:
-                    self.best_valid_changed = True
+                    best_changed = True
                     self.save_best_model()
                     self.best_epoch_valid_result = {
                         "nth_epoch": e,
@@ -343,7 +361,13 @@ class TrainThread(object):
 
             # Thread value changed.
             self.save_last_model()
-            self.updated = True
+            if best_changed:
+                # The version is recorded before waiting requests wake up.
+                with self._update_condition:
+                    self.updated = True
+                    self.best_valid_version = self.version
+            else:
+                self.updated = True
 
     def stop(self):
         self.stop_event.set()
@@ -357,23 +381,25 @@ class TrainThread(object):
         self.model.save(self.last_weight_path)
 
     def sync_state(self):
-        storage.update_model(self.model_id, state=self.state.value,
-                             running_state=self.running_state.value)
+        # State transitions are written immediately with the pending progress.
+        progress_store.update(self.model_id, state=self.state.value,
+                              running_state=self.running_state.value)
+        progress_store.flush(self.model_id)
 
     def sync_batch_result(self):
-        storage.update_model(self.model_id, total_epoch=self.total_epoch, nth_epoch=self.nth_epoch,
-                             total_batch=self.total_batch, nth_batch=self.nth_batch,
-                             last_batch_loss=self.last_batch_loss)
+        progress_store.update(self.model_id, total_epoch=self.total_epoch, nth_epoch=self.nth_epoch,
+                              total_batch=self.total_batch, nth_batch=self.nth_batch,
+                              last_batch_loss=self.last_batch_loss)
 
     def sync_train_loss(self):
-        storage.update_model(self.model_id, train_loss_list=self.train_loss_list)
+        progress_store.update(self.model_id, train_loss_list=list(self.train_loss_list))
 
     def sync_valid_loss(self):
-        storage.update_model(self.model_id, valid_loss_list=self.valid_loss_list)
+        progress_store.update(self.model_id, valid_loss_list=list(self.valid_loss_list))
 
     def sync_best_valid_result(self):
-        storage.update_model(self.model_id,
-                             best_epoch_valid_result=self.best_epoch_valid_result)
+        progress_store.update(self.model_id,
+                              best_epoch_valid_result=self.best_epoch_valid_result)
 
     def _prepare_params(self):
         if self.stop_event.is_set():
@@ -381,7 +407,7 @@ class TrainThread(object):
             self.updated = True
             return
 
-        params = storage.fetch_model(self.model_id)
+        params = storage.fetch_model(self.model_id, exclude=MODEL_RESULT_COLUMNS)
         self.task_id = int(params["task_id"])
         self.dataset_id = int(params["dataset_id"])
         self.algorithm_id = int(params["algorithm_id"])
@@ -433,12 +459,16 @@ class TrainThread(object):
         self.best_epoch_valid_result = {}
 
         # Augmentation Setting.
-        self.augmentation = Augmentation([
-            Shift(10, 10),
-            Rotate(),
-            Flip(),
-            ContrastNorm(),
-        ])
+        # If it is disabled, models which support it train only the head on cached features.
+        if self.hyper_parameters.get("augmentation", True):
+            self.augmentation = Augmentation([
+                Shift(10, 10),
+                Rotate(),
+                Flip(),
+                ContrastNorm(),
+            ])
+        else:
+            self.augmentation = None
 
     def _prepare_model(self):
         if self.stop_event.is_set():
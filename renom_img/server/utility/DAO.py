@@ -1,21 +1,58 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy.pool import QueuePool
 from renom_img.server import DB_DIR, create_directories
+from renom_img.server import DB_POOL_SIZE, DB_POOL_MAX_OVERFLOW, DB_BUSY_TIMEOUT
 
 create_directories()
 
-DATABASE = os.path.join('sqlite:///', str(DB_DIR), 'renom_img_v2_0.db')
-engine = create_engine(
-    DATABASE,
-    encoding="utf-8",
-    echo=False
-)
 
-Session = sessionmaker(
+def create_db_engine(path, tuned=True):
+    """Creates an engine of the SQLite database.
+
+    If ``tuned`` is True, the database uses the WAL journal, so readers don't block
+    the writer, and ``synchronous=NORMAL``, so a commit doesn't wait for fsync.
+    Connections are kept in a bounded pool and wait up to ``DB_BUSY_TIMEOUT`` seconds
+    for a lock instead of failing with "database is locked".
+
+    Args:
+        path (str): Path to the database file.
+        tuned (bool): If False, the SQLAlchemy defaults are used.
+    """
+    # os.path.join would drop the scheme if the path is absolute.
+    url = 'sqlite:///' + str(path)
+    if not tuned:
+        return create_engine(url, encoding="utf-8", echo=False)
+
+    db_engine = create_engine(
+        url,
+        encoding="utf-8",
+        echo=False,
+        poolclass=QueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_POOL_MAX_OVERFLOW,
+        connect_args={"check_same_thread": False, "timeout": DB_BUSY_TIMEOUT},
+    )
+
+    @event.listens_for(db_engine, "connect")
+    def set_pragma(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout={}".format(int(DB_BUSY_TIMEOUT * 1000)))
+        cursor.close()
+
+    return db_engine
+
+
+DATABASE = DB_DIR / 'renom_img_v2_0.db'
+engine = create_db_engine(DATABASE)
+
+# Each thread reuses its own session.
+Session = scoped_session(sessionmaker(
     bind=engine
-)
-session = Session()
+))
 Base = declarative_base()
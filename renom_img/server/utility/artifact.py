@@ -0,0 +1,149 @@
+# coding: utf-8
+import os
+import hashlib
+import numpy as np
+import _pickle as pickle
+from functools import lru_cache
+from renom_img.server import DB_DIR_RESULT, RESULT_CACHE_SIZE
+
+
+def encode_mask(mask):
+    """Encodes a class map with run length encoding.
+    The map is scanned in row major order.
+
+    Args:
+        mask (ndarray): Class map whose shape is (height, width).
+
+    Returns:
+        (dict): Dictionary which has "size" [height, width], "values" and "counts".
+        ``values[i]`` is repeated ``counts[i]`` times.
+
+    Example:
+        >>> encode_mask(np.array([[0, 0, 1], [1, 1, 0]]))
+        {'size': [2, 3], 'values': [0, 1, 0], 'counts': [2, 3, 1]}
+    """
+    mask = np.asarray(mask)
+    flat = mask.ravel().astype(np.uint8)
+    if len(flat) == 0:
+        return {"size": list(mask.shape), "values": [], "counts": []}
+    starts = np.concatenate([[0], np.flatnonzero(flat[1:] != flat[:-1]) + 1])
+    counts = np.diff(np.concatenate([starts, [len(flat)]]))
+    return {
+        "size": [int(s) for s in mask.shape],
+        "values": flat[starts].tolist(),
+        "counts": counts.tolist(),
+    }
+
+
+def decode_mask(rle):
+    """Decodes a class map encoded by ``encode_mask``.
+
+    Returns:
+        (ndarray): uint8 array whose shape is (height, width).
+    """
+    mask = np.repeat(np.array(rle["values"], dtype=np.uint8),
+                     np.array(rle["counts"], dtype=np.int64))
+    return mask.reshape(rle["size"])
+
+
+def encode_boxes(objects):
+    """Packs the objects predicted in one image into arrays.
+
+    Args:
+        objects (list): List of dictionaries which have "box", "score" and "class".
+            For example, one of the lists returned by ``get_bbox``.
+
+    Returns:
+        (dict): Dictionary of "box", float32 array whose shape is (#objects, 4),
+        "score", float32 array whose shape is (#objects, ), and "class",
+        int32 array whose shape is (#objects, ).
+    """
+    return {
+        "box": np.array([obj["box"] for obj in objects], dtype=np.float32).reshape(-1, 4),
+        "score": np.array([obj["score"] for obj in objects], dtype=np.float32),
+        "class": np.array([obj["class"] for obj in objects], dtype=np.int32),
+    }
+
+
+def is_encoded_boxes(pred):
+    return isinstance(pred, dict) and isinstance(pred.get("box"), np.ndarray)
+
+
+def decode_boxes(pred, class_map):
+    """Returns the list of dictionaries packed by ``encode_boxes``.
+    The "name" of each object is looked up in ``class_map``.
+    """
+    return [
+        {"box": box, "score": score, "class": c, "name": class_map[c]}
+        for box, score, c in zip(pred["box"].tolist(), pred["score"].tolist(),
+                                 pred["class"].tolist())
+    ]
+
+
+def result_path(model_id, name):
+    return DB_DIR_RESULT / "model_{}_{}.pkl".format(model_id, name)
+
+
+def save_result(model_id, name, result):
+    """Writes a result to a file and returns its reference.
+
+    The reference keeps the scalar values of the result, such as metrics,
+    the name of the file and the SHA-1 digest of its content. Only the reference
+    is stored in the database.
+
+    Args:
+        model_id (int): Id of the model.
+        name (str): Name of the result. For example "best_epoch_valid_result".
+        result (dict): Result to be saved.
+
+    Returns:
+        (dict): Reference of the result.
+    """
+    if not result:
+        return result
+    path = result_path(model_id, name)
+    tmp_path = str(path) + ".tmp"
+    data = pickle.dumps(result, protocol=-1)
+    with open(tmp_path, "wb") as writer:
+        writer.write(data)
+    os.replace(tmp_path, str(path))
+    ref = {k: v for k, v in result.items() if not isinstance(v, (list, dict, np.ndarray))}
+    ref["artifact"] = path.name
+    ref["digest"] = hashlib.sha1(data).hexdigest()
+    return ref
+
+
+@lru_cache(maxsize=RESULT_CACHE_SIZE)
+def load_artifact(name, digest):
+    # The digest is a part of the key, so a rewritten file is loaded again.
+    with open(str(DB_DIR_RESULT / name), "rb") as reader:
+        return pickle.load(reader)
+
+
+def load_result(ref):
+    """Returns the result of a reference created by ``save_result``.
+    Results stored in the database directly are returned as they are.
+
+    Loaded results are cached per digest and shared between callers,
+    so they must not be modified.
+    """
+    if not isinstance(ref, dict) or "artifact" not in ref:
+        return ref
+    path = DB_DIR_RESULT / ref["artifact"]
+    if not path.exists():
+        return {k: v for k, v in ref.items() if k not in ("artifact", "digest")}
+    return load_artifact(ref["artifact"], ref.get("digest"))
+
+
+def result_digest(ref):
+    """Returns a digest which changes when the result of a reference changes.
+    Results stored in the database directly are hashed.
+    """
+    if isinstance(ref, dict) and "digest" in ref:
+        return ref["digest"]
+    return hashlib.sha1(pickle.dumps(ref, protocol=-1)).hexdigest()
+
+
+def remove_results(model_id):
+    for path in DB_DIR_RESULT.glob("model_{}_*.pkl".format(model_id)):
+        path.unlink()
@@ -0,0 +1,110 @@
+# coding: utf-8
+import os
+import gzip
+from email.utils import formatdate
+from bottle import HTTPResponse, request, static_file
+from renom_img.server import GZIP_MIN_SIZE, GZIP_LEVEL
+
+
+def accepts_gzip():
+    return 'gzip' in request.environ.get('HTTP_ACCEPT_ENCODING', '').lower()
+
+
+def gzip_compress(body):
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def gzip_etag(etag):
+    """Returns the entity tag of the gzipped body of ``etag``. Representations with
+    different encodings must have different tags.
+    """
+    if etag.endswith('"'):
+        return etag[:-1] + '-gz"'
+    return etag + '-gz'
+
+
+def encoded_response(body, status=200, headers=None, gzipped=None):
+    """Creates a response whose body is compressed with gzip if the client accepts it
+    and the body is not smaller than GZIP_MIN_SIZE bytes. The "ETag" header of a
+    compressed body gets the suffix "-gz".
+
+    Args:
+        body (str, bytes): Body of the response.
+        status (int): Status code.
+        headers (dict): Other headers.
+        gzipped (bytes): Compressed body. If given, it is used instead of compressing body.
+
+    Returns:
+        (HTTPResponse): Response.
+    """
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    r = HTTPResponse(status=status, body=body, **(headers or {}))
+    r.set_header('Vary', 'Accept-Encoding')
+    if len(body) >= GZIP_MIN_SIZE and accepts_gzip():
+        r.body = gzipped if gzipped is not None else gzip_compress(body)
+        r.set_header('Content-Encoding', 'gzip')
+        etag = r.headers.get('ETag')
+        if etag:
+            r.set_header('ETag', gzip_etag(etag))
+    r.set_header('Content-Length', str(len(r.body)))
+    return r
+
+
+def file_etag(path):
+    """Returns an entity tag which changes when the file is modified."""
+    stat = os.stat(path)
+    return '"{:x}-{:x}"'.format(stat.st_mtime_ns, stat.st_size)
+
+
+def matching_etag(etag):
+    """Returns the tag in "If-None-Match" of the request which matches the entity
+    tag or its gzipped variant. None is returned if no tag matches.
+    """
+    if_none_match = request.environ.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is None:
+        return None
+    if if_none_match.strip() == '*':
+        return etag
+    tags = [t.strip() for t in if_none_match.split(',')]
+    for t in (etag, gzip_etag(etag)):
+        if t in tags:
+            return t
+    return None
+
+
+def is_not_modified(etag):
+    """Returns True if "If-None-Match" of the request matches the entity tag."""
+    return matching_etag(etag) is not None
+
+
+def cached_static_file(filename, root, mimetype='auto', max_age=0, **kwargs):
+    """Same as ``bottle.static_file`` but the response has an "ETag" header and
+    a request with a matching "If-None-Match" header gets "304 Not Modified".
+    "Last-Modified" and "If-Modified-Since" are handled by ``bottle.static_file``.
+
+    Args:
+        filename (str): Name of the file relative to root.
+        root (str): Root directory.
+        mimetype (str): Mime type of the file.
+        max_age (int): Seconds the client may use the file without revalidation.
+    """
+    path = os.path.abspath(os.path.join(root, filename.strip('/\\')))
+    if not os.path.isfile(path):
+        return static_file(filename, root=root, mimetype=mimetype, **kwargs)
+    etag = file_etag(path)
+    headers = {
+        'ETag': etag,
+        'Cache-Control': 'max-age={}'.format(max_age) if max_age else 'no-cache',
+    }
+    if is_not_modified(etag):
+        headers['Last-Modified'] = formatdate(os.stat(path).st_mtime, usegmt=True)
+        return HTTPResponse(status=304, **headers)
+    res = static_file(filename, root=root, mimetype=mimetype, **kwargs)
+    for k, v in headers.items():
+        res.set_header(k, v)
+    return res
+
+
+def not_modified(etag):
+    return HTTPResponse(status=304, ETag=matching_etag(etag) or etag)
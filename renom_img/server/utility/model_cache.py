@@ -0,0 +1,52 @@
+from collections import OrderedDict
+from threading import Lock
+
+
+class ModelCache(object):
+    """LRU cache of loaded models.
+
+    Models are keyed by (model_id, modification time of the weight file), so
+    a model whose weight has been rewritten by training is loaded again.
+    Each model has its own lock. A cached model is shared by the prediction
+    threads and the inference thread, and the layer states are not thread safe,
+    so forward propagation must be performed holding the lock.
+
+    Args:
+        maxsize (int): Max number of kept models.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._models = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        """Returns the tuple of the model and its lock. (None, None) is returned
+        if the model is not cached.
+        """
+        with self._lock:
+            entry = self._models.pop(key, None)
+            if entry is None:
+                return None, None
+            self._models[key] = entry
+            return entry
+
+    def put(self, key, model):
+        """Caches the model and returns its lock. If the same key is already
+        cached, the cached model is kept and returned with its lock instead.
+        """
+        with self._lock:
+            if key in self._models:
+                return self._models[key]
+            # Older weights of the same model are never used again.
+            for k in [k for k in self._models if k[0] == key[0]]:
+                del self._models[k]
+            entry = (model, Lock())
+            self._models[key] = entry
+            while len(self._models) > self.maxsize:
+                self._models.popitem(last=False)
+            return entry
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
@@ -0,0 +1,69 @@
+import time
+import itertools
+from threading import Condition
+
+# Versions are shared by all notifiers, so a thread created for the same model
+# later always has greater versions than the ones clients have seen.
+_versions = itertools.count(1)
+
+
+class UpdateNotifier(object):
+    """Mixin which lets request threads wait for updates of a thread.
+
+    Setting ``updated = True`` advances ``version`` and wakes up all waiting
+    threads immediately, so polling APIs don't need to sleep and check the state
+    repeatedly. Each client passes the last version it has seen, so clients
+    polling the same thread don't consume the update of each other.
+
+    Example:
+        >>> version = thread.wait_version(seen, timeout=5)
+        >>> # Respond with the state and the version.
+    """
+
+    @property
+    def _update_condition(self):
+        # Created at the first assignment of ``updated``, which is done in __init__.
+        cond = self.__dict__.get("_condition", None)
+        if cond is None:
+            cond = self.__dict__.setdefault("_condition", Condition())
+        return cond
+
+    @property
+    def version(self):
+        """Version of the last update. It never decreases."""
+        return self.__dict__.get("_version", 0)
+
+    @property
+    def updated(self):
+        return self.version > 0
+
+    @updated.setter
+    def updated(self, value):
+        # Assigning False is ignored. Whether a client has the latest state is
+        # decided by the version the client has seen.
+        if value:
+            with self._update_condition:
+                self.__dict__["_version"] = next(_versions)
+                self._update_condition.notify_all()
+
+    def wait_version(self, seen=None, timeout=None, min_interval=0):
+        """Blocks until ``version`` becomes greater than ``seen`` or the timeout expires.
+
+        Args:
+            seen (int): The last version the client has seen. If None, returns immediately.
+            timeout (float): Max seconds to wait.
+            min_interval (float): Min seconds to block. Updates which occur during
+                the interval are returned together, so a client polls at most once per
+                ``min_interval`` seconds.
+
+        Returns:
+            (int): Current version.
+        """
+        start = time.time()
+        if seen is not None:
+            with self._update_condition:
+                self._update_condition.wait_for(lambda: self.version > seen, timeout)
+        remaining = min_interval - (time.time() - start)
+        if remaining > 0:
+            time.sleep(remaining)
+        return self.version
@@ -0,0 +1,105 @@
+import traceback
+from threading import Thread, Lock, Event
+
+from renom_img.server import PROGRESS_FLUSH_INTERVAL
+from renom_img.server.utility.storage import storage
+
+
+class ProgressStore(object):
+    """Keeps progress values of models in memory and writes them to the storage
+    in a background thread.
+
+    Training threads call ``update`` in their loops, which only updates a
+    dictionary, so they never wait for the database. Pending values are written at
+    every ``interval`` seconds, and ``flush`` writes them immediately. ``flush`` is
+    called at state transitions.
+
+    Values which fail to be written are kept and written at the next flush.
+
+    Args:
+        interval (float): Seconds between background writes.
+        storage (Storage): Storage to write to. Defaults to the global storage.
+
+    Example:
+        >>> progress_store.update(model_id, nth_batch=10, last_batch_loss=0.1)
+        >>> progress_store.update(model_id, state=State.STOPPED.value)
+        >>> progress_store.flush(model_id)
+    """
+
+    def __init__(self, interval=PROGRESS_FLUSH_INTERVAL, storage=storage):
+        self.interval = interval
+        self.storage = storage
+        self._pending = {}
+        self._lock = Lock()
+        # Writes are serialized so that older values never overwrite newer ones.
+        self._flush_lock = Lock()
+        self._wakeup = Event()
+        self._thread = None
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                traceback.print_exc()
+
+    def update(self, model_id, **values):
+        """Stores values of the model. They are written to the storage later.
+
+        Args:
+            model_id (int): Id of the model.
+            **values: Keyword arguments of ``storage.update_model``.
+        """
+        with self._lock:
+            self._pending.setdefault(model_id, {}).update(values)
+            self._start()
+
+    def pending(self, model_id):
+        """Returns values of the model which are not written yet.
+        """
+        with self._lock:
+            return dict(self._pending.get(model_id, {}))
+
+    def pending_ids(self):
+        """Returns ids of models which have values not written yet.
+        """
+        with self._lock:
+            return list(self._pending)
+
+    def flush(self, model_id=None):
+        """Writes pending values to the storage.
+
+        Args:
+            model_id (int): If given, only values of this model are written.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if model_id is None:
+                    pending, self._pending = self._pending, {}
+                else:
+                    values = self._pending.pop(model_id, None)
+                    pending = {model_id: values} if values else {}
+            error = None
+            for id, values in pending.items():
+                try:
+                    self.storage.update_model(id, **values)
+                except Exception as e:
+                    error = e
+                    with self._lock:
+                        # Values updated during the write are newer.
+                        values = dict(values)
+                        values.update(self._pending.get(id, {}))
+                        self._pending[id] = values
+            if error is not None:
+                raise error
+
+
+global progress_store
+progress_store = ProgressStore()
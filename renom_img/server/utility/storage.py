@@ -8,11 +8,13 @@ import json
 import inspect
 import time
 import _pickle as pickle
+from sqlalchemy import or_
 from sqlalchemy.orm import defer, defaultload, load_only, Load
 from renom_img.server import DB_DIR
 from renom_img.server.utility.DAO import Session
 from renom_img.server.utility.DAO import engine
 from renom_img.server.utility.table import *
+from renom_img.server.utility.artifact import save_result, load_result, remove_results
 from renom_img.server import Task as TaskConst
 TOTAL_ALOGORITHM_NUMBER = 3
 TOTAL_TASK = 3
@@ -27,6 +29,34 @@ def pickle_dump(obj):
     return pickle.dumps(obj)
 
 
+# Columns which can be megabytes large. List views should not load them.
+MODEL_RESULT_COLUMNS = ("best_epoch_valid_result", "last_prediction_result")
+DATASET_DATA_COLUMNS = ("train_data", "valid_data")
+
+
+def column_options(table, columns=None, exclude=None):
+    """Returns query options which restrict loaded columns of ``table``.
+
+    Columns which are not loaded are not read from the database and are not
+    unpickled. They don't appear in the dictionary returned by
+    ``Storage.remove_instance_state_key``.
+
+    Args:
+        table (class): Table class such as ``Model``.
+        columns (list): Names of columns to be loaded. The primary key is always loaded.
+        exclude (list): Names of columns to be deferred.
+
+    Returns:
+        (list): Options to be passed to ``Query.options``.
+    """
+    options = []
+    if columns is not None:
+        options.append(load_only(*columns))
+    if exclude is not None:
+        options.extend([defer(getattr(table, c)) for c in exclude])
+    return options
+
+
 def pickle_load(pickled_obj):
     if sys.version_info.major == 2:
         if isinstance(pickled_obj, unicode):
@@ -45,9 +75,15 @@ class SessionContext:
         return self.session
 
     def __exit__(self, exc_type, exc_value, traceback):
-        self.session.flush()
-        self.session.commit()
-        self.session.close()
+        try:
+            if exc_type is None:
+                self.session.flush()
+                self.session.commit()
+            else:
+                self.session.rollback()
+        finally:
+            # The thread local session is kept and its connection returns to the pool.
+            self.session.close()
 
 
 class Storage:
@@ -81,22 +117,45 @@ class Storage:
             session.commit()
             return new_model.id
 
-    def fetch_models_of_task(self, task_id):
+    def fetch_models_of_task(self, task_id, since=None, ids=(), columns=None, exclude=None):
+        """Returns models of the task. If ``since`` is given, only models
+        updated at or after that time and models in ``ids`` are returned.
+        ``columns`` and ``exclude`` are passed to ``column_options``.
+        """
         with SessionContext() as session:
-            result = session.query(Model).filter(Model.task_id == task_id)
-            dict_result = self.remove_instance_state_key(result)
+            result = session.query(Model).options(*column_options(Model, columns, exclude)) \
+                .filter(Model.task_id == task_id)
+            if since is not None:
+                # The column has a resolution of one second, so models updated
+                # in the same second as ``since`` are returned again.
+                cond = Model.updated >= since - datetime.timedelta(seconds=1)
+                if ids:
+                    cond = or_(cond, Model.id.in_(list(ids)))
+                result = result.filter(cond)
+            dict_result = self.load_model_results(self.remove_instance_state_key(result))
             return dict_result
 
-    def fetch_models(self):
+    def fetch_model_ids_of_task(self, task_id):
         with SessionContext() as session:
-            result = session.query(Model).all()
-            dict_result = self.remove_instance_state_key(result)
+            result = session.query(Model.id).filter(Model.task_id == task_id)
+            return [r.id for r in result]
+
+    def fetch_models(self, columns=None, exclude=None):
+        with SessionContext() as session:
+            result = session.query(Model).options(*column_options(Model, columns, exclude)).all()
+            dict_result = self.load_model_results(self.remove_instance_state_key(result))
             return dict_result
 
-    def fetch_model(self, id):
+    def fetch_model(self, id, columns=None, exclude=None, load_results=True):
+        """Returns the model. If ``load_results`` is False, results are
+        references created by ``save_result`` and are not read from the files.
+        """
         with SessionContext() as session:
-            result = session.query(Model).filter(Model.id == id)
+            result = session.query(Model).options(*column_options(Model, columns, exclude)) \
+                .filter(Model.id == id)
             dict_result = self.remove_instance_state_key(result)
+            if load_results:
+                dict_result = self.load_model_results(dict_result)
         if dict_result:
             return dict_result[0]
         else:
@@ -107,6 +166,7 @@ class Storage:
             result = session.query(Model).filter(Model.id == id).first()
             if result:
                 session.delete(result)
+        remove_results(id)
         return
 
     def fetch_datasets(self):
@@ -115,9 +175,10 @@ class Storage:
             dict_result = self.remove_instance_state_key(result)
             return dict_result
 
-    def fetch_datasets_of_task(self, id):
+    def fetch_datasets_of_task(self, id, columns=None, exclude=None):
         with SessionContext() as session:
-            result = session.query(Dataset).filter(Dataset.task_id == id)
+            result = session.query(Dataset).options(*column_options(Dataset, columns, exclude)) \
+                .filter(Dataset.task_id == id)
             dict_result = self.remove_instance_state_key(result)
             return dict_result
 
@@ -136,14 +197,15 @@ class Storage:
                 task.deployed_model_id = None
         return
 
-    def fetch_deployed_model(self, task_id):
+    def fetch_deployed_model(self, task_id, columns=None, exclude=None):
         model = None
         with SessionContext() as session:
             task = session.query(Task).filter(Task.id == task_id).first()
             if task:
-                model = session.query(Model).filter(Model.id == task.deployed_model_id)
+                model = session.query(Model).options(*column_options(Model, columns, exclude)) \
+                    .filter(Model.id == task.deployed_model_id)
                 if model.first():
-                    model = self.remove_instance_state_key(model)[0]
+                    model = self.load_model_results(self.remove_instance_state_key(model))[0]
                 else:
                     model = None
         return model
@@ -195,12 +257,15 @@ class Storage:
                 values.append(pickle_dump(valid_loss_list))
                 attrs.append("valid_loss_list")
 
+            # Results are written to files. The database keeps their references.
             if best_epoch_valid_result is not None:
-                values.append(pickle_dump(best_epoch_valid_result))
+                values.append(pickle_dump(
+                    save_result(id, "best_epoch_valid_result", best_epoch_valid_result)))
                 attrs.append("best_epoch_valid_result")
 
             if last_prediction_result is not None:
-                values.append(pickle_dump(last_prediction_result))
+                values.append(pickle_dump(
+                    save_result(id, "last_prediction_result", last_prediction_result)))
                 attrs.append("last_prediction_result")
 
             if len(attrs) > 0:
@@ -210,9 +275,10 @@ class Storage:
                 ).filter(Model.id == id).update(values={a: v for a, v in zip(attrs, values)})
                 session.commit()
 
-    def fetch_dataset(self, id):
+    def fetch_dataset(self, id, columns=None, exclude=None):
         with SessionContext() as session:
-            result = session.query(Dataset).filter(Dataset.id == id)
+            result = session.query(Dataset).options(*column_options(Dataset, columns, exclude)) \
+                .filter(Dataset.id == id)
             dict_result = self.remove_instance_state_key(result)
             assert dict_result
             return dict_result[0]
@@ -265,10 +331,19 @@ class Storage:
             dict_result = self.remove_instance_state_key(result)
             return dict_result
 
+    def load_model_results(self, models):
+        """Replaces references of results in model dictionaries with the results."""
+        for m in models:
+            for key in MODEL_RESULT_COLUMNS:
+                if key in m:
+                    m[key] = load_result(m[key])
+        return models
+
     def remove_instance_state_key(self, result):
         dict_result = list()
         for res in result:
             res_dict = {}
+            # Deferred columns are not in __dict__, so they are never unpickled here.
             for key, value in res.__dict__.items():
                 if not key == '_sa_instance_state':
                     if isinstance(value, bytes):
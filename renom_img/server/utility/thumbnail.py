@@ -0,0 +1,93 @@
+# coding: utf-8
+import os
+import hashlib
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from renom_img.server import DB_DIR_THUMBNAIL, THUMBNAIL_SIZES, THUMBNAIL_WORKER_NUM
+
+
+class ThumbnailCache(object):
+    """On-disk cache of downscaled images.
+
+    Thumbnails are keyed by (path, modification time, file size, thumbnail size),
+    so an image which is replaced gets a new thumbnail. They are generated by a
+    bounded thread pool, and concurrent requests for the same thumbnail wait for
+    one generation. If the image is not larger than the thumbnail, an empty
+    marker file is written instead, and the original is served without opening it.
+
+    Args:
+        cache_dir (Path): Directory for the thumbnails.
+        num_worker (int): Number of threads generating thumbnails.
+    """
+
+    def __init__(self, cache_dir=DB_DIR_THUMBNAIL, num_worker=THUMBNAIL_WORKER_NUM):
+        self.cache_dir = cache_dir
+        self._executor = ThreadPoolExecutor(max_workers=num_worker)
+        self._futures = {}
+        self._lock = Lock()
+
+    def thumbnail_size(self, size):
+        """Returns the smallest size in THUMBNAIL_SIZES which is not less than ``size``.
+        None is returned if ``size`` is larger than all of them.
+        """
+        for s in THUMBNAIL_SIZES:
+            if size <= s:
+                return s
+        return None
+
+    def path_of(self, src, size):
+        stat = os.stat(src)
+        key = "{}:{}:{}:{}".format(os.path.abspath(src), stat.st_mtime_ns, stat.st_size, size)
+        ext = ".png" if src.lower().endswith(".png") else ".jpg"
+        return self.cache_dir / (hashlib.sha1(key.encode()).hexdigest() + ext)
+
+    def marker_of(self, dst):
+        # Marks that the original of ``dst`` is not larger than the thumbnail.
+        return dst.with_suffix(".small")
+
+    def get(self, src, size):
+        """Returns the path of the thumbnail of ``src`` whose longer side is at most
+        ``size`` pixels. The original path is returned if the image is smaller.
+
+        Args:
+            src (str): Path to the original image.
+            size (int): Requested size in pixels.
+
+        Returns:
+            (str): Path to the file to be served.
+        """
+        size = self.thumbnail_size(size)
+        if size is None:
+            return src
+        dst = self.path_of(src, size)
+        if dst.exists():
+            return str(dst)
+        if self.marker_of(dst).exists():
+            return src
+        with self._lock:
+            future = self._futures.get(dst, None)
+            if future is None:
+                future = self._executor.submit(self._generate, src, size, dst)
+                self._futures[dst] = future
+        try:
+            return future.result()
+        finally:
+            with self._lock:
+                self._futures.pop(dst, None)
+
+    def _generate(self, src, size, dst):
+        img = Image.open(src)
+        if max(img.size) <= size:
+            open(str(self.marker_of(dst)), "w").close()
+            return src
+        img.thumbnail((size, size), Image.BILINEAR)
+        if dst.suffix == ".jpg" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        tmp_path = str(dst) + ".tmp" + dst.suffix
+        img.save(tmp_path)
+        os.replace(tmp_path, str(dst))
+        return str(dst)
+
+
+thumbnail_cache = ThumbnailCache()
@@ -8,6 +8,12 @@ from PIL import Image
 from renom_img.api.utility.evaluate import EvaluatorClassification
 from renom_img.api.utility.evaluate import EvaluatorDetection
 from renom_img.api.utility.evaluate import EvaluatorSegmentation
+from renom_img.api.utility.evaluate import StreamingEvaluatorClassification
+from renom_img.api.utility.evaluate import StreamingEvaluatorDetection
+from renom_img.api.utility.evaluate import StreamingEvaluatorSegmentation
+from renom_img.api.utility.evaluate.classification import precision_recall_f1_score
+from renom_img.api.utility.evaluate.detection import get_prec_and_rec, average_precision
+from renom_img.api.utility.evaluate.segmentation import get_segmentation_metrics
 from renom_img.api.utility.augmentation.process import contrast_norm
 from renom_img.api.utility.augmentation.process import shift
 from renom_img.api.utility.augmentation.process import rotate, flip, white_noise
@@ -84,3 +90,146 @@ def test_evaluator_iou(pred, gt):
     iou = evalDetection.iou()
     assert iou['dog'] == 0.662
     assert iou['cat'] == 0.667
+
+
+@pytest.mark.parametrize('iou_thresh', [0.3, 0.5, 0.7])
+def test_evaluator_cached_matching(iou_thresh):
+    # Boxes either coincide with a ground truth box or don't overlap it,
+    # so the expected values are the same for all thresholds.
+    pred = [[{'box': [50, 50, 20, 20], 'score': 0.6, 'class': 0, 'name': 'dog'},
+             # Duplicate with a higher score which comes later.
+             {'box': [50, 50, 20, 20], 'score': 0.9, 'class': 0, 'name': 'dog'},
+             # Another class on the dog.
+             {'box': [50, 50, 20, 20], 'score': 0.8, 'class': 1, 'name': 'cat'},
+             {'box': [150, 150, 20, 20], 'score': 0.7, 'class': 1, 'name': 'cat'}],
+            [{'box': [10, 10, 20, 20], 'score': 0.5, 'class': 0, 'name': 'dog'}],
+            []]
+    gt = [[{'box': [50, 50, 20, 20], 'class': 0, 'name': 'dog'},
+           {'box': [150, 150, 20, 20], 'class': 1, 'name': 'cat'}],
+          [],
+          [{'box': [80, 80, 20, 20], 'class': 0, 'name': 'dog'}]]
+    evaluator = EvaluatorDetection(pred, gt)
+    # Results of another threshold must not be reused.
+    evaluator.mAP(0.9)
+    prec, rec, n_pred, n_pos = get_prec_and_rec(pred, gt, iou_threshold=iou_thresh)
+    cached_prec, cached_rec = evaluator.prec_rec(iou_thresh)
+    assert n_pred == evaluator._evaluate(iou_thresh)[2]
+    assert n_pos == evaluator._evaluate(iou_thresh)[3]
+    for c in prec:
+        assert np.allclose(prec[c], cached_prec[c])
+        assert np.allclose(rec[c], cached_rec[c])
+
+    # A ground truth box is matched to the first box in the list, so the duplicate
+    # is a false positive. In descending order of score the dog boxes are FP, TP, FP.
+    # The cat box on the dog is a false positive and doesn't take the dog.
+    assert n_pos == {'dog': 2, 'cat': 1}
+    assert n_pred == {'dog': 1, 'cat': 1}
+    assert np.allclose(prec['dog'], [0., 1 / 2., 1 / 3.])
+    assert np.allclose(rec['dog'], [0., 1 / 2., 1 / 2.])
+    assert np.allclose(prec['cat'], [0., 1 / 2.])
+    assert np.allclose(rec['cat'], [0., 1.])
+
+
+def test_evaluator_coco():
+    gt = [[{'box': [30, 30, 20, 20], 'class': 0, 'name': 'dog'},
+           {'box': [100, 100, 60, 60], 'class': 1, 'name': 'cat'}],
+          [{'box': [150, 150, 120, 120], 'class': 0, 'name': 'dog'}]]
+    pred = [[dict(obj, score=0.9) for obj in img] for img in gt]
+    summary = EvaluatorDetection(pred, gt).coco_summary()
+    assert summary == {'mAP': 1.0, 'mAP50': 1.0, 'mAP75': 1.0,
+                       'mAP_small': 1.0, 'mAP_medium': 1.0, 'mAP_large': 1.0}
+
+    # A shifted box is a true positive only for low thresholds.
+    pred[0][0] = dict(pred[0][0], box=[34, 30, 20, 20])
+    evaluator = EvaluatorDetection(pred, gt)
+    ap, _ = evaluator.coco_AP(area="small")
+    assert 0 < ap['dog'] < 1
+    assert 'cat' not in ap
+    assert evaluator.coco_AP(iou_thresholds=[0.5])[1] == 1.0
+
+    prec = np.array([1.0, 0.5, 2 / 3.])
+    rec = np.array([0.5, 0.5, 1.0])
+    assert np.isclose(average_precision(prec, rec, "all"), 0.5 + 0.5 * 2 / 3.)
+    assert np.isclose(average_precision(prec, rec, "11point"), (6 + 5 * 2 / 3.) / 11)
+
+
+def test_evaluator_max_detections():
+    gt = [[{'box': [10, 10, 20, 20], 'class': 0, 'name': 'dog'},
+           {'box': [100, 100, 20, 20], 'class': 1, 'name': 'cat'}]]
+    # Boxes of the dog outnumber max_detections and have higher scores than the cat.
+    pred = [[{'box': [10, 10, 20, 20], 'score': 0.9, 'class': 0, 'name': 'dog'},
+             {'box': [50, 50, 20, 20], 'score': 0.8, 'class': 0, 'name': 'dog'},
+             {'box': [150, 150, 20, 20], 'score': 0.7, 'class': 0, 'name': 'dog'},
+             {'box': [100, 100, 20, 20], 'score': 0.5, 'class': 1, 'name': 'cat'}]]
+    evaluator = EvaluatorDetection(pred, gt)
+    # The limit is applied to each class, so the box of the cat is evaluated.
+    ap, mAP = evaluator.coco_AP(iou_thresholds=[0.5], method="all", max_detections=2)
+    assert ap == {'dog': 1.0, 'cat': 1.0}
+    assert mAP == 1.0
+
+
+@pytest.mark.parametrize('pred, gt', [
+    [[[{'box': [40, 30, 60, 40], 'score': 0.8, 'class': 0, 'name': 'dog'},
+        {'box': [70, 90, 40, 20], 'score': 0.9, 'class': 1, 'name': 'cat'},
+        {'box': [20, 20, 30, 40], 'score': 0.9, 'class': 1, 'name': 'cat'}],
+        [{'box': [80, 100, 60, 40], 'score': 0.8, 'class': 0, 'name': 'dog'}]],
+        [[{'box': [45, 30, 60, 50], 'class': 0, 'name': 'dog'},
+            {'box': [70, 95, 40, 30], 'class': 1, 'name': 'cat'}],
+            [{'box': [80, 90, 60, 50], 'class': 0, 'name': 'dog'}]]]
+])
+def test_streaming_evaluator(pred, gt):
+    # Results accumulated batch by batch equal to the results of the whole set.
+    evaluator = StreamingEvaluatorDetection()
+    for i in range(len(pred)):
+        evaluator.update(pred[i:i + 1], gt[i:i + 1])
+    _, _, iou, _ = evaluator.compute()
+    assert iou == EvaluatorDetection(pred, gt).iou()
+    assert evaluator.mAP() == EvaluatorDetection(pred, gt).mAP()
+
+    rng = np.random.RandomState(0)
+    pred = rng.randint(0, 5, size=(10, ))
+    gt = rng.randint(0, 5, size=(10, ))
+    evaluator = StreamingEvaluatorClassification()
+    for i in range(0, 10, 3):
+        evaluator.update(pred[i:i + 3], gt[i:i + 3])
+    for result, expected in zip(evaluator.compute(), precision_recall_f1_score(pred, gt)):
+        if isinstance(expected, dict):
+            assert set(result.keys()) == set(expected.keys())
+            assert all(np.isclose(result[k], expected[k]) for k in expected)
+        else:
+            assert np.isclose(result, expected)
+
+    pred = rng.randint(0, 5, size=(10, 8, 8))
+    gt = rng.randint(0, 5, size=(10, 8, 8))
+    evaluator = StreamingEvaluatorSegmentation(5)
+    for i in range(0, 10, 3):
+        evaluator.update(pred[i:i + 3], gt[i:i + 3])
+    assert evaluator.compute() == get_segmentation_metrics(pred, gt, 5)
+
+
+@pytest.mark.parametrize('n_class, k', [[3, 1], [10, 5]])
+def test_classification_metrics(n_class, k):
+    rng = np.random.RandomState(0)
+    scores = rng.rand(50, n_class)
+    pred = np.argmax(scores, axis=1)
+    gt = rng.randint(0, n_class, size=(50, ))
+    evaluator = EvaluatorClassification(pred, gt, scores=scores)
+    precision, mean_precision = evaluator.precision()
+    recall, _ = evaluator.recall()
+    for c in precision:
+        tp = np.sum((pred == c) & (gt == c))
+        assert np.isclose(precision[c], tp / max(np.sum(pred == c), 1))
+        assert np.isclose(recall[c], tp / max(np.sum(gt == c), 1))
+    weight = np.array([np.sum(gt == c) for c in precision]) / float(len(gt))
+    assert np.isclose(mean_precision, np.sum(np.array(list(precision.values())) * weight))
+    assert np.isclose(evaluator.accuracy(), np.mean(pred == gt))
+
+    top_k = np.argsort(-scores, axis=1)[:, :k]
+    expected = np.mean([t in row for t, row in zip(gt, top_k)])
+    assert np.isclose(evaluator.top_k_accuracy(k), expected)
+
+    streaming = StreamingEvaluatorClassification(top_k=(k, ))
+    for i in range(0, 50, 16):
+        streaming.update(scores[i:i + 16], gt[i:i + 16])
+    assert np.isclose(streaming.top_k_accuracy(k), expected)
+    assert streaming.compute()[0] == precision
@@ -3,7 +3,9 @@ import numpy as np
 import inspect
 import pytest
 import types
+import threading
 from pathlib import Path
+from PIL import Image
 
 from renom.cuda import set_cuda_active, release_mem_pool
 
@@ -21,7 +23,8 @@ from renom_img.api.segmentation.fcn import FCN8s, FCN16s, FCN32s
 from renom_img.api.segmentation.unet import UNet
 
 from renom_img.api.utility.augmentation import Augmentation
-from renom_img.api.utility.load import parse_xml_detection
+from renom_img.api.utility.load import parse_xml_detection, load_img
+from renom_img.server.utility.model_cache import ModelCache
 
 
 set_cuda_active(True)
@@ -52,3 +55,162 @@ def test_weight_download(algo):
     model.save(str(path))
     model.load(str(path))
     path.unlink()
+
+
+@pytest.mark.parametrize("algo, imsize", [
+    [Yolov1, (224, 224)],
+    [SSD, (300, 300)],
+    [VGG16, (224, 224)],
+    [ResNet18, (224, 224)],
+    [ResNeXt50, (224, 224)],
+    [DenseNet121, (224, 224)],
+])
+def test_forward_frozen_and_head(algo, imsize):
+    model = algo(["dog", "cat"], imsize=imsize, train_whole_network=False)
+    assert model.feature_cacheable
+    model.set_models(inference=True)
+    x = np.random.rand(2, 3, *imsize).astype(np.float32)
+    z = model.forward_frozen(x)
+    y1 = model.forward_head(z.as_ndarray()).as_ndarray()
+    y2 = model(x).as_ndarray()
+    assert np.allclose(y1, y2, atol=1e-4)
+
+
+@pytest.mark.parametrize("algo", [
+    ResNet18,
+    VGG16,
+    InceptionV1,
+])
+def test_forward_inference(algo):
+    model = algo(["dog", "cat"], imsize=(224, 224))
+    model.set_models(inference=True)
+    # Any batch size is accepted.
+    for batch_size in [2, 3]:
+        x = np.random.rand(batch_size, 3, 224, 224).astype(np.float32)
+        expected = model(x)
+        if isinstance(expected, tuple):
+            expected = expected[-1]
+        z = model.forward_inference(x)
+        if isinstance(z, tuple):
+            z = z[-1]
+        assert np.allclose(z, expected.as_ndarray(), atol=1e-4)
+
+
+@pytest.mark.parametrize("algo", [
+    ResNet18,
+    ResNeXt50,
+    DenseNet121,
+])
+def test_fuse_for_inference(algo):
+    model = algo(["dog", "cat"], imsize=(224, 224))
+    model.set_models(inference=True)
+    x = np.random.rand(2, 3, 224, 224).astype(np.float32)
+    expected = model(x).as_ndarray()
+    assert model.fuse_for_inference() > 0
+    assert np.allclose(model(x).as_ndarray(), expected, atol=1e-3)
+
+
+def test_predict_iter():
+    model = VGG16(["dog", "cat"])
+    img_path_list = ["voc.jpg", "renom.png", "voc.jpg"]
+    batches = list(model.predict_iter(img_path_list, batch_size=2, num_worker=2, return_size=True))
+    assert len(batches) == 2
+    assert [len(result) for result, _ in batches] == [2, 1]
+    assert batches[0][1][0] == batches[1][1][0]
+    results = model.predict(img_path_list, batch_size=2)
+    assert len(results) == 3
+    assert results[0] == results[2]
+
+
+def test_shared_model_prediction():
+    # Batch prediction and online inference use the same cached model at once.
+    model = ResNet18(["dog", "cat"], imsize=(64, 64))
+    cache = ModelCache(1)
+    model, lock = cache.put((0, 0), model)
+    assert cache.get((0, 0)) == (model, lock)
+
+    img_path_list = ["voc.jpg", "renom.png"] * 4
+    expected = model.predict(img_path_list, batch_size=3)
+    x = model.preprocess(np.vstack([load_img(p, model.imsize)[None] for p in img_path_list[:2]]))
+    expected_online = model._predict_array(x)
+    errors = []
+
+    def batch_prediction():
+        for _ in range(5):
+            results = []
+            for result in model.predict_iter(img_path_list, batch_size=3, lock=lock):
+                results.extend(result)
+            if results != expected:
+                errors.append("batch")
+
+    def online_inference():
+        for _ in range(20):
+            with lock:
+                results = model._predict_array(x)
+            if list(results) != list(expected_online):
+                errors.append("online")
+
+    threads = [threading.Thread(target=batch_prediction), threading.Thread(target=online_inference)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    assert not errors
+
+
+def test_detection_predict_tiled(tmpdir):
+    # The second object crosses the border of the first tile.
+    img = np.full((224, 336, 3), 255, dtype=np.uint8)
+    img[20:60, 20:60] = 0
+    img[50:150, 180:260] = 0
+    img_path = str(tmpdir.join("tiled.png"))
+    Image.fromarray(img).save(img_path)
+
+    def predict_dark_area(self, x, **kwargs):
+        # Finds the visible part of the dark objects in each tile.
+        preds = []
+        for tile in x:
+            _, h, w = tile.shape
+            dark = tile[0] < 128
+            cols = np.nonzero(dark.any(axis=0))[0]
+            objs = []
+            for run in np.split(cols, np.nonzero(np.diff(cols) > 1)[0] + 1):
+                if len(run) == 0:
+                    continue
+                rows = np.nonzero(dark[:, run].any(axis=1))[0]
+                x1, x2 = run[0], run[-1] + 1.
+                y1, y2 = rows[0], rows[-1] + 1.
+                objs.append({"box": [(x1 + x2) / 2. / w, (y1 + y2) / 2. / h, (x2 - x1) / w, (y2 - y1) / h],
+                             "score": (x2 - x1) * (y2 - y1) / (w * h), "class": 0, "name": "dog"})
+            preds.append(objs)
+        return preds
+
+    model = Yolov1(["dog", "cat"])
+    model.preprocess = lambda x: x
+    model._predict_array = types.MethodType(predict_dark_area, model)
+    result = model.predict_tiled(img_path, tile_size=(224, 224), overlap=112)
+    assert len(result) == 2
+    boxes = sorted(obj["box"] for obj in result)
+    assert np.allclose(boxes[0], [40 / 336., 40 / 224., 40 / 336., 40 / 224.], atol=1e-4)
+    assert np.allclose(boxes[1], [220 / 336., 100 / 224., 80 / 336., 100 / 224.], atol=1e-4)
+
+
+def test_segmentation_predict_tiled(tmpdir):
+    rand = np.random.RandomState(0)
+    red = rand.randint(0, 256, (80, 100)).astype(np.uint8)
+    # Scores of the classes are never the same.
+    img = np.stack([red, 255 - red, np.zeros_like(red)], axis=2)
+    img_path = str(tmpdir.join("tiled.png"))
+    Image.fromarray(img).save(img_path)
+
+    def engine(x):
+        # Logits depend only on the pixel, so blending doesn't change them.
+        return np.stack([x[:, 0], x[:, 1]], axis=1)
+
+    model = UNet(["a", "b"], imsize=(64, 64))
+    model.preprocess = lambda x: x
+    model.forward_inference = engine
+    result = model.predict_tiled(img_path, tile_size=(64, 64), overlap=16, batch_size=3)
+    expected = np.argmax(engine(img.transpose(2, 0, 1)[None].astype(np.float32)), axis=1)[0]
+    assert result.shape == (80, 100)
+    assert np.array_equal(result, expected)
@@ -0,0 +1,43 @@
+import pytest
+
+from renom_img.server.utility.progress import ProgressStore
+
+
+class FailingStorage(object):
+
+    def __init__(self, n_failure):
+        self.n_failure = n_failure
+        self.written = {}
+
+    def update_model(self, id, **values):
+        if self.n_failure > 0:
+            self.n_failure -= 1
+            raise Exception("database is locked")
+        self.written.setdefault(id, {}).update(values)
+
+
+@pytest.mark.parametrize('model_id', [None, 1])
+def test_progress_store_retries_failed_write(model_id):
+    storage = FailingStorage(n_failure=1)
+    store = ProgressStore(interval=60, storage=storage)
+    store.update(1, nth_batch=1, last_batch_loss=0.5)
+
+    with pytest.raises(Exception):
+        store.flush(model_id)
+    assert storage.written == {}
+    assert store.pending(1) == {"nth_batch": 1, "last_batch_loss": 0.5}
+
+    # Values updated after the failure are newer than the kept ones.
+    store.update(1, nth_batch=2)
+    store.flush(model_id)
+    assert storage.written == {1: {"nth_batch": 2, "last_batch_loss": 0.5}}
+    assert store.pending(1) == {}
+
+
+def test_progress_store_pending_ids():
+    store = ProgressStore(interval=60, storage=FailingStorage(n_failure=0))
+    store.update(1, nth_batch=1)
+    store.update(2, nth_batch=1)
+    assert sorted(store.pending_ids()) == [1, 2]
+    store.flush(1)
+    assert store.pending_ids() == [2]
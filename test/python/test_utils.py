@@ -4,19 +4,35 @@ import shutil
 import pytest
 import numpy as np
 import inspect
+from pathlib import Path
 from PIL import Image
+from bottle import request
 from renom_img.api.utility.load import parse_xml_detection
+from renom_img.api.utility.annotation import AnnotationList, box_array, replace_boxes
 from renom_img.api.utility.evaluate import EvaluatorClassification
 from renom_img.api.utility.evaluate import EvaluatorDetection
 from renom_img.api.utility.evaluate import EvaluatorSegmentation
+from renom_img.api.utility.evaluate import Fast_Segmentation_Evaluator
+from renom_img.api.utility.evaluate.segmentation import get_segmentation_metrics, metrics_from_confusion
+from renom_img.api.utility.evaluate.segmentation import confusion_matrix as segmentation_confusion_matrix
+from renom_img.api.utility.evaluate.segmentation import confusion_matrices
 from renom_img.api.utility.augmentation.process import contrast_norm
 from renom_img.api.utility.augmentation.process import shift
 from renom_img.api.utility.augmentation.process import *
+from renom_img.api.utility.augmentation import Augmentation
 
 from renom_img.api.utility.target import DataBuilderClassification, DataBuilderDetection, DataBuilderSegmentation
 
+from renom_img.api.utility.distributor.distributor import ImageDistributor
 from renom_img.api.utility.misc.display import draw_box
 from renom_img.api.utility.box import rescale
+from renom_img.api.utility.tile import TileLoader, tile_starts, tile_weight, nms_xyxy
+from renom_img.server import DB_DIR_RESULT
+from renom_img.server.utility.artifact import encode_mask, decode_mask, result_digest
+from renom_img.server.utility.artifact import save_result, load_result, remove_results
+from renom_img.server.utility.artifact import encode_boxes, decode_boxes
+from renom_img.server.utility.http_cache import encoded_response, is_not_modified, not_modified
+from renom_img.server.utility.thumbnail import ThumbnailCache
 
 
 @pytest.fixture(scope='session', autouse=True)
@@ -215,3 +231,201 @@ def test_parse_xml_detection(path, error):
     except Exception as e:
         print(e)
         assert error
+
+
+def test_annotation_list():
+    annotation_list, class_map = parse_xml_detection(['voc.xml'], num_thread=1)
+    columnar, columnar_class_map = parse_xml_detection(['voc.xml'], num_thread=1, columnar=True)
+    assert isinstance(columnar, AnnotationList)
+    assert columnar_class_map == class_map
+    assert columnar.to_list() == AnnotationList.from_list(annotation_list, class_map).to_list()
+    for an, col_an in zip(annotation_list, columnar):
+        assert len(an) == len(col_an)
+        assert np.allclose(box_array(an), box_array(col_an))
+        for obj, col_obj in zip(an, col_an):
+            assert obj["name"] == col_obj["name"]
+            assert obj["class"] == col_obj["class"]
+
+    # Replaced boxes keep the type and the other keys.
+    boxes = box_array(columnar[0])
+    boxes[:, 0] += 1
+    moved = replace_boxes(columnar[0], boxes, np.arange(1))
+    assert len(moved) == 1
+    assert moved[0]["box"][0] == columnar[0][0]["box"][0] + 1
+    assert moved[0]["name"] == columnar[0][0]["name"]
+
+
+def test_augmentation_replay():
+    x = [np.random.rand(3, 32, 32) * 255 for _ in range(2)]
+    y = [[{"box": [10, 12, 8, 6], "class": 0, "name": "test1"}] for _ in range(2)]
+    aug = Augmentation([(Flip(), 0.5), (Shift(10, 10), 1.0), WhiteNoise()], seed=1)
+
+    batch_aug = aug.for_batch(epoch=2, batch=5)
+    x1, y1 = batch_aug(x, y, mode="detection")
+    x2, y2 = aug.replay(x, y, batch_aug.record, mode="detection")
+    x3, y3 = aug.transform(x, y, mode="detection", epoch=2, batch=5)
+    for a, b, c in zip(x1, x2, x3):
+        assert np.allclose(a, b) and np.allclose(a, c)
+    assert y1 == y2 == y3
+
+    # Skipping a process does not change parameters of the other processes.
+    record = dict(batch_aug.record, applied=[False, True, False])
+    x4, _ = aug.replay(x, y, record, mode="detection")
+    x5, _ = Shift(10, 10)(x, y, mode="detection",
+                          rng=np.random.default_rng(np.random.SeedSequence(record["entropy"]).spawn(4)[2]))
+    for a, b in zip(x4, x5):
+        assert np.allclose(a, b)
+
+
+@pytest.mark.parametrize('memory_budget', [0, 1024**3])
+def test_distributor_cached_batch(memory_budget):
+    n_build = [0]
+
+    def builder(img_path_list, annotation_list, **kwargs):
+        n_build[0] += 1
+        return np.array(annotation_list, dtype=np.float32), np.array(annotation_list)
+
+    dist = ImageDistributor(['renom.png'] * 5, list(range(5)), num_worker=1)
+    first = list(dist.cached_batch(2, target_builder=builder, memory_budget=memory_budget))
+    second = list(dist.cached_batch(2, target_builder=builder, memory_budget=memory_budget))
+    assert n_build[0] == 3
+    assert len(first) == len(second) == 3
+    for (x1, y1), (x2, y2) in zip(first, second):
+        assert np.allclose(x1, x2) and np.allclose(y1, y2)
+    assert np.allclose(np.concatenate([x for x, _ in second]), np.arange(5))
+    dist.clear_cache()
+
+
+def test_tile_loader():
+    # renom.png is split into 64x48 tiles which overlap 16 pixels.
+    width, height = Image.open('renom.png').size
+    loader = TileLoader('renom.png', (64, 48), 16, (32, 32), batch_size=3, num_worker=2)
+    starts = tile_starts(width, 64, 16)
+    assert starts[0] == 0 and starts[-1] == max(width - 64, 0)
+    batches = list(loader)
+    assert len(batches) == len(loader)
+    assert sum(len(tiles) for tiles, _ in batches) == len(loader.tiles)
+    assert all(img_array.shape[1:] == (3, 32, 32) for _, img_array in batches)
+
+    weight = tile_weight((64, 48), 16)
+    assert weight.shape == (48, 64)
+    assert weight[24, 32] == 1 and 0 < weight[0, 0] < weight[8, 8]
+
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 10, 10], [1, 1, 10, 10], [20, 20, 30, 30]], dtype=np.float32)
+    keep = nms_xyxy(boxes, np.array([0.9, 0.8, 0.7, 0.6]), np.array([0, 0, 1, 0]), 0.5)
+    assert keep.tolist() == [0, 2, 3]
+
+
+@pytest.mark.parametrize('n_class, ignore_class', [
+    [3, 0],
+    [5, [0, 4]],
+])
+def test_segmentation_confusion_metrics(n_class, ignore_class):
+    rng = np.random.RandomState(0)
+    pred = rng.randint(0, n_class, size=(4, 16, 16))
+    gt = rng.randint(0, n_class, size=(4, 16, 16))
+    gt[:, 0] = 255  # Out of range label.
+    precision, _, recall, _, _, _, iou, mean_iou, tp, true_sum = \
+        get_segmentation_metrics(pred, gt, n_class, ignore_class=ignore_class)
+    ignore = [ignore_class] if isinstance(ignore_class, int) else ignore_class
+    for c in range(n_class):
+        if c in ignore:
+            assert c not in iou
+            continue
+        expected_tp = np.sum((pred == c) & (gt == c))
+        assert tp[c] == expected_tp
+        assert true_sum[c] == np.sum(gt == c)
+        assert np.isclose(precision[c], expected_tp / np.sum(pred == c))
+        assert np.isclose(recall[c], expected_tp / np.sum(gt == c))
+        assert np.isclose(iou[c], expected_tp / np.sum((pred == c) | (gt == c)))
+
+    # Per image matrices sum up to the matrix of the whole set.
+    hists = confusion_matrices(pred, gt, n_class)
+    assert np.array_equal(hists.sum(axis=0), segmentation_confusion_matrix(pred, gt, n_class))
+    assert metrics_from_confusion(hists.sum(axis=0), ignore_class)[7] == mean_iou
+
+    fast = Fast_Segmentation_Evaluator(pred, gt, list(range(n_class)))
+    assert np.array_equal(fast.confusion_matrix(), hists.sum(axis=0)[:n_class, :n_class])
+
+
+@pytest.mark.parametrize('shape', [
+    (16, 24), (1, 1), (0, 4)
+])
+def test_mask_run_length_encoding(shape):
+    rng = np.random.RandomState(0)
+    mask = rng.randint(0, 3, size=shape)
+    rle = encode_mask(mask)
+    assert rle["size"] == list(shape)
+    assert sum(rle["counts"]) == mask.size
+    assert np.array_equal(decode_mask(rle), mask)
+
+
+@pytest.mark.parametrize("objects", [
+    [],
+    [{"box": [0.1, 0.2, 0.3, 0.4], "score": 0.9, "class": 1, "name": "cat"},
+     {"box": [0.5, 0.5, 0.25, 0.125], "score": 0.5, "class": 0, "name": "dog"}],
+])
+def test_box_encoding(objects):
+    encoded = encode_boxes(objects)
+    assert encoded["box"].dtype == np.float32 and encoded["box"].shape == (len(objects), 4)
+    assert encoded["score"].dtype == np.float32 and encoded["score"].shape == (len(objects), )
+    decoded = decode_boxes(encoded, ["dog", "cat"])
+    assert len(decoded) == len(objects)
+    for d, obj in zip(decoded, objects):
+        assert np.allclose(d["box"], obj["box"])
+        assert np.isclose(d["score"], obj["score"])
+        assert d["class"] == obj["class"] and d["name"] == obj["name"]
+
+
+def test_gzip_etag():
+    body = b"0" * 4096
+    request.bind({'HTTP_ACCEPT_ENCODING': 'gzip'})
+    r = encoded_response(body, headers={'ETag': '"abc"'})
+    assert r.headers['Content-Encoding'] == 'gzip'
+    assert r.headers['ETag'] == '"abc-gz"'
+
+    request.bind({})
+    r = encoded_response(body, headers={'ETag': '"abc"'})
+    assert r.headers['ETag'] == '"abc"'
+
+    # Both representations are revalidated with the tag the client has.
+    request.bind({'HTTP_IF_NONE_MATCH': '"abc-gz"'})
+    assert is_not_modified('"abc"')
+    assert not_modified('"abc"').headers['ETag'] == '"abc-gz"'
+    request.bind({'HTTP_IF_NONE_MATCH': '"abd-gz"'})
+    assert not is_not_modified('"abc"')
+
+
+def test_result_digest():
+    # Results written in the same second have different digests.
+    assert result_digest({"prediction": [1, 2]}) != result_digest({"prediction": [1, 3]})
+    assert result_digest({"artifact": "a.pkl", "digest": "0123"}) == "0123"
+
+
+def test_load_result_cache():
+    DB_DIR_RESULT.mkdir(parents=True, exist_ok=True)
+    try:
+        ref = save_result(0, "test", {"loss": 1.0, "prediction": [1, 2]})
+        result = load_result(ref)
+        assert result == {"loss": 1.0, "prediction": [1, 2]}
+        # The same digest is served from memory.
+        assert load_result(ref) is result
+
+        # A rewritten artifact has a new digest and is read again.
+        new_ref = save_result(0, "test", {"loss": 0.5, "prediction": [1, 3]})
+        assert new_ref["artifact"] == ref["artifact"]
+        assert load_result(new_ref)["prediction"] == [1, 3]
+    finally:
+        remove_results(0)
+
+
+def test_thumbnail_of_small_image(tmpdir):
+    src = str(tmpdir.join("small.png"))
+    Image.fromarray(np.zeros((10, 20, 3), dtype=np.uint8)).save(src)
+    cache = ThumbnailCache(cache_dir=Path(str(tmpdir)), num_worker=1)
+    assert cache.get(src, 64) == src
+    # The result is remembered, and no thumbnail is written.
+    dst = cache.path_of(src, 64)
+    assert cache.marker_of(dst).exists()
+    assert not dst.exists()
+    assert cache.get(src, 64) == src
@@ -0,0 +1,58 @@
+"""Measures CPU latency of prediction before and after ``fuse_for_inference``.
+
+Usage:
+    python benchmark_fuse.py --batch_size 1 --repeat 20
+"""
+import time
+import argparse
+import numpy as np
+
+from renom.cuda import set_cuda_active
+from renom_img.api.classification.resnet import ResNet18, ResNet50
+from renom_img.api.classification.resnext import ResNeXt50
+from renom_img.api.classification.densenet import DenseNet121
+from renom_img.api.classification.darknet import Darknet19
+from renom_img.api.utility.fusion import fuse_batch_normalize
+
+
+def measure(func, x, repeat):
+    func(x)  # Warm up.
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(x)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch_size', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    set_cuda_active(False)
+    x = np.random.rand(args.batch_size, 3, 224, 224).astype(np.float32)
+    print("{:<12} {:>6} {:>12} {:>12} {:>8} {:>10}".format(
+        "Model", "Folded", "Before[ms]", "After[ms]", "Saved", "MaxDiff"))
+
+    for algo in [ResNet18, ResNet50, ResNeXt50, DenseNet121, Darknet19]:
+        if algo is Darknet19:
+            model = algo(num_class=2)
+        else:
+            model = algo(["dog", "cat"], imsize=(224, 224))
+        model.set_models(inference=True)
+
+        def forward(x):
+            return model(x).as_ndarray()
+        expected = forward(x)
+        before = measure(forward, x, args.repeat)
+        # Darknet19 is a backbone network, not a Base subclass.
+        folded = fuse_batch_normalize(model) if algo is Darknet19 else model.fuse_for_inference()
+        after = measure(forward, x, args.repeat)
+        diff = np.abs(forward(x) - expected).max()
+        print("{:<12} {:>6} {:>12.2f} {:>12.2f} {:>7.1f}% {:>10.2e}".format(
+            algo.__name__, folded, before * 1000, after * 1000,
+            (1 - after / before) * 100, diff))
+
+
+if __name__ == "__main__":
+    main()
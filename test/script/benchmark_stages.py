@@ -0,0 +1,70 @@
+"""Measures CPU peak memory and latency of prediction with and without
+releasing the computational graph of each stage (``Base.forward_inference``).
+
+The peak memory is the peak of the memory traced by tracemalloc during a
+forward propagation, which includes the arrays allocated by numpy.
+
+Usage:
+    python benchmark_stages.py --batch_size 8 --repeat 10
+"""
+import time
+import argparse
+import tracemalloc
+import numpy as np
+
+from renom.cuda import set_cuda_active
+from renom_img.api.classification.resnet import ResNet18, ResNet50
+from renom_img.api.classification.resnext import ResNeXt50
+from renom_img.api.classification.densenet import DenseNet121
+from renom_img.api.classification.vgg import VGG16
+
+
+def measure(func, x, repeat):
+    func(x)  # Warm up.
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(x)
+    return (time.perf_counter() - start) / repeat
+
+
+def peak_memory(func, x):
+    tracemalloc.start()
+    try:
+        func(x)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch_size', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    set_cuda_active(False)
+    x = np.random.rand(args.batch_size, 3, 224, 224).astype(np.float32)
+    print("{:<12} {:>6} {:>12} {:>12} {:>12} {:>12} {:>10}".format(
+        "Model", "Stages", "Whole[MB]", "Staged[MB]", "Whole[ms]", "Staged[ms]", "MaxDiff"))
+
+    for algo in [ResNet18, ResNet50, ResNeXt50, DenseNet121, VGG16]:
+        model = algo(["dog", "cat"], imsize=(224, 224))
+        model.set_models(inference=True)
+
+        def whole(x):
+            return model(x).as_ndarray()
+
+        def staged(x):
+            return model.forward_inference(x)
+
+        expected = whole(x)
+        diff = np.abs(staged(x) - expected).max()
+        print("{:<12} {:>6} {:>12.1f} {:>12.1f} {:>12.2f} {:>12.2f} {:>10.2e}".format(
+            algo.__name__, len(model.inference_stages()),
+            peak_memory(whole, x) / 2**20, peak_memory(staged, x) / 2**20,
+            measure(whole, x, args.repeat) * 1000, measure(staged, x, args.repeat) * 1000,
+            diff))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Measures throughput of the model table under concurrent access with the
+default SQLAlchemy engine and the tuned engine (WAL, synchronous=NORMAL,
+connection pool and scoped sessions).
+
+Writer threads update the progress of their own model like training threads,
+and reader threads fetch the model list like polling requests.
+
+Usage:
+    python benchmark_storage.py --writers 2 --readers 8 --seconds 10
+"""
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import numpy as np
+from sqlalchemy.orm import sessionmaker, scoped_session
+
+from renom_img.server.utility.DAO import create_db_engine, Base
+from renom_img.server.utility.table import Model, Task
+from renom_img.server.utility.storage import pickle_dump
+
+
+def prepare(path, tuned, n_model):
+    engine = create_db_engine(path, tuned)
+    Base.metadata.create_all(bind=engine)
+    if tuned:
+        Session = scoped_session(sessionmaker(bind=engine))
+    else:
+        Session = sessionmaker(bind=engine)
+    session = Session()
+    session.add(Task(id=0, name='Classification'))
+    for _ in range(n_model):
+        session.add(Model(task_id=0, dataset_id=0, algorithm_id=1,
+                          hyper_parameters=pickle_dump({})))
+    session.commit()
+    ids = [m.id for m in session.query(Model.id)]
+    session.close()
+    return engine, Session, ids
+
+
+def run(Session, ids, n_writer, n_reader, seconds):
+    stop = threading.Event()
+    latency = {"write": [], "read": []}
+    errors = []
+    lock = threading.Lock()
+
+    def record(kind, start):
+        with lock:
+            latency[kind].append(time.perf_counter() - start)
+
+    def writer(model_id):
+        loss = []
+        i = 0
+        while not stop.is_set():
+            start = time.perf_counter()
+            session = Session()
+            try:
+                loss.append(float(i))
+                session.query(Model).filter(Model.id == model_id).update(
+                    values={"nth_batch": i, "last_batch_loss": float(i),
+                            "train_loss_list": pickle_dump(loss[-100:])})
+                session.commit()
+                record("write", start)
+            except Exception as e:
+                session.rollback()
+                errors.append(e)
+            finally:
+                session.close()
+            i += 1
+
+    def reader():
+        while not stop.is_set():
+            start = time.perf_counter()
+            session = Session()
+            try:
+                [m.__dict__ for m in session.query(Model).filter(Model.task_id == 0)]
+                session.commit()
+                record("read", start)
+            except Exception as e:
+                session.rollback()
+                errors.append(e)
+            finally:
+                session.close()
+
+    threads = [threading.Thread(target=writer, args=(ids[i % len(ids)], )) for i in range(n_writer)]
+    threads += [threading.Thread(target=reader) for _ in range(n_reader)]
+    for th in threads:
+        th.start()
+    time.sleep(seconds)
+    stop.set()
+    for th in threads:
+        th.join()
+    return latency, errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--models', type=int, default=20)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    print("{:<8} {:>10} {:>14} {:>10} {:>14} {:>8}".format(
+        "Engine", "Writes/s", "Write p95[ms]", "Reads/s", "Read p95[ms]", "Errors"))
+    for tuned in [False, True]:
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            engine, Session, ids = prepare(os.path.join(tmp_dir, "bench.db"), tuned, args.models)
+            latency, errors = run(Session, ids, args.writers, args.readers, args.seconds)
+            engine.dispose()
+        finally:
+            shutil.rmtree(tmp_dir)
+
+        def p95(values):
+            return np.percentile(values, 95) * 1000 if values else float('nan')
+
+        print("{:<8} {:>10.1f} {:>14.2f} {:>10.1f} {:>14.2f} {:>8d}".format(
+            "tuned" if tuned else "default",
+            len(latency["write"]) / args.seconds, p95(latency["write"]),
+            len(latency["read"]) / args.seconds, p95(latency["read"]),
+            len(errors)))
+
+
+if __name__ == '__main__':
+    main()